@@ -1,5 +1,10 @@
 
-from doc import Document
+from backends import GitBackend, MemoryBackend, MakeBackend
+from doc import Document, DocumentPath
+from docpool import DocumentPool
+from registry import DocumentRegistry
+from repack import RepackScheduler
 from section import Section
 from stylesheet import Stylesheet
+from treestore import TreeDocument
 from errors import *
@@ -0,0 +1,250 @@
+'''
+Storage backends, which hold the repositories that documents are stored in.
+
+Documents, sections & the section index work on a repository object with
+the pygit2.Repository interface.  A backend decides where those repositories
+live:
+
+    git     Bare git repositories on disk (the default)
+    memory  Pure python repositories held in memory (see db.memoryrepo).
+            Nothing is persisted, so this is only useful for tests &
+            benchmarks that want to measure the app without disk I/O
+'''
+
+import os
+import shutil
+import fcntl
+import threading
+from contextlib import contextmanager
+from pygit2 import Repository, init_repository
+from .errors import RepoNotFound
+from .layout import ListDocuments, REPO_SUFFIX
+from .memoryrepo import MemoryRepository
+
+# The name of the lock file used to serialize document creation
+CREATE_LOCK_FILENAME = '.create.lock'
+
+
+@contextmanager
+def _FileLock( path ):
+    '''
+    Context manager that holds an exclusive lock on a file, for locking
+    between processes
+
+    Args:
+        path    The path to the lock file
+    '''
+    with open( path, 'a' ) as f:
+        fcntl.flock( f, fcntl.LOCK_EX )
+        try:
+            yield
+        finally:
+            fcntl.flock( f, fcntl.LOCK_UN )
+
+
+class GitBackend(object):
+    '''
+    Stores documents in bare git repositories on disk
+    '''
+
+    name = 'git'
+
+    def Create( self, path ):
+        '''
+        Creates a repository
+
+        Args:
+            path    The path of the repository
+        Returns:
+            The new repository
+        '''
+        return init_repository( path, True )
+
+    def Open( self, path ):
+        '''
+        Opens an existing repository
+
+        Args:
+            path    The path of the repository
+        Returns:
+            The repository
+        Throws:
+            RepoNotFound if the repository doesn't exist
+        '''
+        try:
+            return Repository( path )
+        except KeyError:
+            raise RepoNotFound()
+
+    def Exists( self, path ):
+        '''
+        Checks if a repository exists
+
+        Args:
+            path    The path of the repository
+        '''
+        return os.path.exists( path )
+
+    def List( self, rootPath ):
+        '''
+        Lists the repositories under a root path
+
+        Args:
+            rootPath    The root data path
+        Returns:
+            A dict mapping document name to repository path
+        '''
+        return ListDocuments( rootPath )
+
+    def CreateLock( self, rootPath ):
+        '''
+        Gets a context manager that serializes document creation under a
+        root path between processes
+
+        Args:
+            rootPath    The root data path
+        '''
+        if not os.path.isdir( rootPath ):
+            try:
+                os.makedirs( rootPath )
+            except OSError:
+                # Probably created by someone else in the meantime
+                pass
+        return _FileLock( os.path.join( rootPath, CREATE_LOCK_FILENAME ) )
+
+    def Destroy( self, rootPath ):
+        '''
+        Removes every repository under a root path
+
+        Args:
+            rootPath    The root data path
+        '''
+        shutil.rmtree( rootPath, ignore_errors=True )
+
+
+class MemoryBackend(object):
+    '''
+    Stores documents in memory.  Repositories only last as long as the
+    backend, and can't be shared between processes
+    '''
+
+    name = 'memory'
+
+    def __init__( self ):
+        # Maps path -> MemoryRepository
+        self._repos = {}
+        self._lock = threading.Lock()
+
+    def Create( self, path ):
+        '''
+        Creates a repository, replacing any existing one at path
+
+        Args:
+            path    The path of the repository
+        Returns:
+            The new repository
+        '''
+        repo = MemoryRepository( path )
+        with self._lock:
+            self._repos[ path ] = repo
+        return repo
+
+    def Open( self, path ):
+        '''
+        Opens an existing repository
+
+        Args:
+            path    The path of the repository
+        Returns:
+            The repository
+        Throws:
+            RepoNotFound if the repository doesn't exist
+        '''
+        try:
+            return self._repos[ path ]
+        except KeyError:
+            raise RepoNotFound()
+
+    def Exists( self, path ):
+        '''
+        Checks if a repository exists
+
+        Args:
+            path    The path of the repository
+        '''
+        return path in self._repos
+
+    def _Under( self, rootPath ):
+        '''
+        Gets the paths of the repositories under a root path
+        '''
+        prefix = os.path.join( rootPath, '' )
+        with self._lock:
+            return [ p for p in self._repos if p.startswith( prefix ) ]
+
+    def List( self, rootPath ):
+        '''
+        Lists the repositories under a root path
+
+        Args:
+            rootPath    The root data path
+        Returns:
+            A dict mapping document name to repository path
+        '''
+        return dict(
+                ( os.path.basename( path )[ :-len( REPO_SUFFIX ) ], path )
+                for path in self._Under( rootPath )
+                )
+
+    def CreateLock( self, rootPath ):
+        '''
+        Gets a context manager that serializes document creation.  Only one
+        process can see the repositories, so the registry's own lock is all
+        that's needed
+
+        Args:
+            rootPath    The root data path
+        '''
+        return _NoLock()
+
+    def Destroy( self, rootPath ):
+        '''
+        Removes every repository under a root path
+
+        Args:
+            rootPath    The root data path
+        '''
+        for path in self._Under( rootPath ):
+            with self._lock:
+                self._repos.pop( path, None )
+
+
+@contextmanager
+def _NoLock():
+    yield
+
+
+# The backends that can be selected by name
+BACKENDS = {
+        GitBackend.name: GitBackend,
+        MemoryBackend.name: MemoryBackend,
+        }
+
+DEFAULT_BACKEND = GitBackend.name
+
+
+def MakeBackend( name=DEFAULT_BACKEND ):
+    '''
+    Makes a storage backend
+
+    Args:
+        name    The name of the backend.  One of BACKENDS
+    Returns:
+        The backend
+    Throws:
+        ValueError if there's no such backend
+    '''
+    try:
+        return BACKENDS[ name ]()
+    except KeyError:
+        raise ValueError( 'Unknown storage backend: {0}'.format( name ) )
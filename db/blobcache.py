@@ -0,0 +1,48 @@
+'''
+Process wide cache of blob contents.
+
+Blobs are content addressed, so the data for an oid never changes and can be
+cached for as long as there's memory for it.  This saves going through the
+object database (and inflating the object) every time some content is read.
+'''
+
+from .lrucache import LRUCache
+
+# The maximum number of bytes of blob data to keep in memory
+BLOB_CACHE_BYTES = 32 * 1024 * 1024
+
+_blobCache = LRUCache(None, maxWeight=BLOB_CACHE_BYTES, weigh=len)
+
+
+def ReadBlob( repo, oid ):
+    '''
+    Reads the data of a blob, via the cache
+
+    Args:
+        repo    The repository containing the blob
+        oid     The oid of the blob
+    Returns:
+        The blob data
+    '''
+    data = _blobCache.Get( oid )
+    if data is None:
+        data = repo[ oid ].data
+        _blobCache.Put( oid, data )
+    return data
+
+
+def BlobCacheStats():
+    '''
+    Gets statistics for the blob cache, including the hit ratio
+
+    Returns:
+        A dict of statistics
+    '''
+    return _blobCache.Stats()
+
+
+def ClearBlobCache():
+    '''
+    Empties the blob cache
+    '''
+    _blobCache.Clear()
@@ -10,3 +10,12 @@ STYLESHEET_REF_PREFIX = 'refs/heads/'
 
 # The name of the section index file
 SECTION_INDEX_FILENAME = 'sectionIndex'
+
+# The branch used by the single tree storage engine
+DOCUMENT_REF = 'refs/heads/document'
+
+# The directory holding the sections in a single tree document
+SECTIONS_DIRNAME = 'sections'
+
+# The name of the stylesheet file in a single tree document
+STYLESHEET_FILENAME = 'stylesheet'
@@ -1,5 +1,37 @@
+import re
+import time
 import gitutils
-from .errors import ContentNotFound
+from itertools import islice
+from .errors import ContentNotFound, RefConflict
+from .blobcache import ReadBlob
+
+# The number of characters of preview stored with each revision
+PREVIEW_LENGTH = 100
+
+_whitespaceRegExp = re.compile( r'\s+' )
+
+
+def _MakePreview( content ):
+    '''
+    Makes a single line preview of some content
+
+    Args:
+        content     The content to preview
+    Returns:
+        The preview
+    '''
+    if isinstance( content, str ):
+        content = content.decode( 'utf-8', 'replace' )
+    return _whitespaceRegExp.sub( ' ', content ).strip()[ :PREVIEW_LENGTH ]
+
+
+def _ContentSize( content ):
+    '''
+    Gets the size of some content in bytes, as it'll be stored in a blob
+    '''
+    if isinstance( content, unicode ):
+        content = content.encode( 'utf-8' )
+    return len( content )
 
 
 class Content(object):
@@ -13,10 +45,16 @@ class Content(object):
         AutoCreate          If true, the section will always be created if it
                             does not already exist.
         DefaultContent      The default content that will be used when creating
+
+    Instance Variables:
+        unit                The UnitOfWork the content was loaded through,
+                            if any.  Changes are collected by the unit rather
+                            than written straight away
     '''
     ContentRefPrefix = None
     AutoCreate = False
     DefaultContent = ''
+    unit = None
 
     def __init__(self, name, repo, create=False):
         '''
@@ -30,6 +68,8 @@ class Content(object):
         '''
         self.name = name
         self.repo = repo
+        # The path of the content within the tree of each commit
+        self.path = name
         self._create = create or self.AutoCreate
         self._headCommit = None
         self._refName = self.ContentRefPrefix + name
@@ -44,10 +84,24 @@ class Content(object):
             except KeyError:
                 if not self._create:
                     raise ContentNotFound()
-                ref = self.Create()
+                try:
+                    ref = self.Create()
+                except RefConflict:
+                    # Someone else created it first
+                    ref = self.repo.lookup_reference( self._refName )
             self._headCommit = self.repo[ ref.oid ]
         return self._headCommit
 
+    def Exists( self ):
+        '''
+        Checks if the content has been created
+        '''
+        try:
+            self.repo.lookup_reference( self._refName )
+        except KeyError:
+            return False
+        return True
+
     def Create( self, content=None ):
         '''
         Creates an initial commit for this content, and sets up a ref (branch)
@@ -57,52 +111,303 @@ class Content(object):
 
         Returns:
             The created reference
+        Throws:
+            RefConflict if the content already exists
         '''
+        content = content or self.DefaultContent
         commitId = gitutils.CommitBlob(
-                self.repo, content or self.DefaultContent, self.name,
-                'Create content "{0}"'.format( self.name )
+                self.repo, content, self.name,
+                self._CommitMessage(
+                    'Create content "{0}"'.format( self.name ), content
+                    )
                 )
-        return self.repo.create_reference( self._refName, commitId )
+        return gitutils.UpdateRef( self.repo, self._refName, commitId, None )
+
+    @staticmethod
+    def _CommitMessage( summary, content, extraMetadata=None ):
+        '''
+        Builds the message for a commit of some content.
+        The size & a preview of the content are stored in the message, so
+        the history can be summarised without reading the content
+
+        Args:
+            summary         The summary line of the message
+            content         The content being committed
+            extraMetadata   An optional dict of other metadata to store
+        '''
+        metadata = dict( extraMetadata or {} )
+        metadata[ 'Size' ] = _ContentSize( content )
+        metadata[ 'Preview' ] = _MakePreview( content )
+        return gitutils.FormatMessage( summary, metadata )
 
     def CurrentContent( self ):
         '''
         Returns the current content
         '''
-        oid = self._GetHeadCommit().tree[ 0 ].oid
-        blob = self.repo[ oid ]
-        return blob.data
+        if self.unit is not None and self.unit.HasChange( self ):
+            return self.unit.PendingContent( self )
+        return ReadBlob( self.repo, self._BlobOid( self._GetHeadCommit() ) )
 
-    def ContentHistory( self ):
+    def CurrentBlobId( self ):
         '''
-        Generator function that returns the history of the content
+        Gets the hex id of the blob holding the current content, without
+        reading the content.  The id changes whenever the content does, so
+        it can be used as a cache key.  Uncommitted changes in a unit of
+        work are ignored
+        '''
+        return gitutils.OidHex( self._BlobOid( self._GetHeadCommit() ) )
+
+    def _BlobOid( self, commit ):
+        '''
+        Gets the oid of the blob holding the content in a commit
+
+        Args:
+            commit  The commit
+        '''
+        return commit.tree[ 0 ].oid
+
+    def _WalkHistory( self, start=None ):
+        '''
+        Generator function that returns the commits in the history of the
+        content, newest first.  Commits are only read as they're needed, so
+        stopping early saves walking the entire history.
 
         This niavely assumes there's only one parent commit
         on each commit, which will do for now.
+
+        Args:
+            start   The commit to start from.  Defaults to the head commit
         '''
-        current = self._GetHeadCommit()
+        current = start or self._GetHeadCommit()
         while True:
-            oid = current.tree[ 0 ].oid
-            yield self.repo[ oid ].data
+            yield current
             if current.parents:
                 # current has at least one parent
                 current = current.parents[ 0 ]
             else:
                 break
 
-    def SetContent( self, newContent ):
+    def _LookupRevision( self, oid ):
+        '''
+        Looks up a commit in the history of this content
+
+        Args:
+            oid     The hex oid of the commit
+        Returns:
+            The commit object
+        Throws:
+            ContentNotFound if the commit isn't a revision of this content
+        '''
+        try:
+            commit = self.repo[ oid ]
+            if self.path not in commit.tree:
+                raise ContentNotFound()
+        except ( KeyError, ValueError, AttributeError, TypeError ):
+            raise ContentNotFound()
+        return commit
+
+    def ContentHistory( self ):
+        '''
+        Generator function that returns the history of the content
+        '''
+        for commit in self._WalkHistory():
+            yield ReadBlob( self.repo, self._BlobOid( commit ) )
+
+    def Revisions( self ):
         '''
-        Adds a new version of the content
+        Generator function that returns the history of the content,
+        along with the oid of each revision
+
+        Returns:
+            An iterator of ( oid, content ) tuples, newest first
+        '''
+        for commit in self._WalkHistory():
+            yield commit.hex, ReadBlob( self.repo, self._BlobOid( commit ) )
+
+    def HistoryPage( self, limit, cursor=None ):
+        '''
+        Gets a page of the history of the content, newest first
+
+        Args:
+            limit   The maximum number of entries to return
+            cursor  The oid of the last entry of the previous page, or None
+                    to start from the current content
+        Returns:
+            A tuple ( entries, nextCursor ).  entries is a list of
+            ( oid, content ) tuples, and nextCursor is the cursor for the
+            next page, or None if this is the last page
+        Throws:
+            ContentNotFound if cursor isn't a revision of this content
+        '''
+        commits, nextCursor = self._HistoryCommits( limit, cursor )
+        entries = [
+                ( c.hex, ReadBlob( self.repo, self._BlobOid( c ) ) )
+                for c in commits
+                ]
+        return entries, nextCursor
+
+    def HistorySummary( self, limit, cursor=None, previewLength=None ):
+        '''
+        Gets a page of summaries of the history of the content, newest first.
+
+        Summaries are built from the commits only, without reading the
+        content, apart from for revisions committed before the metadata was
+        recorded.
 
         Args:
-            newContent  The new content of the content
-        '''
-        newId = gitutils.CommitBlob(
-                self.repo,
-                newContent,
-                self.name,
-                'Updating content',
-                [ self._GetHeadCommit() ],
-                self._refName
+            limit           The maximum number of entries to return
+            cursor          The oid of the last entry of the previous page,
+                            or None to start from the current content
+            previewLength   If set, the entries will include a preview of
+                            up to this many (max PREVIEW_LENGTH) characters
+        Returns:
+            A tuple ( entries, nextCursor ).  entries is a list of dicts
+            with id, time & size (and optionally preview) keys.
+        Throws:
+            ContentNotFound if cursor isn't a revision of this content
+        '''
+        commits, nextCursor = self._HistoryCommits( limit, cursor )
+        entries = []
+        for commit in commits:
+            metadata = gitutils.ParseMetadata( commit.message )
+            try:
+                size = int( metadata[ 'Size' ] )
+                preview = metadata[ 'Preview' ]
+            except ( KeyError, ValueError ):
+                data = ReadBlob( self.repo, self._BlobOid( commit ) )
+                size = len( data )
+                preview = _MakePreview( data )
+            entry = {
+                    'id': commit.hex,
+                    'time': commit.commit_time,
+                    'size': size,
+                    }
+            if previewLength:
+                entry[ 'preview' ] = preview[ :previewLength ]
+            entries.append( entry )
+        return entries, nextCursor
+
+    def _HistoryCommits( self, limit, cursor ):
+        '''
+        Gets a page of the commits in the history of the content
+
+        Args:
+            limit   The maximum number of commits to return
+            cursor  The oid of the last commit of the previous page, or None
+        Returns:
+            A tuple ( commits, nextCursor )
+        '''
+        if cursor:
+            after = self._LookupRevision( cursor )
+            if not after.parents:
+                return [], None
+            walker = self._WalkHistory( after.parents[ 0 ] )
+        else:
+            walker = self._WalkHistory()
+        commits = list( islice( walker, limit + 1 ) )
+        if len( commits ) > limit:
+            return commits[ :limit ], commits[ limit - 1 ].hex
+        return commits, None
+
+    def RestoreRevision( self, oid ):
+        '''
+        Makes a previous revision the current content, by adding a new
+        revision with the same content.
+
+        The revision is looked up directly, rather than by walking the
+        history, and only the commit graph is used to check it's an ancestor
+        of the current head.
+
+        Args:
+            oid     The hex oid of the revision to restore
+        Throws:
+            ContentNotFound if the revision isn't in this contents history
+        '''
+        head = self._GetHeadCommit()
+        commit = self._LookupRevision( oid )
+        if commit.oid == head.oid:
+            # Already the current revision
+            return
+        if not self.repo.descendant_of( head.oid, commit.oid ):
+            raise ContentNotFound()
+        self.SetContent( ReadBlob( self.repo, self._BlobOid( commit ) ) )
+
+    def _CanCoalesce( self, head, session, window ):
+        '''
+        Checks if a new revision can replace the head revision, rather than
+        going on top of it.  That's the case if the head was written by the
+        same session less than window seconds ago, and isn't the first
+        revision.
+
+        Args:
+            head        The head commit
+            session     The id of the session writing the new revision
+            window      The coalescing window in seconds
+        '''
+        if not session or not window or not head.parents:
+            return False
+        if time.time() - head.commit_time >= window:
+            return False
+        metadata = gitutils.ParseMetadata( head.message )
+        return metadata.get( 'Session' ) == session and \
+                metadata.get( 'Path', self.path ) == self.path
+
+    def SetContent( self, newContent, session=None, coalesceWindow=0 ):
+        '''
+        Adds a new version of the content.
+
+        Rapid edits can be coalesced: if session is passed, and the current
+        revision was written by the same session less than coalesceWindow
+        seconds ago, the new revision replaces the current one.
+
+        If the content was loaded through a UnitOfWork, the new version is
+        only written when the unit is committed.
+
+        Args:
+            newContent      The new content of the content
+            session         Optional id of the session making the change
+            coalesceWindow  The coalescing window in seconds
+        Throws:
+            RefConflict if the content was changed by someone else since the
+            current revision was read
+        '''
+        if self.unit is not None:
+            self.unit.SetContent( self, newContent, session, coalesceWindow )
+        else:
+            self._WriteContent( newContent, session, coalesceWindow )
+
+    def _WriteContent( self, newContent, session, coalesceWindow ):
+        '''
+        Writes a new version of the content.  See SetContent
+        '''
+        head = self._GetHeadCommit()
+        metadata = { 'Session': session } if session else {}
+        message = self._CommitMessage(
+                'Updating content', newContent, metadata
                 )
+        try:
+            if self._CanCoalesce( head, session, coalesceWindow ):
+                # Amend the head revision, and move the branch to the new
+                # commit
+                newId = gitutils.CommitBlob(
+                        self.repo, newContent, self.name, message,
+                        head.parents
+                        )
+                gitutils.UpdateRef(
+                        self.repo, self._refName, newId, head.oid
+                        )
+            else:
+                newId = gitutils.CommitBlob(
+                        self.repo,
+                        newContent,
+                        self.name,
+                        message,
+                        [ head ],
+                        self._refName
+                        )
+        except RefConflict:
+            # Our head is out of date, so it'll need reading again
+            self._headCommit = None
+            raise
         self._headCommit = self.repo[ newId ]
 
@@ -0,0 +1,203 @@
+'''
+Converts documents from one branch per section to the single tree storage
+engine described in db.treestore.
+
+The history of every section, the stylesheet and the section index is
+replayed onto the document branch in commit time order, keeping the original
+messages, authors & times, so each piece of content keeps its history.  The
+old branches are left in place, but aren't used once the document branch
+exists.
+
+Conversion must be run with the servers stopped.  A running server keeps
+documents open in its pool, and would carry on writing edits to the old
+branches, where they'd be lost.  As a safety net, a document isn't switched
+to the document branch if any of its old branches moved while it was being
+converted.
+
+    python -m db.convert <DATA_PATH> [<document name>...]
+'''
+
+import heapq
+import argparse
+from pygit2 import Repository
+from .gitutils import CommitTree, RefLock, WriteTree
+from .errors import RefConflict
+from .constants import MASTER_REF, SECTION_REF_PREFIX, STYLESHEET_REF_PREFIX
+from .constants import DOCUMENT_REF, SECTION_INDEX_FILENAME
+from .constants import STYLESHEET_FILENAME
+from .layout import ListDocuments
+from .treestore import IsTreeDocument, SectionPath
+
+
+def _History( repo, headOid ):
+    '''
+    Gets the commits on a branch, oldest first
+
+    Args:
+        repo        The repository
+        headOid     The oid of the head of the branch
+    Returns:
+        A list of commits
+    '''
+    commit = repo[ headOid ]
+    history = [ commit ]
+    while commit.parents:
+        commit = commit.parents[ 0 ]
+        history.append( commit )
+    history.reverse()
+    return history
+
+
+def _ContentBranches( repo ):
+    '''
+    Gets the branches that need converting
+
+    Args:
+        repo    The repository
+    Returns:
+        A dict mapping path in the document tree -> branch name
+    '''
+    branches = { SECTION_INDEX_FILENAME: MASTER_REF }
+    stylesheetRef = STYLESHEET_REF_PREFIX + STYLESHEET_FILENAME
+    for refName in repo.listall_references():
+        if refName.startswith( SECTION_REF_PREFIX ):
+            name = refName[ len( SECTION_REF_PREFIX ): ]
+            branches[ SectionPath( name ) ] = refName
+        elif refName == stylesheetRef:
+            branches[ STYLESHEET_FILENAME ] = refName
+    return branches
+
+
+def _BranchHeads( repo ):
+    '''
+    Gets the heads of the branches that need converting
+
+    Args:
+        repo    The repository
+    Returns:
+        A dict mapping branch name -> the oid of its head
+    '''
+    return dict(
+            ( refName, repo.lookup_reference( refName ).oid )
+            for refName in _ContentBranches( repo ).itervalues()
+            )
+
+
+def MergeHistories( histories ):
+    '''
+    Merges the histories of several branches into a single timeline, ordered
+    by commit time.  The order within each history is always kept, even if
+    the commit times go backwards.
+
+    Args:
+        histories   A dict mapping path -> list of commits, oldest first
+    Returns:
+        An iterator of ( path, commit ) tuples
+    '''
+    heap = [
+            ( history[ 0 ].commit_time, path, 0 )
+            for path, history in histories.iteritems()
+            if history
+            ]
+    heapq.heapify( heap )
+    while heap:
+        commitTime, path, position = heapq.heappop( heap )
+        history = histories[ path ]
+        yield path, history[ position ]
+        position += 1
+        if position < len( history ):
+            heapq.heappush(
+                    heap, ( history[ position ].commit_time, path, position )
+                    )
+
+
+def ConvertRepository( repo ):
+    '''
+    Converts a repository to the single tree storage engine
+
+    Args:
+        repo    The repository to convert
+    Returns:
+        True if the repository was converted, False if it already had been
+    Throws:
+        RefConflict if the document was changed while it was being
+        converted, in which case it's left as it was
+    '''
+    if IsTreeDocument( repo ):
+        return False
+    heads = _BranchHeads( repo )
+    # Everything is read from the heads we started with, so any later
+    # change is caught before switching over
+    histories = dict(
+            ( path, _History( repo, heads[ refName ] ) )
+            for path, refName in _ContentBranches( repo ).iteritems()
+            )
+    tree = None
+    parents = []
+    for path, commit in MergeHistories( histories ):
+        blobOid = commit.tree[ 0 ].oid
+        treeOid = WriteTree( repo, tree, { path: blobOid } )
+        commitId = repo.create_commit(
+                None,
+                commit.author,
+                commit.committer,
+                commit.message,
+                treeOid,
+                [ p.oid for p in parents ]
+                )
+        tree = repo[ treeOid ]
+        parents = [ repo[ commitId ] ]
+    if STYLESHEET_FILENAME not in histories:
+        # The stylesheet is created on first use by the old engine, but the
+        # single tree engine always has one
+        commitId = CommitTree(
+                repo, { STYLESHEET_FILENAME: '' },
+                'Create content "stylesheet"', parents
+                )
+        parents = [ repo[ commitId ] ]
+    with RefLock( repo ):
+        if IsTreeDocument( repo ) or _BranchHeads( repo ) != heads:
+            raise RefConflict( DOCUMENT_REF )
+        repo.create_reference( DOCUMENT_REF, parents[ 0 ].oid )
+    return True
+
+
+def ConvertDocuments( rootPath, names=None ):
+    '''
+    Converts documents to the single tree storage engine
+
+    Args:
+        rootPath    The root data path
+        names       The names of the documents to convert.  Defaults to all
+                    the documents under rootPath
+    Returns:
+        The number of documents converted
+    '''
+    documents = ListDocuments( rootPath )
+    if names:
+        documents = dict( ( name, documents[ name ] ) for name in names )
+    converted = 0
+    for name, path in sorted( documents.iteritems() ):
+        if ConvertRepository( Repository( path ) ):
+            converted += 1
+    return converted
+
+
+def Main( args=None ):
+    parser = argparse.ArgumentParser(
+            description='Converts documents to the single tree storage '
+                        'engine.  Stop the servers first: edits they make '
+                        'during or after the conversion are lost'
+            )
+    parser.add_argument( 'dataPath', help='The DATA_PATH to convert' )
+    parser.add_argument(
+            'names', nargs='*',
+            help='The documents to convert.  Defaults to all of them'
+            )
+    options = parser.parse_args( args )
+    converted = ConvertDocuments( options.dataPath, options.names )
+    print "Converted {0} documents".format( converted )
+
+
+if __name__ == '__main__':
+    Main()
@@ -1,24 +1,41 @@
 
-import os
-from pygit2 import Repository, init_repository
-from gitutils import CommitBlob
+import hashlib
+from gitutils import CommitBlob, OidHex
 from .section import Section
 from .stylesheet import Stylesheet
 from .sectionindex import SectionIndex
+from .unitofwork import UnitOfWork
 from .constants import MASTER_REF, SECTION_REF_PREFIX
-from .constants import SECTION_INDEX_FILENAME
-from .errors import RepoNotFound
+from .constants import SECTION_INDEX_FILENAME, STYLESHEET_REF_PREFIX
+from .errors import RefConflict
+from .backends import GitBackend
+from .layout import ResolvePath
 
 DEFAULT_ROOT_PATH = 'data'
 
 
+def DocumentPath( name, rootPath=None ):
+    '''
+    Gets the path to the repository for a document
+
+    Args:
+        name        The name of the document
+        rootPath    The rootPath to use (if not supplied, uses default)
+    Returns:
+        The path to the repository
+    '''
+    if not rootPath:
+        rootPath = DEFAULT_ROOT_PATH
+    return ResolvePath( rootPath, name )
+
+
 class Document(object):
     '''
     Class representing a document, interacts with the git
     database
     '''
 
-    def __init__( self, name, create=False, rootPath=None ):
+    def __init__( self, name, create=False, rootPath=None, backend=None ):
         '''
         Constructor
 
@@ -26,32 +43,29 @@ class Document(object):
             name        The name of the document
             create      If true, will create a document
             rootPath    The rootPath to use (if not supplied, uses default)
+            backend     The storage backend the document is kept in (if not
+                        supplied, uses a GitBackend)
         Exceptions:
             RepoNotFound if repository isn't found
         '''
-        if not rootPath:
-            rootPath = DEFAULT_ROOT_PATH
-        targetDir = os.path.join( rootPath, name + '.git' )
+        backend = backend or GitBackend()
+        targetDir = DocumentPath( name, rootPath )
         if create:
-            # Create a bare repository
-            self.repo = init_repository( targetDir, True )
+            self.repo = backend.Create( targetDir )
             self._CreateMasterBranch()
             self._CreateStylesheet()
         else:
-            try:
-                self.repo = Repository( targetDir )
-            except KeyError:
-                raise RepoNotFound()
+            self.repo = backend.Open( targetDir )
 
     def _CreateMasterBranch( self ):
         '''
         Creates the master branch on the repo w/ default file.
         For now this is just a file named layout
         '''
-        commitId = CommitBlob(
-                self.repo, '', SECTION_INDEX_FILENAME, 'Initial commit'
+        CommitBlob(
+                self.repo, '', SECTION_INDEX_FILENAME, 'Initial commit',
+                [], MASTER_REF
                 )
-        self.repo.create_reference( MASTER_REF, commitId )
 
     def _CreateStylesheet( self ):
         # TODO: Create the stylesheet (probably via the stylesheet class)
@@ -140,14 +154,40 @@ class Document(object):
         Returns:
             The new Section object
         '''
-        # TODO: Should probably make sure no such section exists somewhere
-        #       I'm thinking that'd be the job of the section class?
-        section = Section(name, self.repo, create=True)
-        section.Create(content=content)
+        return self.AddSections( [ ( name, content ) ] )[ 0 ]
+
+    def AddSections( self, sections ):
+        '''
+        Creates several new sections, with a single index commit.
+        The sections are added to the end of the document in order
+
+        Args:
+            sections    A list of ( name, content ) tuples
+
+        Returns:
+            A list of the new Section objects
+        Throws:
+            ValueError if a name is repeated
+            RefConflict if a section with one of the names already exists
+        '''
+        names = [ name for name, content in sections ]
+        if len( set( names ) ) != len( names ):
+            raise ValueError( 'Section names must be unique' )
         index = SectionIndex(self.repo)
-        index.AddSection( name )
+        created = []
+        for name in names:
+            section = Section(name, self.repo, create=True)
+            # Check them all before creating any, so a conflict doesn't
+            # leave some sections created but not in the index
+            if index.HasSection( name ) or section.Exists():
+                raise RefConflict( SECTION_REF_PREFIX + name )
+            created.append( section )
+        for section, ( name, content ) in zip( created, sections ):
+            section.Create(content=content)
+        for name in names:
+            index.AddSection( name )
         index.Save( self.repo )
-        return section
+        return created
 
     def RemoveSection( self, name ):
         '''
@@ -158,10 +198,36 @@ class Document(object):
         Args:
             name    The name of the section to remove
         '''
+        self.RemoveSections( [ name ] )
+
+    def RemoveSections( self, names ):
+        '''
+        Removes several sections, with a single index commit.
+        As with RemoveSection, the section data is not deleted.
+
+        Args:
+            names   The names of the sections to remove
+        '''
         index = SectionIndex( self.repo )
-        index.RemoveSection( name )
+        for name in names:
+            index.RemoveSection( name )
         index.Save( self.repo )
 
+    def ReorderSections( self, namesInOrder ):
+        '''
+        Puts all the sections into a new order, with a single index commit
+
+        Args:
+            namesInOrder    The names of all the current sections, in their
+                            new order
+        Throws:
+            ValueError if namesInOrder isn't a reordering of the current
+            sections
+        '''
+        index = SectionIndex( self.repo )
+        if index.Reorder( namesInOrder ):
+            index.Save( self.repo )
+
     def GetStylesheet(self):
         '''
         Gets the stylesheet object for this document
@@ -170,3 +236,40 @@ class Document(object):
             A stylesheet object
         '''
         return Stylesheet( 'stylesheet', self.repo )
+
+    def UnitOfWork( self ):
+        '''
+        Starts a unit of work on the document, which reads the section index
+        once and writes all its changes at the end
+
+        Returns:
+            A UnitOfWork
+        '''
+        return UnitOfWork( self )
+
+    def Fingerprint( self ):
+        '''
+        Gets a fingerprint of the current state of the document, which
+        changes whenever the section index, a current section or the
+        stylesheet do.  Only refs are looked up, no content is read
+
+        Returns:
+            The fingerprint, as a hex string
+        '''
+        refNames = [ MASTER_REF ]
+        refNames.extend(
+                SECTION_REF_PREFIX + s.name
+                for s in SectionIndex( self.repo ).CurrentSections()
+                )
+        refNames.append( STYLESHEET_REF_PREFIX + 'stylesheet' )
+        digest = hashlib.sha1()
+        for refName in refNames:
+            try:
+                oid = OidHex( self.repo.lookup_reference( refName ).oid )
+            except KeyError:
+                # The stylesheet isn't created until it's first used
+                oid = ''
+            digest.update( u'{0} {1}\n'.format( refName, oid ).encode(
+                'utf-8'
+                ) )
+        return digest.hexdigest()
@@ -0,0 +1,83 @@
+'''
+Contains the DocumentPool, which keeps recently used documents open
+'''
+
+from .lrucache import LRUCache
+
+# The default number of documents to keep open
+DEFAULT_POOL_SIZE = 64
+
+# The default number of seconds a document can go unused before it's closed
+DEFAULT_IDLE_TIMEOUT = 300
+
+
+class DocumentPool(object):
+    '''
+    A process wide pool of open Document objects.
+
+    Opening a document means opening the git repository on disk, so keeping
+    the documents of active users open saves doing that on every request.
+
+    Documents are keyed by their repository path, and are evicted when they
+    haven't been used for idleTimeout seconds, or when there are more than
+    maxSize documents open.
+    '''
+
+    def __init__(
+            self, maxSize=DEFAULT_POOL_SIZE, idleTimeout=DEFAULT_IDLE_TIMEOUT
+            ):
+        '''
+        Constructor
+
+        Args:
+            maxSize         The maximum number of documents to keep open
+            idleTimeout     The number of seconds a document can go unused
+                            before it is evicted
+        '''
+        self._cache = LRUCache(maxSize, idleTimeout)
+
+    def Get(self, path, opener):
+        '''
+        Gets a document from the pool, opening it if required
+
+        The opener is called without any locks held, so two threads may end
+        up opening the same document at once.  In that case only the first
+        document to be added is kept.
+
+        Args:
+            path    The path to the document repository
+            opener  A function that opens & returns the document
+        Returns:
+            The document
+        '''
+        doc = self._cache.Get(path)
+        if doc is None:
+            doc = self._cache.SetDefault(path, opener())
+        return doc
+
+    def Discard(self, path):
+        '''
+        Removes a document from the pool
+
+        Args:
+            path    The path to the document repository
+        '''
+        self._cache.Discard(path)
+
+    def Clear(self):
+        '''
+        Removes all documents from the pool
+        '''
+        self._cache.Clear()
+
+    def Stats(self):
+        '''
+        Gets hit/miss statistics for the pool
+
+        Returns:
+            A dict of statistics
+        '''
+        return self._cache.Stats()
+
+    def __len__(self):
+        return len(self._cache)
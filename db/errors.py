@@ -17,3 +17,7 @@ class MasterNotFound(Exception):
 
 class BrokenMaster(Exception):
     pass
+
+
+class RefConflict(Exception):
+    pass
@@ -2,57 +2,282 @@
 File containing utilities for git repositories
 '''
 
+import os
 import time
+import fcntl
+import binascii
 import pygit2
+from contextlib import contextmanager
+from .errors import RefConflict
 
-def CommitBlob(
+# The name of the file locked while updating refs.  This is separate from
+# the .lock files git & libgit2 use for individual refs, as those are only
+# held while writing the ref, not while we check its current value
+REF_LOCK_FILENAME = 'resumr-refs.lock'
+
+
+def FormatMessage( summary, metadata ):
+    '''
+    Formats a commit message, with some metadata stored as "Key: value"
+    trailer lines after the summary
+
+    Args:
+        summary     The summary line of the message
+        metadata    A dict of metadata
+    Returns:
+        The commit message
+    '''
+    lines = [ summary, '' ]
+    lines.extend(
+            u'{0}: {1}'.format( key, metadata[ key ] )
+            for key in sorted( metadata )
+            )
+    return '\n'.join( lines )
+
+
+def ParseMetadata( message ):
+    '''
+    Parses the metadata trailers from a commit message written by
+    FormatMessage
+
+    Args:
+        message     The commit message
+    Returns:
+        A dict of metadata.  Empty if the message has no metadata
+    '''
+    metadata = {}
+    summary, _, trailers = message.partition( '\n\n' )
+    for line in trailers.splitlines():
+        key, sep, value = line.partition( ': ' )
+        if sep:
+            metadata[ key ] = value
+    return metadata
+
+
+def DefaultSignature():
+    '''
+    Gets the signature used for commits, timestamped now
+    '''
+    return pygit2.Signature(
+            'Mr Name',
+            'name@domain.com',
+            time.time(), 0
+            )
+
+
+def OidHex( oid ):
+    '''
+    Gets the hex form of an oid.  Depending on the repository, oids are
+    either Oid objects, raw 20 byte strings or already in hex
+
+    Args:
+        oid     The oid
+    Returns:
+        The oid as a 40 character hex string
+    '''
+    hexOid = getattr( oid, 'hex', None )
+    if hexOid is not None:
+        return hexOid
+    if len( oid ) == 20:
+        return binascii.hexlify( oid )
+    return oid
+
+
+@contextmanager
+def RefLock( repo ):
+    '''
+    Context manager that holds an exclusive lock on the refs of a repository,
+    so they can be checked & updated without another process or thread
+    getting in between
+
+    Args:
+        repo    The repository to lock
+    '''
+    refLock = getattr( repo, 'refLock', None )
+    if refLock is not None:
+        # Repositories held in memory lock with a thread lock instead
+        with refLock:
+            yield
+        return
+    with open( os.path.join( repo.path, REF_LOCK_FILENAME ), 'a' ) as f:
+        fcntl.flock( f, fcntl.LOCK_EX )
+        try:
+            yield
+        finally:
+            fcntl.flock( f, fcntl.LOCK_UN )
+
+
+def _CurrentOid( repo, refName ):
+    '''
+    Gets the oid a ref points at, or None if it doesn't exist
+    '''
+    try:
+        return repo.lookup_reference( refName ).oid
+    except KeyError:
+        return None
+
+
+def UpdateRef( repo, refName, newOid, expectedOid ):
+    '''
+    Compare and swap for refs.  Points a ref at a new commit, but only if it
+    still points at the commit the change was based on
+
+    Args:
+        repo            The repository
+        refName         The name of the ref to update
+        newOid          The oid to point the ref at
+        expectedOid     The oid the ref should currently point at, or None if
+                        the ref shouldn't exist yet
+    Returns:
+        The updated reference
+    Throws:
+        RefConflict if the ref has been changed by someone else
+    '''
+    with RefLock( repo ):
+        if _CurrentOid( repo, refName ) != expectedOid:
+            raise RefConflict( refName )
+        return repo.create_reference( refName, newOid, True )
+
+
+def DeleteRef( repo, refName, expectedOid ):
+    '''
+    Deletes a ref, but only if it still points at the expected commit
+
+    Args:
+        repo            The repository
+        refName         The name of the ref to delete
+        expectedOid     The oid the ref should currently point at
+    Throws:
+        RefConflict if the ref has been changed by someone else
+    '''
+    with RefLock( repo ):
+        if _CurrentOid( repo, refName ) != expectedOid:
+            raise RefConflict( refName )
+        repo.lookup_reference( refName ).delete()
+
+
+def WriteTree( repo, base, blobs ):
+    '''
+    Writes a tree, with some files changed.  Anything that isn't changed is
+    reused from the base tree, so only the subtrees along the changed paths
+    are written
+
+    Args:
+        repo    The repository to write to
+        base    The tree to start from, or None for an empty tree
+        blobs   A dict mapping path -> blob oid.  Paths are / separated
+    Returns:
+        The oid of the new tree
+    Throws:
+        ValueError if a path is invalid
+    '''
+    files = {}
+    subtrees = {}
+    for path, oid in blobs.iteritems():
+        name, sep, rest = path.partition( '/' )
+        if not name or ( sep and not rest ):
+            raise ValueError( 'Invalid path: ' + path )
+        if sep:
+            subtrees.setdefault( name, {} )[ rest ] = oid
+        else:
+            files[ name ] = oid
+
+    if base is not None:
+        builder = repo.TreeBuilder( base )
+    else:
+        builder = repo.TreeBuilder()
+    for name, oid in files.iteritems():
+        builder.insert( name, oid, pygit2.GIT_FILEMODE_BLOB )
+    for name, subtreeBlobs in subtrees.iteritems():
+        subtreeBase = None
+        if base is not None and name in base:
+            subtreeBase = repo[ base[ name ].oid ]
+        builder.insert(
+                name,
+                WriteTree( repo, subtreeBase, subtreeBlobs ),
+                pygit2.GIT_FILEMODE_TREE
+                )
+    return builder.write()
+
+
+def CommitTree(
         repo,
-        content,
-        name,
+        files,
         commitMessage,
         parentCommits = [],
         updateRef = None
         ):
     '''
-    Creates a commit containing a single blob
+    Creates a commit that changes any number of files.  The tree of the
+    first parent is used as the base, and anything not in files is kept
 
     Args:
         repo            Repository to act on
-        content         The content to commit
-        name            The name of the blob
+        files           A dict mapping path -> new content.  Paths are /
+                        separated
         commitMessage   The message to use for the commit
         parentCommits   Parent commit objects
-        updateRef       Reference to update
+        updateRef       Reference to update.  The ref must currently point
+                        at the first parent, or not exist if there are no
+                        parents
 
     Returns:
         oid of the new commit
+    Throws:
+        RefConflict if updateRef has been changed by someone else
     '''
-    
-    # Need to create an empty blob,
-    # Then a tree/commit/both pointing at it
-    # Then add a reference repo.create_reference( 'name', oid )
-    # Then wrap the reference in a section and return
-
-    signature = pygit2.Signature(
-            'Mr Name',
-            'name@domain.com',
-            time.time(), 0
+    blobs = dict(
+            ( path, repo.create_blob( content ) )
+            for path, content in files.iteritems()
             )
+    base = parentCommits[ 0 ].tree if parentCommits else None
+    treeOid = WriteTree( repo, base, blobs )
 
-    blob = repo.create_blob( content )
-    if parentCommits:
-        builder = repo.TreeBuilder( parentCommits[ 0 ].tree )
-    else:
-        builder = repo.TreeBuilder()
-    builder.insert( name, blob, 0 )
-    treeOid = builder.write()
-
+    signature = DefaultSignature()
     commitId = repo.create_commit(
-            updateRef,
+            None,
             signature,
             signature,
             commitMessage,
             treeOid,
             [ c.oid for c in parentCommits ]
             )
+    if updateRef:
+        UpdateRef(
+                repo,
+                updateRef,
+                commitId,
+                parentCommits[ 0 ].oid if parentCommits else None
+                )
     return commitId
+
+
+def CommitBlob(
+        repo,
+        content,
+        name,
+        commitMessage,
+        parentCommits = [],
+        updateRef = None
+        ):
+    '''
+    Creates a commit containing a single blob
+
+    Args:
+        repo            Repository to act on
+        content         The content to commit
+        name            The name of the blob
+        commitMessage   The message to use for the commit
+        parentCommits   Parent commit objects
+        updateRef       Reference to update.  The ref must currently point
+                        at the first parent, or not exist if there are no
+                        parents
+
+    Returns:
+        oid of the new commit
+    Throws:
+        RefConflict if updateRef has been changed by someone else
+    '''
+    return CommitTree(
+            repo, { name: content }, commitMessage, parentCommits, updateRef
+            )
@@ -0,0 +1,103 @@
+'''
+Functions for working out where document repositories live on disk.
+
+Documents are stored in a two level hashed directory structure under the root
+path, so that no single directory ends up with huge numbers of entries:
+
+    <rootPath>/<2 hex digits>/<2 hex digits>/<name>.git
+
+where the hex digits are taken from the sha1 of the document name.
+
+Older data directories stored every repository directly in the root path.
+These flat paths are still read from until they've been migrated (see
+db.migrate)
+'''
+
+import os
+import hashlib
+
+# The suffix used on repository directories
+REPO_SUFFIX = '.git'
+
+
+def _RepoDirName( name ):
+    return name + REPO_SUFFIX
+
+
+def FlatPath( rootPath, name ):
+    '''
+    Gets the old, unsharded path for a document
+
+    Args:
+        rootPath    The root data path
+        name        The name of the document
+    '''
+    return os.path.join( rootPath, _RepoDirName( name ) )
+
+
+def ShardedPath( rootPath, name ):
+    '''
+    Gets the sharded path for a document
+
+    Args:
+        rootPath    The root data path
+        name        The name of the document
+    '''
+    encoded = name.encode( 'utf-8' ) if isinstance( name, unicode ) else name
+    digest = hashlib.sha1( encoded ).hexdigest()
+    return os.path.join(
+            rootPath, digest[ 0:2 ], digest[ 2:4 ], _RepoDirName( name )
+            )
+
+
+def ResolvePath( rootPath, name ):
+    '''
+    Finds the path to a documents repository.
+
+    Prefers the sharded path, but will return the flat path for documents
+    that haven't been migrated yet.  Documents that don't exist yet will be
+    given the sharded path.
+
+    Args:
+        rootPath    The root data path
+        name        The name of the document
+    '''
+    sharded = ShardedPath( rootPath, name )
+    if not os.path.exists( sharded ):
+        flat = FlatPath( rootPath, name )
+        if os.path.exists( flat ):
+            return flat
+    return sharded
+
+
+def ListDocuments( rootPath ):
+    '''
+    Lists the documents stored under a root path
+
+    Args:
+        rootPath    The root data path
+    Returns:
+        A dict mapping document name to repository path
+    '''
+    documents = {}
+    if not os.path.isdir( rootPath ):
+        return documents
+    flat = []
+    for entry in os.listdir( rootPath ):
+        entryPath = os.path.join( rootPath, entry )
+        if entry.endswith( REPO_SUFFIX ):
+            flat.append( ( entry[ :-len( REPO_SUFFIX ) ], entryPath ) )
+        elif len( entry ) == 2 and os.path.isdir( entryPath ):
+            for subEntry in os.listdir( entryPath ):
+                subPath = os.path.join( entryPath, subEntry )
+                if not os.path.isdir( subPath ):
+                    continue
+                for repoDir in os.listdir( subPath ):
+                    if repoDir.endswith( REPO_SUFFIX ):
+                        name = repoDir[ :-len( REPO_SUFFIX ) ]
+                        documents[ name ] = os.path.join( subPath, repoDir )
+    # Flat entries might just be links left over from a migration, so prefer
+    # the sharded paths
+    for name, path in flat:
+        documents.setdefault( name, path )
+    return documents
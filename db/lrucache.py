@@ -0,0 +1,186 @@
+'''
+Contains a simple thread safe LRU cache, used for the various process wide
+caches in the db package
+'''
+
+import time
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''
+    A thread safe least recently used cache.
+
+    Items are evicted oldest first when there are more than maxSize items in
+    the cache.  If maxAge is set then items that have not been accessed for
+    that many seconds are also expired.
+
+    If maxWeight is set, the cache is also limited by the total weight of the
+    items, as measured by the weigh function (e.g. len, to limit the cache by
+    bytes).  Items heavier than maxWeight are never cached.
+
+    Hit & miss counts are kept so the effectiveness of the cache can be
+    reported via Stats
+    '''
+
+    def __init__(self, maxSize, maxAge=None, maxWeight=None, weigh=None):
+        '''
+        Constructor
+
+        Args:
+            maxSize     The maximum number of items to keep, or None for no
+                        limit
+            maxAge      Optional number of seconds an item can go unused
+                        before it is expired
+            maxWeight   Optional maximum total weight of the items
+            weigh       Function that returns the weight of an item.
+                        Required if maxWeight is set
+        '''
+        self.maxSize = maxSize
+        self.maxAge = maxAge
+        self.maxWeight = maxWeight
+        self._weigh = weigh
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.weight = 0
+        # Maps key -> ( value, lastUsed, weight ), ordered oldest first
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _Expired(self, lastUsed, now):
+        return self.maxAge is not None and now - lastUsed > self.maxAge
+
+    def _Full(self):
+        if self.maxSize is not None and len(self._items) > self.maxSize:
+            return True
+        return self.maxWeight is not None and self.weight > self.maxWeight
+
+    def _Remove(self, key):
+        value, lastUsed, weight = self._items.pop(key)
+        self.weight -= weight
+        return value, lastUsed, weight
+
+    def Get(self, key, default=None):
+        '''
+        Gets an item from the cache, marking it as recently used
+
+        Args:
+            key         The key to look up
+            default     Returned if the key is not in the cache
+        Returns:
+            The cached value or default
+        '''
+        now = time.time()
+        with self._lock:
+            try:
+                value, lastUsed, weight = self._Remove(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if self._Expired(lastUsed, now):
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._items[key] = (value, now, weight)
+            self.weight += weight
+            self.hits += 1
+            return value
+
+    def Put(self, key, value):
+        '''
+        Adds an item to the cache, evicting old items if required
+
+        Args:
+            key     The key to store the item under
+            value   The item to store
+        '''
+        now = time.time()
+        weight = self._weigh(value) if self._weigh else 0
+        with self._lock:
+            if key in self._items:
+                self._Remove(key)
+            if self.maxWeight is not None and weight > self.maxWeight:
+                # Too big to ever fit
+                return
+            self._items[key] = (value, now, weight)
+            self.weight += weight
+            self._Prune(now)
+
+    def SetDefault(self, key, value):
+        '''
+        Adds an item to the cache, unless there is already an item with the
+        same key.  Does not affect the hit & miss counts.
+
+        Args:
+            key     The key to store the item under
+            value   The item to store
+        Returns:
+            The item that is now in the cache for key
+        '''
+        now = time.time()
+        with self._lock:
+            if key in self._items:
+                existing, lastUsed, weight = self._Remove(key)
+                if not self._Expired(lastUsed, now):
+                    self._items[key] = (existing, now, weight)
+                    self.weight += weight
+                    return existing
+            self.Put(key, value)
+            return value
+
+    def Discard(self, key):
+        '''
+        Removes an item from the cache, if it is present
+
+        Args:
+            key     The key of the item to remove
+        '''
+        with self._lock:
+            if key in self._items:
+                self._Remove(key)
+
+    def Clear(self):
+        '''
+        Removes all items from the cache & resets the statistics
+        '''
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = self.evictions = self.weight = 0
+
+    def _Prune(self, now):
+        # Removes expired & excess items.  Items are stored oldest first,
+        # so we can stop as soon as we find one that can stay
+        while self._items:
+            key, (value, lastUsed, weight) = next(self._items.iteritems())
+            if not self._Full() and not self._Expired(lastUsed, now):
+                break
+            self._Remove(key)
+            self.evictions += 1
+
+    def Stats(self):
+        '''
+        Gets statistics about the cache
+
+        Returns:
+            A dict of statistics
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                    'size': len(self._items),
+                    'maxSize': self.maxSize,
+                    'weight': self.weight,
+                    'maxWeight': self.maxWeight,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hitRatio': float(self.hits) / lookups if lookups else 0.0,
+                    }
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
@@ -0,0 +1,227 @@
+'''
+Maintenance for document repositories.
+
+Removing a section only takes it out of the section index, so the section
+branches pile up forever, and everything that lists the section refs gets
+slower.  The retention policy here is that a section branch is collected
+once it has not been in the index, or been edited, for a grace period.
+Collected branches are either archived or deleted:
+
+    archived    The heads of the branches become parents of a single commit
+                on ARCHIVE_REF, so the content is still reachable (and a
+                list of the archived sections & their heads is kept in the
+                commit), but there's only one ref for all of them.
+    deleted     The branches are just deleted, and their content will be
+                removed the next time the repository is garbage collected.
+
+The remaining refs are then packed, so listing them is a single file read.
+
+    python -m db.maintenance [--grace-days N] [--delete] [--dry-run] \
+            <DATA_PATH>
+'''
+
+import time
+import argparse
+import subprocess
+import pygit2
+from pygit2 import Repository
+from . import gitutils
+from .blobcache import ReadBlob
+from .sectionindex import SectionIndex
+from .constants import MASTER_REF, SECTION_REF_PREFIX
+from .layout import ListDocuments
+from .errors import RefConflict
+from .treestore import IsTreeDocument
+
+# The ref that archived sections are kept under
+ARCHIVE_REF = 'refs/archive/sections'
+
+# The name of the file listing the archived sections
+ARCHIVE_FILENAME = 'archivedSections'
+
+# How long a section has to have been out of the index before it's collected
+DEFAULT_GRACE_PERIOD = 30 * 24 * 60 * 60
+
+
+def _IndexedSince( repo, cutoff ):
+    '''
+    Gets the names of the sections that have been in the section index at any
+    point since a time
+
+    Args:
+        repo    The repository
+        cutoff  The time to look back to
+    Returns:
+        A set of section names
+    '''
+    commit = repo[ repo.lookup_reference( MASTER_REF ).oid ]
+    names = set()
+    while True:
+        index = SectionIndex( repo, commit )
+        names.update( s.name for s in index.CurrentSections() )
+        # Each index was current until its child was committed, so stop
+        # once we've got the index that was current at the cutoff
+        if commit.commit_time < cutoff or not commit.parents:
+            break
+        commit = commit.parents[ 0 ]
+    return names
+
+
+def FindOrphanedSections( repo, gracePeriod=DEFAULT_GRACE_PERIOD, now=None ):
+    '''
+    Finds the section branches that can be collected: those that haven't
+    been in the index or been edited within the grace period
+
+    Args:
+        repo            The repository
+        gracePeriod     The grace period in seconds
+        now             The current time.  Defaults to time.time()
+    Returns:
+        A dict mapping section name -> head commit
+    '''
+    if now is None:
+        now = time.time()
+    cutoff = now - gracePeriod
+    indexed = _IndexedSince( repo, cutoff )
+    orphans = {}
+    for refName in repo.listall_references():
+        if not refName.startswith( SECTION_REF_PREFIX ):
+            continue
+        name = refName[ len( SECTION_REF_PREFIX ): ]
+        if name in indexed:
+            continue
+        head = repo[ repo.lookup_reference( refName ).oid ]
+        if head.commit_time >= cutoff:
+            continue
+        orphans[ name ] = head
+    return orphans
+
+
+def ArchiveSections( repo, sections ):
+    '''
+    Archives some sections in a single commit on ARCHIVE_REF, with the
+    section heads as parents so their history is kept.
+
+    Args:
+        repo        The repository
+        sections    A dict mapping section name -> head commit
+    '''
+    parents = []
+    lines = []
+    try:
+        previous = repo[ repo.lookup_reference( ARCHIVE_REF ).oid ]
+    except KeyError:
+        previous = None
+    if previous is not None:
+        parents.append( previous )
+        listing = ReadBlob( repo, previous.tree[ ARCHIVE_FILENAME ].oid )
+        lines.extend( listing.splitlines() )
+    for name in sorted( sections ):
+        head = sections[ name ]
+        parents.append( head )
+        lines.append( '{0} {1}'.format( name, head.hex ) )
+
+    builder = repo.TreeBuilder()
+    builder.insert(
+            ARCHIVE_FILENAME,
+            repo.create_blob( '\n'.join( lines ) ),
+            pygit2.GIT_FILEMODE_BLOB
+            )
+    signature = gitutils.DefaultSignature()
+    commitId = repo.create_commit(
+            None,
+            signature,
+            signature,
+            'Archiving {0} sections'.format( len( sections ) ),
+            builder.write(),
+            [ c.oid for c in parents ]
+            )
+    gitutils.UpdateRef(
+            repo,
+            ARCHIVE_REF,
+            commitId,
+            previous.oid if previous is not None else None
+            )
+
+
+def PackRefs( repo ):
+    '''
+    Packs all the refs in a repository into the packed-refs file
+
+    Args:
+        repo    The repository
+    '''
+    subprocess.check_call(
+            [ 'git', '--git-dir', repo.path, 'pack-refs', '--all', '--prune' ]
+            )
+
+
+def CollectOrphanedSections(
+        repo, gracePeriod=DEFAULT_GRACE_PERIOD, archive=True, now=None
+        ):
+    '''
+    Collects the section branches that have been out of the index for the
+    grace period, then packs the remaining refs
+
+    Args:
+        repo            The repository
+        gracePeriod     The grace period in seconds
+        archive         If true, the sections are archived rather than just
+                        deleted
+        now             The current time.  Defaults to time.time()
+    Returns:
+        A list of the names of the collected sections
+    '''
+    orphans = FindOrphanedSections( repo, gracePeriod, now )
+    if orphans:
+        if archive:
+            ArchiveSections( repo, orphans )
+        for name, head in orphans.items():
+            try:
+                gitutils.DeleteRef(
+                        repo, SECTION_REF_PREFIX + name, head.oid
+                        )
+            except RefConflict:
+                # Edited since we looked, so it's not an orphan after all
+                del orphans[ name ]
+    PackRefs( repo )
+    return sorted( orphans )
+
+
+def Main( args=None ):
+    parser = argparse.ArgumentParser(
+            description='Collects removed sections & packs refs'
+            )
+    parser.add_argument( 'dataPath', help='The DATA_PATH to maintain' )
+    parser.add_argument(
+            '--grace-days', type=float,
+            default=DEFAULT_GRACE_PERIOD / ( 24 * 60 * 60 ),
+            help='Days a section must be removed for before collection'
+            )
+    parser.add_argument(
+            '--delete', action='store_true',
+            help='Delete removed sections rather than archiving them'
+            )
+    parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the sections that would be collected'
+            )
+    options = parser.parse_args( args )
+    gracePeriod = options.grace_days * 24 * 60 * 60
+    for name, path in sorted( ListDocuments( options.dataPath ).iteritems() ):
+        repo = Repository( path )
+        if IsTreeDocument( repo ):
+            # Single tree documents don't have section branches
+            continue
+        if options.dry_run:
+            collected = sorted( FindOrphanedSections( repo, gracePeriod ) )
+        else:
+            collected = CollectOrphanedSections(
+                    repo, gracePeriod, archive=not options.delete
+                    )
+        if collected:
+            print "{0}: {1}".format( name, ', '.join( collected ) )
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,280 @@
+'''
+A pure python, in memory repository.
+
+Implements the parts of the pygit2.Repository interface that the db package
+uses, so documents can be stored without touching the disk.  Objects are
+content addressed by sha1 like git's, but their ids aren't compatible with
+git's.  Everything is lost when the process exits.
+'''
+
+import hashlib
+import threading
+
+
+class MemoryBlob(object):
+    '''
+    A blob in a MemoryRepository
+    '''
+
+    def __init__( self, oid, data ):
+        self.oid = oid
+        self.hex = oid
+        self.data = data
+
+
+class MemoryTreeEntry(object):
+    '''
+    An entry in a MemoryTree
+    '''
+
+    def __init__( self, name, oid, filemode ):
+        self.name = name
+        self.oid = oid
+        self.hex = oid
+        self.filemode = filemode
+
+
+class MemoryTree(object):
+    '''
+    A tree in a MemoryRepository.  Entries can be looked up by position,
+    name or / separated path
+    '''
+
+    def __init__( self, repo, oid, entries ):
+        '''
+        Constructor
+
+        Args:
+            repo        The repository the tree is in
+            oid         The oid of the tree
+            entries     A list of MemoryTreeEntrys, sorted by name
+        '''
+        self.oid = oid
+        self.hex = oid
+        self._repo = repo
+        self._entries = entries
+        self._byName = dict( ( entry.name, entry ) for entry in entries )
+
+    def __iter__( self ):
+        return iter( self._entries )
+
+    def __len__( self ):
+        return len( self._entries )
+
+    def __getitem__( self, key ):
+        if isinstance( key, ( int, long ) ):
+            return self._entries[ key ]
+        name, sep, rest = key.partition( '/' )
+        entry = self._byName[ name ]
+        if not sep:
+            return entry
+        subtree = self._repo[ entry.oid ]
+        if not isinstance( subtree, MemoryTree ):
+            raise KeyError( key )
+        return subtree[ rest ]
+
+    def __contains__( self, path ):
+        try:
+            self[ path ]
+        except KeyError:
+            return False
+        return True
+
+
+class MemoryCommit(object):
+    '''
+    A commit in a MemoryRepository
+    '''
+
+    def __init__(
+            self, repo, oid, author, committer, message, treeOid, parentOids
+            ):
+        self.oid = oid
+        self.hex = oid
+        self.author = author
+        self.committer = committer
+        self.message = message
+        self.commit_time = committer.time
+        self.tree_id = treeOid
+        self.parent_ids = parentOids
+        self._repo = repo
+
+    @property
+    def tree( self ):
+        return self._repo[ self.tree_id ]
+
+    @property
+    def parents( self ):
+        return [ self._repo[ oid ] for oid in self.parent_ids ]
+
+
+class MemoryReference(object):
+    '''
+    A reference in a MemoryRepository, as it was when it was looked up
+    '''
+
+    def __init__( self, repo, name, oid ):
+        self.name = name
+        self.oid = oid
+        self._repo = repo
+
+    def delete( self ):
+        self._repo._DeleteReference( self.name )
+
+
+class MemoryTreeBuilder(object):
+    '''
+    Builds trees in a MemoryRepository
+    '''
+
+    def __init__( self, repo, tree=None ):
+        self._repo = repo
+        self._entries = {}
+        if tree is not None:
+            for entry in tree:
+                self._entries[ entry.name ] = ( entry.oid, entry.filemode )
+
+    def insert( self, name, oid, filemode ):
+        self._entries[ name ] = ( oid, filemode )
+
+    def remove( self, name ):
+        del self._entries[ name ]
+
+    def write( self ):
+        return self._repo._WriteTree( self._entries )
+
+
+class MemoryRepository(object):
+    '''
+    A repository held in memory.  Safe to use from several threads
+    '''
+
+    def __init__( self, path ):
+        '''
+        Constructor
+
+        Args:
+            path    The path the repository is known by.  Nothing is written
+                    there
+        '''
+        self.path = path
+        # Maps oid -> object
+        self._objects = {}
+        # Maps ref name -> oid
+        self._refs = {}
+        self._lock = threading.Lock()
+        # Held by gitutils.RefLock while refs are checked & updated, in place
+        # of the lock file used for repositories on disk
+        self.refLock = threading.Lock()
+
+    def _Store( self, kind, payload, make ):
+        '''
+        Stores an object, unless an identical one is already stored
+
+        Args:
+            kind        The type of the object
+            payload     A string that uniquely describes the object
+            make        Function that makes the object, given its oid
+        Returns:
+            The oid of the object
+        '''
+        oid = hashlib.sha1( kind + '\0' + payload ).hexdigest()
+        with self._lock:
+            if oid not in self._objects:
+                self._objects[ oid ] = make( oid )
+        return oid
+
+    def __getitem__( self, oid ):
+        return self._objects[ oid ]
+
+    def __contains__( self, oid ):
+        return oid in self._objects
+
+    def create_blob( self, data ):
+        if isinstance( data, unicode ):
+            data = data.encode( 'utf-8' )
+        return self._Store(
+                'blob', data, lambda oid: MemoryBlob( oid, data )
+                )
+
+    def TreeBuilder( self, tree=None ):
+        return MemoryTreeBuilder( self, tree )
+
+    def _WriteTree( self, entries ):
+        '''
+        Writes a tree
+
+        Args:
+            entries     A dict mapping name -> ( oid, filemode )
+        Returns:
+            The oid of the tree
+        '''
+        names = sorted( entries )
+        payload = '\n'.join(
+                '{0:o} {1} {2}'.format( entries[ name ][ 1 ], oid, name )
+                for name, oid in (
+                    ( name, entries[ name ][ 0 ] ) for name in names
+                    )
+                )
+        return self._Store( 'tree', payload, lambda oid: MemoryTree(
+            self, oid, [
+                MemoryTreeEntry( name, entries[ name ][ 0 ],
+                                 entries[ name ][ 1 ] )
+                for name in names
+                ]
+            ) )
+
+    def create_commit(
+            self, updateRef, author, committer, message, treeOid, parents
+            ):
+        if treeOid not in self._objects:
+            raise KeyError( treeOid )
+        parents = list( parents )
+        payload = '\n'.join( [ treeOid ] + parents + [
+            repr( ( author.name, author.email, author.time, author.offset ) ),
+            repr( ( committer.name, committer.email, committer.time,
+                    committer.offset ) ),
+            message.encode( 'utf-8' ) if isinstance( message, unicode )
+            else message
+            ] )
+        oid = self._Store( 'commit', payload, lambda oid: MemoryCommit(
+            self, oid, author, committer, message, treeOid, parents
+            ) )
+        if updateRef:
+            self.create_reference( updateRef, oid, True )
+        return oid
+
+    def create_reference( self, name, oid, force=False ):
+        with self._lock:
+            if name in self._refs and not force:
+                raise ValueError( 'Reference already exists: ' + name )
+            self._refs[ name ] = oid
+        return MemoryReference( self, name, oid )
+
+    def lookup_reference( self, name ):
+        with self._lock:
+            return MemoryReference( self, name, self._refs[ name ] )
+
+    def _DeleteReference( self, name ):
+        with self._lock:
+            del self._refs[ name ]
+
+    def listall_references( self ):
+        with self._lock:
+            return sorted( self._refs )
+
+    def descendant_of( self, oid, ancestorOid ):
+        '''
+        Checks if a commit is a descendant of another.  As with git, a commit
+        isn't a descendant of itself
+        '''
+        seen = set()
+        pending = list( self[ oid ].parent_ids )
+        while pending:
+            current = pending.pop()
+            if current == ancestorOid:
+                return True
+            if current not in seen:
+                seen.add( current )
+                pending.extend( self[ current ].parent_ids )
+        return False
@@ -0,0 +1,131 @@
+'''
+Migrates a data directory from the flat layout to the sharded layout
+described in db.layout.
+
+Migration is done in two steps, so that running servers can keep working:
+
+    python -m db.migrate <DATA_PATH>
+        Moves every flat repository to its sharded path, leaving a symlink
+        at the old path so that any repositories already opened by running
+        servers keep working.
+
+    python -m db.migrate --finish <DATA_PATH>
+        Removes the symlinks.  This should be run once all servers have been
+        restarted (or their document pools have expired).
+'''
+
+import os
+import argparse
+from multiprocessing.pool import ThreadPool
+from .layout import FlatPath, ShardedPath, REPO_SUFFIX
+
+# The default number of repositories to move at once
+DEFAULT_WORKERS = 8
+
+
+def _FlatEntries( rootPath ):
+    '''
+    Gets the names of the documents stored in the flat layout, along with
+    whether each is a migration link
+
+    Args:
+        rootPath    The root data path
+    Returns:
+        A list of ( name, isLink ) tuples
+    '''
+    entries = []
+    for entry in os.listdir( rootPath ):
+        if entry.endswith( REPO_SUFFIX ):
+            path = os.path.join( rootPath, entry )
+            entries.append(
+                    ( entry[ :-len( REPO_SUFFIX ) ], os.path.islink( path ) )
+                    )
+    return entries
+
+
+def MigrateDocument( rootPath, name ):
+    '''
+    Moves a single document to its sharded path, and links the flat path to
+    the new location.
+
+    Args:
+        rootPath    The root data path
+        name        The name of the document
+    Returns:
+        True if the document was moved
+    '''
+    flat = FlatPath( rootPath, name )
+    sharded = ShardedPath( rootPath, name )
+    if os.path.islink( flat ) or os.path.exists( sharded ):
+        return False
+    shardDir = os.path.dirname( sharded )
+    try:
+        os.makedirs( shardDir )
+    except OSError:
+        if not os.path.isdir( shardDir ):
+            raise
+    os.rename( flat, sharded )
+    os.symlink( os.path.relpath( sharded, rootPath ), flat )
+    return True
+
+
+def MigrateToShardedLayout( rootPath, workers=DEFAULT_WORKERS ):
+    '''
+    Moves all flat documents to the sharded layout, in parallel
+
+    Args:
+        rootPath    The root data path
+        workers     The number of documents to move at once
+    Returns:
+        The number of documents moved
+    '''
+    names = [ name for name, isLink in _FlatEntries( rootPath ) if not isLink ]
+    pool = ThreadPool( workers )
+    try:
+        moved = pool.map( lambda name: MigrateDocument( rootPath, name ), names )
+    finally:
+        pool.close()
+        pool.join()
+    return sum( 1 for m in moved if m )
+
+
+def FinishMigration( rootPath ):
+    '''
+    Removes the links left behind by MigrateToShardedLayout
+
+    Args:
+        rootPath    The root data path
+    Returns:
+        The number of links removed
+    '''
+    removed = 0
+    for name, isLink in _FlatEntries( rootPath ):
+        if isLink:
+            os.unlink( FlatPath( rootPath, name ) )
+            removed += 1
+    return removed
+
+
+def Main( args=None ):
+    parser = argparse.ArgumentParser(
+            description='Migrates a data directory to the sharded layout'
+            )
+    parser.add_argument( 'dataPath', help='The DATA_PATH to migrate' )
+    parser.add_argument(
+            '--workers', type=int, default=DEFAULT_WORKERS,
+            help='Number of documents to move at once'
+            )
+    parser.add_argument(
+            '--finish', action='store_true',
+            help='Remove the links left at the old paths'
+            )
+    options = parser.parse_args( args )
+    if options.finish:
+        print "Removed {0} links".format( FinishMigration( options.dataPath ) )
+    else:
+        moved = MigrateToShardedLayout( options.dataPath, options.workers )
+        print "Migrated {0} documents".format( moved )
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,141 @@
+'''
+Contains the DocumentRegistry, which keeps track of the documents that exist
+'''
+
+import threading
+from .backends import GitBackend
+from .doc import Document, DocumentPath, DEFAULT_ROOT_PATH
+from .errors import RepoNotFound
+from .treestore import TreeDocument, IsTreeDocument
+
+# The storage engines new documents can be created with.
+# refs stores each section on its own branch, tree stores the whole document
+# in a single tree (see db.treestore)
+ENGINES = {
+        'refs': Document,
+        'tree': TreeDocument,
+        }
+
+DEFAULT_ENGINE = 'refs'
+
+
+class DocumentRegistry(object):
+    '''
+    Keeps track of which documents exist under a root path.
+
+    The registry is loaded once on creation and kept up to date as documents
+    are created, so opening an existing document doesn't need to try (and
+    fail) to open a repository first.
+
+    Document creation is serialized with the backend's create lock (a lock
+    file in the root path for git), so that two workers logging in the same
+    user at once don't both create the repository.
+
+    Existing documents are opened with whichever storage engine they were
+    stored with.  New documents are created with the registry's engine.
+    '''
+
+    def __init__(
+            self, rootPath=None, engine=DEFAULT_ENGINE, backend=None
+            ):
+        '''
+        Constructor
+
+        Args:
+            rootPath    The rootPath to use (if not supplied, uses default)
+            engine      The name of the storage engine to create documents
+                        with.  One of ENGINES
+            backend     The storage backend documents are kept in (if not
+                        supplied, uses a GitBackend)
+        '''
+        self.rootPath = rootPath or DEFAULT_ROOT_PATH
+        self.backend = backend or GitBackend()
+        if engine not in ENGINES:
+            raise ValueError( 'Unknown storage engine: {0}'.format( engine ) )
+        self.engine = engine
+        # Maps document name -> repository path
+        self._known = {}
+        self._lock = threading.Lock()
+        self.Load()
+
+    def Load( self ):
+        '''
+        (Re)loads the set of known documents from the backend
+        '''
+        self._known = self.backend.List( self.rootPath )
+
+    def Exists( self, name ):
+        '''
+        Checks if a document is known to exist
+
+        Args:
+            name    The name of the document
+        '''
+        return name in self._known
+
+    def Path( self, name ):
+        '''
+        Gets the path to the repository for a document
+
+        Args:
+            name    The name of the document
+        '''
+        try:
+            return self._known[ name ]
+        except KeyError:
+            return DocumentPath( name, self.rootPath )
+
+    def Open( self, name ):
+        '''
+        Opens a document, creating it if it doesn't exist
+
+        Args:
+            name    The name of the document
+        Returns:
+            The document
+        '''
+        if name in self._known:
+            try:
+                return self._OpenExisting( name )
+            except RepoNotFound:
+                # Seems it's been removed from under us
+                self._known.pop( name, None )
+        return self._Create( name )
+
+    def _OpenExisting( self, name ):
+        '''
+        Opens an existing document, with the engine it was stored with
+
+        Args:
+            name    The name of the document
+        Returns:
+            The document
+        '''
+        doc = Document(
+                name, rootPath=self.rootPath, backend=self.backend
+                )
+        if IsTreeDocument( doc.repo ):
+            return TreeDocument( name, repo=doc.repo )
+        return doc
+
+    def _Create( self, name ):
+        '''
+        Creates a document, unless another thread or process got there first
+
+        Args:
+            name    The name of the document
+        Returns:
+            The document
+        '''
+        with self._lock:
+            with self.backend.CreateLock( self.rootPath ):
+                path = DocumentPath( name, self.rootPath )
+                if self.backend.Exists( path ):
+                    doc = self._OpenExisting( name )
+                else:
+                    doc = ENGINES[ self.engine ](
+                            name, create=True, rootPath=self.rootPath,
+                            backend=self.backend
+                            )
+                self._known[ name ] = path
+        return doc
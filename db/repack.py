@@ -0,0 +1,272 @@
+'''
+Background repacking of document repositories.
+
+Every save writes a loose blob, tree & commit, so busy documents build up
+lots of loose objects, which slows down object lookups & backups.  The
+RepackScheduler keeps an estimate of how many loose objects each document
+has written, and repacks documents that have written enough once they've
+gone idle.  Repacks run in a separate git process, a limited number at a
+time, so they don't hold up requests.
+'''
+
+import time
+import threading
+import subprocess
+from collections import deque
+
+# The approximate number of loose objects written by each commit:
+# a blob, a tree and the commit itself
+OBJECTS_PER_COMMIT = 3
+
+# The number of loose objects a document writes before it's repacked
+DEFAULT_THRESHOLD = 1000
+
+# How many seconds a document must go without writes before it's repacked
+DEFAULT_IDLE_TIME = 60
+
+# The default maximum number of repacks running at once
+DEFAULT_MAX_CONCURRENT = 1
+
+# How often (in seconds) the scheduler checks for documents to repack
+DEFAULT_INTERVAL = 30
+
+# The number of repack results kept for Stats
+HISTORY_SIZE = 100
+
+# The niceness of the git processes
+REPACK_NICENESS = 10
+
+
+def RunGit( path, *args ):
+    '''
+    Runs a git command on a repository, at a low priority
+
+    Args:
+        path    The path to the repository
+        args    The git command & arguments
+    Returns:
+        The output of the command
+    '''
+    # nice is run rather than lowering the priority in preexec_fn, which
+    # isn't safe in a threaded process
+    return subprocess.check_output(
+            [ 'nice', '-n', str( REPACK_NICENESS ), 'git', '--git-dir', path ]
+            + list( args )
+            )
+
+
+def CountObjects( path ):
+    '''
+    Counts the objects in a repository
+
+    Args:
+        path    The path to the repository
+    Returns:
+        A dict with the counts & sizes (in KiB) from git count-objects.
+        e.g. count, size, in-pack, packs, size-pack
+    '''
+    counts = {}
+    for line in RunGit( path, 'count-objects', '-v' ).splitlines():
+        key, sep, value = line.partition( ': ' )
+        if sep:
+            try:
+                counts[ key ] = int( value )
+            except ValueError:
+                pass
+    return counts
+
+
+def Repack( path ):
+    '''
+    Packs all the objects in a repository into a single pack, and removes
+    the loose objects
+
+    Args:
+        path    The path to the repository
+    Returns:
+        A dict with the path, duration & the object counts before & after
+    '''
+    start = time.time()
+    before = CountObjects( path )
+    RunGit( path, 'repack', '-a', '-d', '-q' )
+    after = CountObjects( path )
+    return {
+            'path': path,
+            'time': start,
+            'duration': time.time() - start,
+            'before': before,
+            'after': after,
+            }
+
+
+class RepackScheduler(object):
+    '''
+    Schedules repacks of documents that have written lots of loose objects,
+    for when they've gone idle.
+
+    Writes are reported with NoteWrite.  The scheduler thread is started on
+    the first write.
+    '''
+
+    def __init__(
+            self,
+            threshold=DEFAULT_THRESHOLD,
+            idleTime=DEFAULT_IDLE_TIME,
+            maxConcurrent=DEFAULT_MAX_CONCURRENT,
+            interval=DEFAULT_INTERVAL
+            ):
+        '''
+        Constructor
+
+        Args:
+            threshold       The number of loose objects a document writes
+                            before it's repacked
+            idleTime        The number of seconds a document must go without
+                            writes before it's repacked
+            maxConcurrent   The maximum number of repacks to run at once
+            interval        How often to check for documents to repack
+        '''
+        self.threshold = threshold
+        self.idleTime = idleTime
+        self.interval = interval
+        # Maps path -> [ loose objects written, time of last write ]
+        self._pending = {}
+        # The paths currently being repacked
+        self._running = set()
+        self._slots = threading.BoundedSemaphore( maxConcurrent )
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = None
+        self.history = deque( maxlen=HISTORY_SIZE )
+        self.failures = 0
+
+    def NoteWrite( self, path, objects=OBJECTS_PER_COMMIT ):
+        '''
+        Records that a document has been written to
+
+        Args:
+            path        The path to the documents repository
+            objects     The number of loose objects written
+        '''
+        now = time.time()
+        with self._lock:
+            entry = self._pending.setdefault( path, [ 0, now ] )
+            entry[ 0 ] += objects
+            entry[ 1 ] = now
+        if self._thread is None:
+            self.Start()
+
+    def DueRepos( self, now=None ):
+        '''
+        Gets the repositories that are due a repack, most loose objects first
+
+        Args:
+            now     The current time.  Defaults to time.time()
+        Returns:
+            A list of paths
+        '''
+        if now is None:
+            now = time.time()
+        with self._lock:
+            due = [
+                    ( objects, path )
+                    for path, ( objects, lastWrite )
+                    in self._pending.iteritems()
+                    if objects >= self.threshold and
+                    now - lastWrite >= self.idleTime and
+                    path not in self._running
+                    ]
+        return [ path for objects, path in sorted( due, reverse=True ) ]
+
+    def RunPending( self, now=None ):
+        '''
+        Starts repacks of the repositories that are due one, as long as
+        there are free slots
+
+        Args:
+            now     The current time.  Defaults to time.time()
+        Returns:
+            The paths that were started
+        '''
+        started = []
+        for path in self.DueRepos( now ):
+            if not self._slots.acquire( False ):
+                break
+            with self._lock:
+                # Writes from now on count towards the next repack
+                del self._pending[ path ]
+                self._running.add( path )
+            self._StartRepack( path )
+            started.append( path )
+        return started
+
+    def _StartRepack( self, path ):
+        '''
+        Starts a thread to repack a repository.
+        A slot must already have been acquired
+        '''
+        thread = threading.Thread( target=self._DoRepack, args=( path, ) )
+        thread.daemon = True
+        thread.start()
+
+    def _DoRepack( self, path ):
+        '''
+        Repacks a repository, then releases its slot
+        '''
+        try:
+            self.history.append( Repack( path ) )
+        except ( OSError, subprocess.CalledProcessError ):
+            self.failures += 1
+        finally:
+            with self._lock:
+                self._running.discard( path )
+            self._slots.release()
+
+    def _Run( self, stop ):
+        while not stop.wait( self.interval ):
+            self.RunPending()
+
+    def Start( self ):
+        '''
+        Starts the scheduler thread
+        '''
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                    target=self._Run, args=( self._stop, )
+                    )
+            self._thread.daemon = True
+            self._thread.start()
+
+    def Stop( self ):
+        '''
+        Stops the scheduler thread.  Repacks in progress are left to finish
+        '''
+        with self._lock:
+            if self._thread is None:
+                return
+            self._stop.set()
+            self._thread = None
+
+    def Stats( self ):
+        '''
+        Gets statistics about the repacks
+
+        Returns:
+            A dict of statistics, including the recent repack results
+        '''
+        with self._lock:
+            pending = dict(
+                    ( path, objects )
+                    for path, ( objects, lastWrite )
+                    in self._pending.iteritems()
+                    )
+            running = sorted( self._running )
+        return {
+                'pending': pending,
+                'running': running,
+                'failures': self.failures,
+                'history': list( self.history ),
+                }
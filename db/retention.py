@@ -0,0 +1,311 @@
+'''
+Thins out the history of sections & stylesheets.
+
+The editor saves often, and every save is a revision, so history grows
+without bound.  A RetentionPolicy decides which revisions are worth keeping,
+as a list of rules like "keep everything from the last day, one an hour for
+a week and one a day after that", written as:
+
+    1d:all,7d:1h,*:1d
+
+Each rule is AGE:INTERVAL, and applies to revisions younger than AGE (or any
+age for *).  The newest revision in each INTERVAL is kept, or every revision
+for all.  Revisions older than all of the rules are dropped, but the current
+revision is always kept.
+
+Branches are thinned by rewriting them with only the kept revisions.  The
+content, messages, authors & times of the kept revisions are unchanged, but
+their ids will be different.  A branch that is written to while it's being
+rewritten is left alone.
+
+    python -m db.retention [--policy POLICY] [--dry-run] <DATA_PATH>
+'''
+
+import time
+import argparse
+from pygit2 import Repository
+from .constants import SECTION_REF_PREFIX, STYLESHEET_REF_PREFIX
+from .constants import STYLESHEET_FILENAME
+from .errors import RefConflict
+from .gitutils import UpdateRef
+from .layout import ListDocuments
+from .repack import CountObjects, RunGit
+from .treestore import IsTreeDocument
+
+# The default retention policy
+DEFAULT_POLICY = '1d:all,7d:1h,*:1d'
+
+# The number of seconds in each unit of duration
+DURATION_UNITS = {
+        's': 1,
+        'm': 60,
+        'h': 60 * 60,
+        'd': 24 * 60 * 60,
+        'w': 7 * 24 * 60 * 60,
+        }
+
+# How old unreachable objects must be before gc prunes them.  Writers create
+# their objects before moving a ref to them, so objects that are only just
+# unreachable may belong to a save that's still in progress.  This is well
+# beyond the lifetime of any request, so those are left alone
+GC_PRUNE_EXPIRY = '1.hour.ago'
+
+
+def ParseDuration( text ):
+    '''
+    Parses a duration like 30m, 12h or 7d
+
+    Args:
+        text    The duration
+    Returns:
+        The duration in seconds
+    Throws:
+        ValueError if the duration is invalid
+    '''
+    try:
+        amount = float( text[ :-1 ] )
+        unit = DURATION_UNITS[ text[ -1 ] ]
+    except ( KeyError, IndexError ):
+        raise ValueError( 'Invalid duration: {0}'.format( text ) )
+    if amount <= 0:
+        raise ValueError( 'Invalid duration: {0}'.format( text ) )
+    return int( amount * unit )
+
+
+class RetentionPolicy(object):
+    '''
+    Decides which revisions of some content to keep
+    '''
+
+    def __init__( self, rules ):
+        '''
+        Constructor
+
+        Args:
+            rules   A list of ( maxAge, interval ) tuples, youngest first.
+                    maxAge is None for no limit, and interval is None to
+                    keep every revision
+        '''
+        self.rules = rules
+
+    @classmethod
+    def Parse( cls, text ):
+        '''
+        Parses a policy like 1d:all,7d:1h,*:1d
+
+        Args:
+            text    The policy
+        Returns:
+            A RetentionPolicy
+        Throws:
+            ValueError if the policy is invalid
+        '''
+        rules = []
+        for rule in text.split( ',' ):
+            age, sep, interval = rule.strip().partition( ':' )
+            if not sep:
+                raise ValueError(
+                        'Invalid retention rule: {0}'.format( rule )
+                        )
+            if rules and rules[ -1 ][ 0 ] is None:
+                raise ValueError( 'Rules after * would never apply' )
+            maxAge = None if age == '*' else ParseDuration( age )
+            if maxAge is not None and rules and maxAge <= rules[ -1 ][ 0 ]:
+                raise ValueError( 'Rules must be in order of age' )
+            rules.append( (
+                    maxAge,
+                    None if interval == 'all' else ParseDuration( interval )
+                    ) )
+        return cls( rules )
+
+    def _Bucket( self, commitTime, now ):
+        '''
+        Gets the bucket a revision falls into.  Only the newest revision in
+        each bucket is kept
+
+        Returns:
+            A unique object if the revision should always be kept, None if
+            it should be dropped or a bucket key
+        '''
+        age = now - commitTime
+        for position, ( maxAge, interval ) in enumerate( self.rules ):
+            if maxAge is None or age < maxAge:
+                if interval is None:
+                    return object()
+                return ( position, commitTime // interval )
+        return None
+
+    def Select( self, commits, now=None ):
+        '''
+        Selects the revisions to keep
+
+        Args:
+            commits     The commits of the revisions, newest first
+            now         The current time.  Defaults to time.time()
+        Returns:
+            A list of the commits to keep, newest first
+        '''
+        if now is None:
+            now = time.time()
+        kept = []
+        seen = set()
+        for position, commit in enumerate( commits ):
+            bucket = self._Bucket( commit.commit_time, now )
+            if position == 0:
+                # Always keep the current revision
+                seen.add( bucket )
+                kept.append( commit )
+            elif bucket is not None and bucket not in seen:
+                seen.add( bucket )
+                kept.append( commit )
+        return kept
+
+
+def _History( repo, oid ):
+    '''
+    Gets the commits in a branches history, newest first
+    '''
+    commit = repo[ oid ]
+    history = [ commit ]
+    while commit.parents:
+        commit = commit.parents[ 0 ]
+        history.append( commit )
+    return history
+
+
+def ThinBranch( repo, refName, policy, now=None, dryRun=False ):
+    '''
+    Rewrites a branch with only the revisions the policy keeps
+
+    Args:
+        repo        The repository
+        refName     The name of the branch
+        policy      The RetentionPolicy to apply
+        now         The current time.  Defaults to time.time()
+        dryRun      If true, the branch is not actually rewritten
+    Returns:
+        The number of revisions dropped
+    '''
+    headOid = repo.lookup_reference( refName ).oid
+    history = _History( repo, headOid )
+    kept = policy.Select( history, now )
+    dropped = len( history ) - len( kept )
+    if not dropped or dryRun:
+        return dropped
+    parents = []
+    for commit in reversed( kept ):
+        newId = repo.create_commit(
+                None,
+                commit.author,
+                commit.committer,
+                commit.message,
+                commit.tree.oid,
+                parents
+                )
+        parents = [ newId ]
+    try:
+        UpdateRef( repo, refName, parents[ 0 ], headOid )
+    except RefConflict:
+        # Written to while we were rewriting it, try again next time
+        return 0
+    return dropped
+
+
+def _ContentRefs( repo ):
+    '''
+    Gets the names of the section & stylesheet branches in a repository
+    '''
+    stylesheetRef = STYLESHEET_REF_PREFIX + STYLESHEET_FILENAME
+    return [
+            refName for refName in repo.listall_references()
+            if refName.startswith( SECTION_REF_PREFIX ) or
+            refName == stylesheetRef
+            ]
+
+
+def ThinRepository( repo, policy, now=None, dryRun=False ):
+    '''
+    Thins all the section & stylesheet branches in a repository
+
+    Args:
+        repo        The repository
+        policy      The RetentionPolicy to apply
+        now         The current time.  Defaults to time.time()
+        dryRun      If true, the branches are not actually rewritten
+    Returns:
+        A dict mapping branch name -> number of revisions dropped
+    '''
+    return dict(
+            ( refName, ThinBranch( repo, refName, policy, now, dryRun ) )
+            for refName in _ContentRefs( repo )
+            )
+
+
+def _TotalSize( counts ):
+    '''
+    Gets the total size in bytes of a repositories objects from CountObjects
+    '''
+    return ( counts.get( 'size', 0 ) + counts.get( 'size-pack', 0 ) ) * 1024
+
+
+def ThinDocument( path, policy, dryRun=False ):
+    '''
+    Thins a documents history, then garbage collects it to reclaim the space.
+    Only objects that have been unreachable for GC_PRUNE_EXPIRY are pruned,
+    so revisions dropped from recently packed history may only be reclaimed
+    by a later gc
+
+    Args:
+        path        The path to the documents repository
+        policy      The RetentionPolicy to apply
+        dryRun      If true, nothing is actually changed
+    Returns:
+        A tuple ( revisions dropped, bytes reclaimed )
+    '''
+    repo = Repository( path )
+    if IsTreeDocument( repo ):
+        # All content shares one branch, which can't be thinned per content
+        return 0, 0
+    dropped = sum( ThinRepository( repo, policy, dryRun=dryRun ).values() )
+    if not dropped or dryRun:
+        return dropped, 0
+    before = _TotalSize( CountObjects( path ) )
+    RunGit( path, 'gc', '--prune=' + GC_PRUNE_EXPIRY, '-q' )
+    after = _TotalSize( CountObjects( path ) )
+    return dropped, before - after
+
+
+def Main( args=None ):
+    parser = argparse.ArgumentParser(
+            description='Thins the history of documents'
+            )
+    parser.add_argument( 'dataPath', help='The DATA_PATH to thin' )
+    parser.add_argument(
+            '--policy', default=DEFAULT_POLICY,
+            help='The retention policy, e.g. {0}'.format( DEFAULT_POLICY )
+            )
+    parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the revisions that would be dropped'
+            )
+    options = parser.parse_args( args )
+    try:
+        policy = RetentionPolicy.Parse( options.policy )
+    except ValueError as e:
+        parser.error( str( e ) )
+    totalDropped = totalReclaimed = 0
+    for name, path in sorted( ListDocuments( options.dataPath ).iteritems() ):
+        dropped, reclaimed = ThinDocument( path, policy, options.dry_run )
+        if dropped:
+            print "{0}: dropped {1} revisions, reclaimed {2} bytes".format(
+                    name, dropped, reclaimed
+                    )
+        totalDropped += dropped
+        totalReclaimed += reclaimed
+    print "Dropped {0} revisions, reclaimed {1} bytes".format(
+            totalDropped, totalReclaimed
+            )
+
+
+if __name__ == '__main__':
+    Main()
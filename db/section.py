@@ -18,8 +18,7 @@ class Section(Content):
         Throws:
             ContentNotFound error if section not found in index
         '''
-        index = SectionIndex(self.repo)
-        return index.GetSectionPosition( self.name )
+        return self._Index().GetSectionPosition( self.name )
 
     def SetPosition( self, newPosition ):
         '''
@@ -30,6 +29,17 @@ class Section(Content):
         Throws:
             ContentNotFound error if the section isn't found in the index
         '''
-        index = SectionIndex( self.repo )
+        index = self._Index()
         index.SetSectionPosition( self.name, newPosition )
-        index.Save( self.repo )
+        if self.unit is not None:
+            self.unit.IndexChanged()
+        else:
+            index.Save( self.repo )
+
+    def _Index( self ):
+        '''
+        Gets the section index, from the unit of work if there is one
+        '''
+        if self.unit is not None:
+            return self.unit.Index()
+        return SectionIndex( self.repo )
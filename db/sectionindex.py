@@ -3,10 +3,27 @@ import re
 from collections import namedtuple
 from .constants import MASTER_REF, SECTION_INDEX_FILENAME
 from .errors import MasterNotFound, BrokenMaster, ContentNotFound
+from .errors import RefConflict
 from .gitutils import CommitBlob
+from .lrucache import LRUCache
+from .blobcache import ReadBlob
 
 SectionIndexEntry = namedtuple('SectionIndexEntry', ['name'])
 
+# The maximum number of parsed section indexes to keep in memory
+INDEX_CACHE_SIZE = 4096
+
+# Process wide cache of parsed section indexes.  This maps a master commit oid
+# to a tuple of the SectionIndexEntrys in that commit and a dict mapping
+# section name to position.  These are shared between SectionIndex objects,
+# and must not be modified.  Since commits never change, entries never need
+# invalidating.
+_indexCache = LRUCache(INDEX_CACHE_SIZE)
+
+# The number of times to try saving an index, replaying our changes onto the
+# latest index each time someone else saves first
+SAVE_ATTEMPTS = 5
+
 
 class SectionIndex(object):
     '''
@@ -17,31 +34,70 @@ class SectionIndex(object):
     # Currently these are just the name of the section
     _lineRegExp = re.compile('(?P<name>.*)')
 
-    def __init__(self, repo):
+    # The oid of the commit the index was loaded from
+    baseOid = None
+
+    # The changes made since the index was loaded, as ( method, args ) tuples
+    _changes = ()
+
+    def __init__(self, repo, commit=None):
         '''
-        Loads the section index from the repository
+        Loads the section index from the repository.
+        Indexes that have been parsed before are loaded from the cache
 
         Params:
             repo - The repository to load from
+            commit - Optional commit to load the index from, for indexes
+                     that aren't stored on master.  Defaults to the head of
+                     master
 
         Raises:
             MasterNotFound  If master branch not found
             BrokenMaster    If master data couldn't be read
         '''
+        self._Load( repo, commit )
+
+    def _Load( self, repo, commit ):
+        '''
+        Loads the section index from a commit, or the head of master
+        '''
         self.sections = []
+        self._positions = {}
+        self._shared = False
+        if commit is not None:
+            headOid = commit.oid
+        else:
+            headOid = self._lookupHeadOid( repo )
+        self.baseOid = headOid
+        cached = _indexCache.Get( headOid )
+        if cached is not None:
+            # Share the cached data until we need to modify it
+            self.sections, self._positions = cached
+            self._shared = True
+            return
         try:
-            commit = self._lookupHead( repo )
+            if commit is None:
+                commit = repo[ headOid ]
             indexOid = commit.tree[ SECTION_INDEX_FILENAME ].oid
-            data = repo[indexOid].data
+            data = ReadBlob( repo, indexOid )
         except KeyError:
             raise BrokenMaster()
         self.ProcessData( data )
+        _indexCache.Put( headOid, self._Freeze() )
 
     @staticmethod
-    def _lookupHead( repo ):
+    def _lookupHeadOid( repo ):
+        # Returns the oid of the head commit (or excepts)
+        try:
+            return repo.lookup_reference( MASTER_REF ).oid
+        except KeyError:
+            raise MasterNotFound
+
+    @classmethod
+    def _lookupHead( cls, repo ):
         # Returns the head commit object (or excepts)
         try:
-            return repo[ repo.lookup_reference( MASTER_REF ).oid ]
+            return repo[ cls._lookupHeadOid( repo ) ]
         except KeyError:
             raise MasterNotFound
 
@@ -50,21 +106,51 @@ class SectionIndex(object):
         Process data into the sections list
         '''
         self.sections = []
+        self._positions = {}
+        self._shared = False
         if not data:
             return
         for line in data.split('\n'):
             m = self._lineRegExp.match(line)
             if not m:
                 raise BrokenMaster()
-            entry = SectionIndexEntry(m.group('name'))
+            name = m.group('name')
+            entry = SectionIndexEntry(name)
+            self._positions.setdefault(name, len(self.sections))
             self.sections.append(entry)
 
+    def _Freeze( self ):
+        '''
+        Gets an immutable copy of the index data, for caching
+        '''
+        return ( tuple( self.sections ), dict( self._positions ) )
+
+    def _Unshare( self ):
+        '''
+        Takes a private copy of the index data, if it's shared with the cache.
+        Must be called before modifying the data
+        '''
+        if self._shared:
+            self.sections = list( self.sections )
+            self._positions = dict( self._positions )
+            self._shared = False
+
     def CurrentSections(self):
         '''
-        Returns list of the current sections
+        Returns a sequence of the current sections.
+        This should not be modified
         '''
         return self.sections
 
+    def HasSection( self, name ):
+        '''
+        Checks if a section is in the index
+
+        Args:
+            name    The name of the section
+        '''
+        return name in self._positions
+
     def AddSection( self, name ):
         '''
         Adds a section.
@@ -73,7 +159,10 @@ class SectionIndex(object):
         Args:
             name    The name for the new section
         '''
+        self._Unshare()
+        self._positions[ name ] = len( self.sections )
         self.sections.append( SectionIndexEntry( name ) )
+        self._Record( 'AddSection', name )
 
     def RemoveSection( self, name ):
         '''
@@ -82,13 +171,15 @@ class SectionIndex(object):
         Args:
             name    The name of the section to remove
         '''
-        toRemove = SectionIndexEntry( name )
-        try:
-            self.sections.remove( toRemove )
-        except ValueError:
+        if name not in self._positions:
             # Can't remove if not there.  But shouldn't be fatal, so don't
             # error
-            pass
+            return
+        self._Unshare()
+        position = self._positions.pop( name )
+        del self.sections[ position ]
+        self._UpdatePositions( position, len( self.sections ) - 1 )
+        self._Record( 'RemoveSection', name )
 
     def GetSectionPosition( self, sectionName ):
         '''
@@ -101,13 +192,9 @@ class SectionIndex(object):
         Throws:
             ContentNotFound error if section not found in index
         '''
-        matchingSections = [
-                s[0] for s in enumerate( self.sections )
-                if s[1].name == sectionName
-                ]
-        if matchingSections:
-            return matchingSections[ 0 ]
-        else:
+        try:
+            return self._positions[ sectionName ]
+        except KeyError:
             raise ContentNotFound()
 
     def SetSectionPosition( self, sectionName, newPosition ):
@@ -126,46 +213,129 @@ class SectionIndex(object):
         currentPosition = self.GetSectionPosition( sectionName )
         if currentPosition != newPosition:
             self._DoSetSectionPosition( currentPosition, newPosition )
+            self._Record( 'SetSectionPosition', sectionName, newPosition )
+
+    def Reorder( self, names ):
+        '''
+        Puts all the sections into a new order
+
+        Args:
+            names   The names of all the sections in their new order
+        Returns:
+            True if the order changed
+        Throws:
+            ValueError  If names isn't a reordering of the current sections
+        '''
+        names = list( names )
+        if len( names ) != len( self.sections ) or \
+                set( names ) != set( self._positions ):
+            raise ValueError( 'Not a reordering of the current sections' )
+        if all( s.name == name for s, name in zip( self.sections, names ) ):
+            return False
+        self.sections = [ SectionIndexEntry( name ) for name in names ]
+        self._positions = dict( ( name, i ) for i, name in enumerate( names ) )
+        self._shared = False
+        self._Record( 'Reorder', names )
+        return True
 
     def _DoSetSectionPosition( self, currentPosition, newPosition ):
         '''
         Internal section position set function.  Does the position switching,
         and assumes all arguments have already been validated
         '''
-        newSections = []
-        sectionToMove = self.sections[ currentPosition ]
-        # Recreate the array in the new order
-        insertIndex = 0
-        for s in self.sections:
-            # Skip the original entry
-            if s is not sectionToMove:
-                if insertIndex == newPosition:
-                    newSections.append( sectionToMove )
-                    insertIndex += 1
-                newSections.append( s )
-                insertIndex += 1
-
-        if insertIndex <= newPosition:
-            # We haven't added the section yet
-            newSections.append( sectionToMove )
-        self.sections = newSections
+        self._Unshare()
+        newPosition = min( newPosition, len( self.sections ) - 1 )
+        self.sections.insert( newPosition, self.sections.pop( currentPosition ) )
+        self._UpdatePositions(
+                min( currentPosition, newPosition ),
+                max( currentPosition, newPosition )
+                )
+
+    def _UpdatePositions( self, start, end ):
+        '''
+        Updates the name to position mapping for the entries between start and
+        end (inclusive), after they've been moved
+        '''
+        for position in range( start, end + 1 ):
+            self._positions[ self.sections[ position ].name ] = position
+
+    def _Record( self, method, *args ):
+        '''
+        Records a change to the index, so it can be replayed by Rebase
+        '''
+        self._changes += ( ( method, args ), )
+
+    def Rebase( self, repo, commit=None ):
+        '''
+        Reloads the index, then replays the changes made since it was last
+        loaded or saved.  Used when someone else has saved the index first.
+
+        Args:
+            repo    The repository to load from
+            commit  Optional commit to load the index from.  Defaults to the
+                    head of master
+        Throws:
+            RefConflict if the changes no longer make sense, e.g. a section
+            we moved has been removed
+        '''
+        changes = self._changes
+        self._changes = ()
+        self._Load( repo, commit )
+        try:
+            for method, args in changes:
+                if method == 'AddSection' and args[ 0 ] in self._positions:
+                    # Someone else added the same section
+                    raise RefConflict()
+                getattr( self, method )( *args )
+        except ( ValueError, ContentNotFound ):
+            raise RefConflict()
 
     def Save( self, repo ):
         '''
-        Saves a new revision the section index
+        Saves a new revision the section index.
+
+        The new revision goes on top of the one the index was loaded from.
+        If someone else has saved the index since then, our changes are
+        replayed onto their revision and we try again.
 
         Args:
             repo    The repository to save to
+        Throws:
+            RefConflict if the index couldn't be saved
         '''
-        data = self.GetIndexString()
-        CommitBlob(
-                repo,
-                data,
-                SECTION_INDEX_FILENAME,
-                'saving section index',
-                [ self._lookupHead( repo ) ],
-                MASTER_REF
-                )
+        for attempt in range( SAVE_ATTEMPTS ):
+            if self.baseOid is not None:
+                base = repo[ self.baseOid ]
+            else:
+                base = self._lookupHead( repo )
+            try:
+                commitId = CommitBlob(
+                        repo,
+                        self.GetIndexString(),
+                        SECTION_INDEX_FILENAME,
+                        'saving section index',
+                        [ base ],
+                        MASTER_REF
+                        )
+            except RefConflict:
+                self.Rebase( repo )
+                continue
+            self.MarkSaved( commitId )
+            return
+        raise RefConflict( MASTER_REF )
+
+    def MarkSaved( self, commitId ):
+        '''
+        Records that the index has been saved
+
+        Args:
+            commitId    The oid of the commit the index was saved in
+        '''
+        self.baseOid = commitId
+        self._changes = ()
+        # We already know what the new index contains, so save parsing it
+        # next time it's loaded
+        _indexCache.Put( commitId, self._Freeze() )
 
     def GetIndexString( self ):
         '''
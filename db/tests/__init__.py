@@ -4,3 +4,14 @@ from gitutilstests import GitUtilsTests
 from sectiontests import SectionTests
 from documenttests import DocumentTests
 from stylesheettests import StylesheetTests
+from lrucachetests import LRUCacheTests
+from blobcachetests import BlobCacheTests
+from docpooltests import DocumentPoolTests
+from registrytests import DocumentRegistryTests
+from layouttests import LayoutTests
+from treestoretests import TreeStoreTests
+from maintenancetests import MaintenanceTests
+from repacktests import RepackSchedulerTests
+from retentiontests import RetentionTests
+from unitofworktests import UnitOfWorkTests
+from backendtests import BackendTests
@@ -0,0 +1,364 @@
+import os
+import itertools
+import pygit2
+from .. import backends
+from .. import convert
+from .. import gitutils
+from ..doc import Document
+from ..errors import ContentNotFound, RefConflict, RepoNotFound
+from ..memoryrepo import MemoryRepository
+from ..registry import DocumentRegistry
+from ..treestore import IsTreeDocument, TreeDocument
+from .defs import BaseTest
+
+
+class BackendTests(BaseTest):
+    '''
+    Tests the storage backends & the in memory repository
+    '''
+
+    def setUp( self ):
+        super( BackendTests, self ).setUp()
+        self.backend = backends.MemoryBackend()
+        self.rootPath = os.path.join( 'memory', self.id() )
+
+    def testMakeBackend( self ):
+        '''
+        Testing db.backends.MakeBackend picks backends by name
+        '''
+        self.assertTrue(
+                isinstance( backends.MakeBackend(), backends.GitBackend )
+                )
+        self.assertTrue( isinstance(
+            backends.MakeBackend( 'memory' ), backends.MemoryBackend
+            ) )
+        self.assertRaises( ValueError, lambda: backends.MakeBackend( 'x' ) )
+
+    def testMemoryRepository( self ):
+        '''
+        Testing the MemoryRepository stores blobs, trees, commits & refs
+        '''
+        repo = MemoryRepository( 'path' )
+        blobOid = repo.create_blob( u'caf\xe9' )
+        self.assertEqual( 'caf\xc3\xa9', repo[ blobOid ].data )
+        self.assertEqual( blobOid, repo.create_blob( 'caf\xc3\xa9' ) )
+
+        inner = repo.TreeBuilder()
+        inner.insert( 'file', blobOid, pygit2.GIT_FILEMODE_BLOB )
+        outer = repo.TreeBuilder()
+        outer.insert( 'dir', inner.write(), pygit2.GIT_FILEMODE_TREE )
+        treeOid = outer.write()
+        self.assertTrue( 'dir/file' in repo[ treeOid ] )
+        self.assertFalse( 'dir/other' in repo[ treeOid ] )
+        self.assertEqual( blobOid, repo[ treeOid ][ 'dir/file' ].oid )
+
+        sig = pygit2.Signature( 'name', 'email', 10, 0 )
+        first = repo.create_commit( None, sig, sig, 'one', treeOid, [] )
+        second = repo.create_commit(
+                'refs/heads/master', sig, sig, 'two', treeOid, [ first ]
+                )
+        self.assertEqual(
+                second, repo.lookup_reference( 'refs/heads/master' ).oid
+                )
+        self.assertEqual( [ first ], [
+            c.oid for c in repo[ second ].parents
+            ] )
+        self.assertEqual( 10, repo[ second ].commit_time )
+        self.assertTrue( repo.descendant_of( second, first ) )
+        self.assertFalse( repo.descendant_of( first, second ) )
+        self.assertRaises(
+                ValueError,
+                lambda: repo.create_reference( 'refs/heads/master', first )
+                )
+        repo.lookup_reference( 'refs/heads/master' ).delete()
+        self.assertEqual( [], repo.listall_references() )
+        self.assertRaises(
+                KeyError, lambda: repo.lookup_reference( 'refs/heads/master' )
+                )
+
+    def testMemoryBackend( self ):
+        '''
+        Testing the MemoryBackend keeps track of its repositories
+        '''
+        path = os.path.join( self.rootPath, 'ab', 'cd', 'name.git' )
+        self.assertRaises( RepoNotFound, lambda: self.backend.Open( path ) )
+        repo = self.backend.Create( path )
+        self.assertTrue( self.backend.Exists( path ) )
+        self.assertTrue( repo is self.backend.Open( path ) )
+        self.assertEqual(
+                { 'name': path }, self.backend.List( self.rootPath )
+                )
+        self.assertEqual( {}, self.backend.List( 'elsewhere' ) )
+        self.backend.Destroy( self.rootPath )
+        self.assertFalse( self.backend.Exists( path ) )
+
+    def _ExerciseDocument( self, doc ):
+        '''
+        Runs a document through the things the API does with it
+        '''
+        doc.AddSections( [ ( 'one', 'One' ), ( 'two', 'Two' ) ] )
+        fingerprint = doc.Fingerprint()
+        self.assertEqual( fingerprint, doc.Fingerprint() )
+        doc.FindSection( 'one' ).SetContent( 'Uno' )
+        self.assertNotEqual( fingerprint, doc.Fingerprint() )
+        doc.ReorderSections( [ 'two', 'one' ] )
+        self.assertEqual(
+                [ ( 0, 'two' ), ( 1, 'one' ) ],
+                [ ( p, s.name ) for p, s in doc.CurrentSections() ]
+                )
+        section = doc.FindSection( 'one' )
+        self.assertEqual( 'Uno', section.CurrentContent() )
+        self.assertEqual(
+                [ 'Uno', 'One' ], list( section.ContentHistory() )
+                )
+
+        work = doc.UnitOfWork()
+        work.FindSection( 'two' ).SetContent( 'Dos' )
+        work.FindSection( 'two' ).SetPosition( 1 )
+        work.Commit()
+        self.assertEqual( 'Dos', doc.FindSection( 'two' ).CurrentContent() )
+        self.assertEqual( 1, doc.FindSection( 'two' ).GetPosition() )
+
+    def _ExerciseConcurrentEdits( self, doc ):
+        '''
+        Runs a document through two people editing it at once
+        '''
+        doc.AddSections( [ ( 'a', 'A0' ), ( 'b', 'B0' ) ] )
+        first = doc.FindSection( 'a' )
+        second = doc.FindSection( 'a' )
+        self.assertEqual( 'A0', first.CurrentContent() )
+        self.assertEqual( 'A0', second.CurrentContent() )
+        first.SetContent( 'A1' )
+        self.assertRaises( RefConflict, lambda: second.SetContent( 'A2' ) )
+        self.assertEqual( 'A1', doc.FindSection( 'a' ).CurrentContent() )
+
+        # Edits to other sections don't conflict
+        other = doc.FindSection( 'b' )
+        self.assertEqual( 'B0', other.CurrentContent() )
+        doc.FindSection( 'a' ).SetContent( 'A3' )
+        other.SetContent( 'B1' )
+        self.assertEqual( 'A3', doc.FindSection( 'a' ).CurrentContent() )
+        self.assertEqual( 'B1', doc.FindSection( 'b' ).CurrentContent() )
+
+        # Units of work conflict too, with or without index changes
+        for setPosition in ( False, True ):
+            first = doc.UnitOfWork()
+            second = doc.UnitOfWork()
+            for work in ( first, second ):
+                work.FindSection( 'a' ).CurrentContent()
+            first.FindSection( 'a' ).SetContent( str( setPosition ) )
+            first.Commit()
+            second.FindSection( 'a' ).SetContent( 'A5' )
+            if setPosition:
+                second.FindSection( 'a' ).SetPosition( 1 )
+            self.assertRaises( RefConflict, second.Commit )
+            self.assertEqual(
+                    str( setPosition ),
+                    doc.FindSection( 'a' ).CurrentContent()
+                    )
+        self.assertEqual( 0, doc.FindSection( 'a' ).GetPosition() )
+
+        # A unit changing several sections goes on top of changes to others
+        doc.AddSection( 'c', 'C0' )
+        work = doc.UnitOfWork()
+        for name in ( 'a', 'b' ):
+            work.FindSection( name ).CurrentContent()
+        doc.FindSection( 'c' ).SetContent( 'C1' )
+        work.FindSection( 'a' ).SetContent( 'A6' )
+        work.FindSection( 'b' ).SetContent( 'B2' )
+        work.Commit()
+        self.assertEqual(
+                [ 'A6', 'B2', 'C1' ],
+                [ s.CurrentContent() for p, s in doc.CurrentSections() ]
+                )
+
+        # But not on top of changes to the same sections
+        work = doc.UnitOfWork()
+        for name in ( 'a', 'b' ):
+            work.FindSection( name ).CurrentContent()
+        doc.FindSection( 'b' ).SetContent( 'B3' )
+        work.FindSection( 'a' ).SetContent( 'A7' )
+        work.FindSection( 'b' ).SetContent( 'B4' )
+        self.assertRaises( RefConflict, work.Commit )
+        self.assertEqual( 'B3', doc.FindSection( 'b' ).CurrentContent() )
+
+    def testDocument( self ):
+        '''
+        Testing a Document stored one branch per section in memory
+        '''
+        doc = Document(
+                'name', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        self._ExerciseDocument( doc )
+
+        doc = Document(
+                'other', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        self._ExerciseConcurrentEdits( doc )
+
+    def testTreeDocument( self ):
+        '''
+        Testing a TreeDocument stored in memory
+        '''
+        doc = TreeDocument(
+                'name', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        self._ExerciseDocument( doc )
+
+        doc = TreeDocument(
+                'other', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        self._ExerciseConcurrentEdits( doc )
+
+    def testTreeDocumentExistingSection( self ):
+        '''
+        Testing TreeDocument.AddSections won't replace existing or removed
+        sections
+        '''
+        doc = TreeDocument(
+                'name', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        doc.AddSections( [ ( 'a', 'A' ), ( 'b', 'B' ) ] )
+        doc.RemoveSection( 'b' )
+        for name in ( 'a', 'b' ):
+            self.assertRaises(
+                    RefConflict,
+                    lambda: doc.AddSections( [ ( 'c', 'C' ), ( name, 'x' ) ] )
+                    )
+        self.assertEqual(
+                [ 'a' ], [ s.name for p, s in doc.CurrentSections() ]
+                )
+        self.assertEqual( 'A', doc.FindSection( 'a' ).CurrentContent() )
+        self.assertEqual( 'B', doc.FindSection( 'b' ).CurrentContent() )
+
+    def testTreeDocumentSetMissingContent( self ):
+        '''
+        Testing setting the content of a section that doesn't exist fails
+        without creating it
+        '''
+        doc = TreeDocument(
+                'name', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        self.assertRaises(
+                ContentNotFound,
+                lambda: doc.FindSection( 'zzz' ).SetContent( 'boo' )
+                )
+        self.assertFalse( doc.FindSection( 'zzz' ).Exists() )
+        doc.AddSection( 'zzz', 'Z' )
+        self.assertEqual( 'Z', doc.FindSection( 'zzz' ).CurrentContent() )
+
+    def testAddExistingSections( self ):
+        '''
+        Testing adding a batch of sections including one that already exists
+        adds none of them, with either engine
+        '''
+        for cls in ( Document, TreeDocument ):
+            doc = cls(
+                    cls.__name__, create=True, rootPath=self.rootPath,
+                    backend=self.backend
+                    )
+            doc.AddSection( 'a', 'A' )
+            self.assertRaises(
+                    RefConflict,
+                    lambda: doc.AddSections( [ ( 'b', 'B' ), ( 'a', 'x' ) ] )
+                    )
+            work = doc.UnitOfWork()
+            self.assertRaises(
+                    RefConflict,
+                    lambda: work.AddSections( [ ( 'b', 'B' ), ( 'a', 'x' ) ] )
+                    )
+            work.Commit()
+
+            # Someone else adds one of the sections before the unit commits
+            work = doc.UnitOfWork()
+            work.AddSections( [ ( 'b', 'B' ), ( 'c', 'C' ) ] )
+            doc.AddSection( 'c', 'Other' )
+            self.assertRaises( RefConflict, work.Commit )
+
+            self.assertFalse( doc.FindSection( 'b' ).Exists() )
+            self.assertEqual(
+                    [ 'a', 'c' ],
+                    [ s.name for p, s in doc.CurrentSections() ]
+                    )
+            self.assertEqual( 'A', doc.FindSection( 'a' ).CurrentContent() )
+            self.assertEqual(
+                    'Other', doc.FindSection( 'c' ).CurrentContent()
+                    )
+
+    def testRegistry( self ):
+        '''
+        Testing the DocumentRegistry opens documents it created in memory
+        '''
+        r = DocumentRegistry(
+                self.rootPath, engine='tree', backend=self.backend
+                )
+        doc = r.Open( 'name' )
+        doc.AddSection( 'one', 'One' )
+
+        r = DocumentRegistry( self.rootPath, backend=self.backend )
+        self.assertTrue( r.Exists( 'name' ) )
+        self.assertEqual(
+                'One', r.Open( 'name' ).FindSection( 'one' ).CurrentContent()
+                )
+
+    def testConvertWithConcurrentEdit( self ):
+        '''
+        Testing db.convert leaves a document alone if it's edited while
+        being converted
+        '''
+        doc = Document(
+                'name', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        doc.AddSection( 'one', 'One' )
+        mergeHistories = convert.MergeHistories
+
+        def EditAndMerge( histories ):
+            doc.FindSection( 'one' ).SetContent( 'Edited' )
+            return mergeHistories( histories )
+        self.mox.stubs.Set( convert, 'MergeHistories', EditAndMerge )
+
+        self.assertRaises(
+                RefConflict, lambda: convert.ConvertRepository( doc.repo )
+                )
+        self.assertFalse( IsTreeDocument( doc.repo ) )
+
+        self.mox.stubs.UnsetAll()
+        self.assertTrue( convert.ConvertRepository( doc.repo ) )
+        self.assertEqual(
+                'Edited',
+                TreeDocument( 'name', repo=doc.repo ).FindSection(
+                    'one' ).CurrentContent()
+                )
+
+    def testConvertedDocumentCoalescing( self ):
+        '''
+        Testing edits to a converted document don't coalesce with revisions
+        of other sections made before it was converted
+        '''
+        clock = itertools.count( 1000000 )
+        self.mox.stubs.Set( gitutils.time, 'time', lambda: next( clock ) )
+        doc = Document(
+                'name', create=True, rootPath=self.rootPath,
+                backend=self.backend
+                )
+        # Otherwise conversion ends by creating the stylesheet
+        doc.GetStylesheet().CurrentContent()
+        doc.AddSections( [ ( 'a', 'A1' ), ( 'b', 'B1' ) ] )
+        doc.FindSection( 'a' ).SetContent( 'A2', session='s' )
+        convert.ConvertRepository( doc.repo )
+
+        doc = TreeDocument( 'name', repo=doc.repo )
+        doc.FindSection( 'b' ).SetContent(
+                'B2', session='s', coalesceWindow=30
+                )
+        self.assertEqual(
+                [ 'A2', 'B2' ],
+                [ s.CurrentContent() for p, s in doc.CurrentSections() ]
+                )
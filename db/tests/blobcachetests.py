@@ -0,0 +1,25 @@
+from .. import blobcache
+from .defs import BaseTest, TestBlobType
+
+
+class BlobCacheTests(BaseTest):
+    '''
+    Tests the blob cache
+    '''
+
+    def testReadBlob( self ):
+        '''
+        Testing db.blobcache.ReadBlob only reads each blob once
+        '''
+        repo = self.mox.CreateMockAnything()
+        repo.__getitem__( 'blobOid' ).AndReturn( TestBlobType( 'data' ) )
+        self.mox.ReplayAll()
+
+        self.assertEqual( 'data', blobcache.ReadBlob( repo, 'blobOid' ) )
+        self.assertEqual( 'data', blobcache.ReadBlob( repo, 'blobOid' ) )
+        self.mox.VerifyAll()
+
+        stats = blobcache.BlobCacheStats()
+        self.assertEqual( 1, stats[ 'hits' ] )
+        self.assertEqual( 1, stats[ 'misses' ] )
+        self.assertEqual( 4, stats[ 'weight' ] )
@@ -1,8 +1,10 @@
 
 import pygit2
 from .. import gitutils
+from .. import content
 from .defs import BaseTest, TestObjectType, TestBlobType, TestCommitType
-from ..errors import ContentNotFound
+from .defs import TestTreeType
+from ..errors import ContentNotFound, RefConflict
 
 
 class ContentTests(BaseTest):
@@ -33,6 +35,7 @@ class ContentTests(BaseTest):
     def setUp(self):
         super( ContentTests, self ).setUp()
         self.mox.StubOutWithMock(gitutils, 'CommitBlob')
+        self.mox.StubOutWithMock(gitutils, 'UpdateRef')
 
     def setupRepoForGetHeadCommit( self ):
         '''
@@ -58,10 +61,14 @@ class ContentTests(BaseTest):
         mockRepo = self.mox.CreateMock( pygit2.Repository )
         gitutils.CommitBlob(
                 mockRepo, self.TestClass.DefaultContent, self.NameToUse,
-                'Create content "{0}"'.format(self.NameToUse)
+                self.TestClass._CommitMessage(
+                    'Create content "{0}"'.format(self.NameToUse),
+                    self.TestClass.DefaultContent
+                    )
                 ).AndReturn( 'commitId' )
-        mockRepo.create_reference(
-                self.CommitRefPrefix + self.NameToUse, 'commitId'
+        gitutils.UpdateRef(
+                mockRepo, self.CommitRefPrefix + self.NameToUse, 'commitId',
+                None
                 ).AndReturn( 'reference' )
 
         self.mox.ReplayAll()
@@ -78,10 +85,14 @@ class ContentTests(BaseTest):
         mockRepo = self.mox.CreateMock( pygit2.Repository )
         gitutils.CommitBlob(
                 mockRepo, 'some content', self.NameToUse,
-                'Create content "{0}"'.format(self.NameToUse)
+                self.TestClass._CommitMessage(
+                    'Create content "{0}"'.format(self.NameToUse),
+                    'some content'
+                    )
                 ).AndReturn( 'commitId' )
-        mockRepo.create_reference(
-                self.CommitRefPrefix + self.NameToUse, 'commitId'
+        gitutils.UpdateRef(
+                mockRepo, self.CommitRefPrefix + self.NameToUse, 'commitId',
+                None
                 ).AndReturn( 'reference' )
 
         self.mox.ReplayAll()
@@ -171,6 +182,19 @@ class ContentTests(BaseTest):
         self.mox.VerifyAll()
         self.assertEqual( 'blobData', c )
 
+    def testCurrentBlobId( self ):
+        '''
+        Testing db.Content.CurrentBlobId doesn't read the content
+        '''
+        mockRepo, mockHead = self.setupRepoForGetHeadCommit()
+        mockHead.tree = self.mox.CreateMockAnything()
+        mockHead.tree[ 0 ].AndReturn( TestObjectType( 'a' * 40 ) )
+
+        self.mox.ReplayAll()
+        s = self.TestClass( self.NameToUse, mockRepo )
+        self.assertEqual( 'a' * 40, s.CurrentBlobId() )
+        self.mox.VerifyAll()
+
     def testSetContent( self ):
         '''
         Testing db.Content.SetContent
@@ -178,7 +202,8 @@ class ContentTests(BaseTest):
         mockRepo, mockHead = self.setupRepoForGetHeadCommit()
 
         gitutils.CommitBlob(
-                mockRepo, 'content', self.NameToUse, 'Updating content',
+                mockRepo, 'content', self.NameToUse,
+                'Updating content\n\nPreview: content\nSize: 7',
                 [ mockHead ], self.CommitRefPrefix + self.NameToUse
                 ).AndReturn( 'newId' )
 
@@ -191,6 +216,113 @@ class ContentTests(BaseTest):
 
         self.mox.VerifyAll()
 
+    def _SetupCoalesce( self, headSession, headTime ):
+        '''
+        Sets up a repo with a head revision written by a session at a time
+
+        Returns:
+            A tuple ( mockRepo, head )
+        '''
+        self.mox.StubOutWithMock( content.time, 'time' )
+        content.time.time().AndReturn( 1000 )
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        message = gitutils.FormatMessage(
+                'Updating', { 'Session': headSession }
+                )
+        head = TestCommitType(
+                None, 'headOid', [ 'parent' ], 'headHex', headTime, message
+                )
+        mockRepo.lookup_reference(
+                self.CommitRefPrefix + self.NameToUse
+                ).AndReturn( TestObjectType( 'oid' ) )
+        mockRepo[ 'oid' ].AndReturn( head )
+        return mockRepo, head
+
+    def testSetContentCoalesces( self ):
+        '''
+        Testing db.Content.SetContent replaces a recent revision from the
+        same session
+        '''
+        mockRepo, head = self._SetupCoalesce( 'session', 990 )
+        gitutils.CommitBlob(
+                mockRepo, 'content', self.NameToUse,
+                'Updating content\n\nPreview: content\nSession: session\n'
+                'Size: 7',
+                [ 'parent' ]
+                ).AndReturn( 'newId' )
+        gitutils.UpdateRef(
+                mockRepo, self.CommitRefPrefix + self.NameToUse, 'newId',
+                'headOid'
+                )
+        mockRepo[ 'newId' ].AndReturn( 'newCommit' )
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        s.SetContent( 'content', session='session', coalesceWindow=30 )
+        self.mox.VerifyAll()
+
+    def testSetContentNoCoalesce( self ):
+        '''
+        Testing db.Content.SetContent adds a new revision if the head is from
+        another session or too old
+        '''
+        for headSession, headTime in ( ( 'other', 990 ), ( 'session', 900 ) ):
+            self.mox.ResetAll()
+            self.mox.UnsetStubs()
+            self.mox.StubOutWithMock( gitutils, 'CommitBlob' )
+            self.mox.StubOutWithMock( gitutils, 'UpdateRef' )
+            mockRepo, head = self._SetupCoalesce( headSession, headTime )
+            gitutils.CommitBlob(
+                    mockRepo, 'content', self.NameToUse,
+                    'Updating content\n\nPreview: content\n'
+                    'Session: session\nSize: 7',
+                    [ head ], self.CommitRefPrefix + self.NameToUse
+                    ).AndReturn( 'newId' )
+            mockRepo[ 'newId' ].AndReturn( 'newCommit' )
+            self.mox.ReplayAll()
+
+            s = self.TestClass( self.NameToUse, mockRepo )
+            s.SetContent( 'content', session='session', coalesceWindow=30 )
+            self.mox.VerifyAll()
+
+    def testSetContentConflict( self ):
+        '''
+        Testing db.Content.SetContent forgets the head commit if someone else
+        changed the content first
+        '''
+        mockRepo, mockHead = self.setupRepoForGetHeadCommit()
+        gitutils.CommitBlob(
+                mockRepo, 'content', self.NameToUse,
+                'Updating content\n\nPreview: content\nSize: 7',
+                [ mockHead ], self.CommitRefPrefix + self.NameToUse
+                ).AndRaise( RefConflict() )
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        self.assertRaises( RefConflict, lambda: s.SetContent( 'content' ) )
+        self.assertEqual( None, s._headCommit )
+        self.mox.VerifyAll()
+
+    def testAutoCreateRace( self ):
+        '''
+        Testing content created by someone else while we were auto creating
+        it is used
+        '''
+        self.mox.StubOutWithMock( self.TestClass, 'Create' )
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        refName = self.CommitRefPrefix + self.NameToUse
+        mockRepo.lookup_reference( refName ).AndRaise( KeyError )
+        self.TestClass.Create().AndRaise( RefConflict() )
+        mockRepo.lookup_reference( refName ).AndReturn(
+                TestObjectType( 'oid' )
+                )
+        mockRepo[ 'oid' ].AndReturn( 'head' )
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo, create=True )
+        self.assertEqual( 'head', s._GetHeadCommit() )
+        self.mox.VerifyAll()
+
     def testContentHistory(self):
         '''
         Testing db.Content.ContentHistory
@@ -219,3 +351,220 @@ class ContentTests(BaseTest):
         s = self.TestClass(self.NameToUse, mockRepo)
         history = s.ContentHistory()
         self.assertEqual( expected, list(history))
+
+    def _MakeHistory( self, length ):
+        '''
+        Creates a chain of fake commits
+
+        Returns:
+            A list of commits, newest first
+        '''
+        commits = []
+        parents = []
+        for i in reversed( range( length ) ):
+            tree = TestTreeType(
+                    [ TestObjectType( 'blob' + str( i ) ) ], [ self.NameToUse ]
+                    )
+            commit = TestCommitType(
+                    tree, 'oid' + str( i ), parents, 'hex' + str( i )
+                    )
+            commits.insert( 0, commit )
+            parents = [ commit ]
+        return commits
+
+    def testHistoryPage( self ):
+        '''
+        Testing db.Content.HistoryPage returns the first page of history
+        '''
+        mockRepo, mockHead = self.setupRepoForGetHeadCommit()
+        history = self._MakeHistory( 4 )
+        mockHead.parents = [ history[ 1 ] ]
+        mockHead.tree = history[ 0 ].tree
+        mockHead.hex = 'hex0'
+
+        for i in range( 2 ):
+            mockRepo[ 'blob' + str( i ) ].AndReturn(
+                    TestBlobType( 'data' + str( i ) )
+                    )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        entries, nextCursor = s.HistoryPage( 2 )
+
+        self.mox.VerifyAll()
+        self.assertEqual( [ ( 'hex0', 'data0' ), ( 'hex1', 'data1' ) ], entries )
+        self.assertEqual( 'hex1', nextCursor )
+
+    def testHistoryPageWithCursor( self ):
+        '''
+        Testing db.Content.HistoryPage starts after the cursor, and stops at
+        the end of the history
+        '''
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        history = self._MakeHistory( 4 )
+
+        mockRepo[ 'hex1' ].AndReturn( history[ 1 ] )
+        for i in range( 2, 4 ):
+            mockRepo[ 'blob' + str( i ) ].AndReturn(
+                    TestBlobType( 'data' + str( i ) )
+                    )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        entries, nextCursor = s.HistoryPage( 2, 'hex1' )
+
+        self.mox.VerifyAll()
+        self.assertEqual( [ ( 'hex2', 'data2' ), ( 'hex3', 'data3' ) ], entries )
+        self.assertEqual( None, nextCursor )
+
+    def testHistoryPageWithBadCursor( self ):
+        '''
+        Testing db.Content.HistoryPage rejects cursors that aren't part of
+        this contents history
+        '''
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        otherCommit = TestCommitType(
+                TestTreeType( [], [ 'somethingElse' ] ), 'oid', [], 'hex'
+                )
+        mockRepo[ 'other' ].AndReturn( otherCommit )
+        mockRepo[ 'missing' ].AndRaise( KeyError )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        self.assertRaises(
+                ContentNotFound, lambda: s.HistoryPage( 2, 'other' )
+                )
+        self.assertRaises(
+                ContentNotFound, lambda: s.HistoryPage( 2, 'missing' )
+                )
+        self.mox.VerifyAll()
+
+    def testRevisions( self ):
+        '''
+        Testing db.Content.Revisions
+        '''
+        mockRepo, mockHead = self.setupRepoForGetHeadCommit()
+        history = self._MakeHistory( 2 )
+        mockHead.parents = [ history[ 1 ] ]
+        mockHead.tree = history[ 0 ].tree
+        mockHead.hex = 'hex0'
+
+        mockRepo[ 'blob0' ].AndReturn( TestBlobType( 'data0' ) )
+        mockRepo[ 'blob1' ].AndReturn( TestBlobType( 'data1' ) )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        self.assertEqual(
+                [ ( 'hex0', 'data0' ), ( 'hex1', 'data1' ) ],
+                list( s.Revisions() )
+                )
+        self.mox.VerifyAll()
+
+    def testRestoreRevision( self ):
+        '''
+        Testing db.Content.RestoreRevision looks up the revision directly
+        '''
+        self.mox.StubOutWithMock( self.TestClass, 'SetContent' )
+        mockRepo, mockHead = self.setupRepoForGetHeadCommit()
+        history = self._MakeHistory( 50 )
+        mockHead.oid = 'headOid'
+
+        mockRepo[ 'hex30' ].AndReturn( history[ 30 ] )
+        mockRepo.descendant_of( 'headOid', 'oid30' ).AndReturn( True )
+        mockRepo[ 'blob30' ].AndReturn( TestBlobType( 'data30' ) )
+        self.TestClass.SetContent( 'data30' )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        s.RestoreRevision( 'hex30' )
+        self.mox.VerifyAll()
+
+    def testRestoreRevisionNotAncestor( self ):
+        '''
+        Testing db.Content.RestoreRevision rejects revisions that aren't in
+        the history of the current head
+        '''
+        mockRepo, mockHead = self.setupRepoForGetHeadCommit()
+        history = self._MakeHistory( 2 )
+        mockHead.oid = 'headOid'
+
+        mockRepo[ 'hex1' ].AndReturn( history[ 1 ] )
+        mockRepo.descendant_of( 'headOid', 'oid1' ).AndReturn( False )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        self.assertRaises(
+                ContentNotFound, lambda: s.RestoreRevision( 'hex1' )
+                )
+        self.mox.VerifyAll()
+
+    def testRestoreCurrentRevision( self ):
+        '''
+        Testing db.Content.RestoreRevision does nothing for the head revision
+        '''
+        mockRepo, mockHead = self.setupRepoForGetHeadCommit()
+        history = self._MakeHistory( 1 )
+        mockHead.oid = 'oid0'
+
+        mockRepo[ 'hex0' ].AndReturn( history[ 0 ] )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        s.RestoreRevision( 'hex0' )
+        self.mox.VerifyAll()
+
+    def testHistorySummary( self ):
+        '''
+        Testing db.Content.HistorySummary only reads blobs for revisions
+        without metadata
+        '''
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        tree = TestTreeType( [ TestObjectType( 'blob' ) ], [ self.NameToUse ] )
+        oldest = TestCommitType(
+                tree, 'oid2', [], 'hex2', 50, 'Updating content'
+                )
+        middle = TestCommitType(
+                tree, 'oid1', [ oldest ], 'hex1', 100,
+                'Updating content\n\nPreview: Some stuff\nSize: 10'
+                )
+        newest = TestCommitType(
+                tree, 'oid0', [ middle ], 'hex0', 150, 'Updating content'
+                )
+
+        mockRepo[ 'hex0' ].AndReturn( newest )
+
+        self.mox.ReplayAll()
+
+        s = self.TestClass( self.NameToUse, mockRepo )
+        entries, nextCursor = s.HistorySummary( 1, 'hex0', previewLength=4 )
+
+        self.mox.VerifyAll()
+        self.assertEqual(
+                [ { 'id': 'hex1', 'time': 100, 'size': 10, 'preview': 'Some' } ],
+                entries
+                )
+        self.assertEqual( 'hex1', nextCursor )
+
+        # Now check the legacy commit
+        self.mox.ResetAll()
+        mockRepo[ 'hex1' ].AndReturn( middle )
+        mockRepo[ 'blob' ].AndReturn( TestBlobType( 'Old\ncontent' ) )
+        self.mox.ReplayAll()
+
+        entries, nextCursor = s.HistorySummary( 1, 'hex1', previewLength=50 )
+        self.mox.VerifyAll()
+        self.assertEqual(
+                [ {
+                    'id': 'hex2', 'time': 50, 'size': 11,
+                    'preview': 'Old content'
+                    } ],
+                entries
+                )
+        self.assertEqual( None, nextCursor )
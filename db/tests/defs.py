@@ -1,20 +1,41 @@
 import unittest
 import mox
 from collections import namedtuple
+from ..blobcache import ClearBlobCache
 
 
 class BaseTest(unittest.TestCase):
     def setUp(self):
         self.mox = mox.Mox()
+        ClearBlobCache()
 
     def tearDown(self):
         self.mox.UnsetStubs()
 
 TestBlobType = namedtuple( 'TestBlobType', [ 'data' ] )
-TestCommitType = namedtuple( 'TestCommitType', [ 'tree', 'oid', 'parents' ] )
+TestCommitType = namedtuple(
+        'TestCommitType',
+        [
+            'tree', 'oid', 'parents', 'hex', 'commit_time', 'message',
+            'author', 'committer'
+        ]
+        )
+TestCommitType.__new__.__defaults__ = ( None, None, '', None, None )
 TestObjectType = namedtuple( 'TestObjectType', 'oid' )
 
 
+class TestTreeType(list):
+    '''
+    A fake tree, that holds a list of entries and supports "name in tree"
+    '''
+    def __init__( self, entries, names ):
+        super( TestTreeType, self ).__init__( entries )
+        self.names = names
+
+    def __contains__( self, name ):
+        return name in self.names
+
+
 def StubOutConstructor( mox, cls, func=None ):
     '''
     Mocks out the constructor of a class then hides the mock so there's no
@@ -0,0 +1,54 @@
+
+from ..docpool import DocumentPool
+from .defs import BaseTest
+
+
+class DocumentPoolTests(BaseTest):
+    '''
+    Tests the DocumentPool class
+    '''
+
+    def testOpensOnMiss( self ):
+        '''
+        Testing db.DocumentPool opens documents that aren't in the pool
+        '''
+        opener = self.mox.CreateMockAnything()
+        opener().AndReturn( 'doc' )
+        self.mox.ReplayAll()
+
+        pool = DocumentPool()
+        self.assertEqual( 'doc', pool.Get( 'path', opener ) )
+        self.assertEqual( 'doc', pool.Get( 'path', opener ) )
+
+        self.mox.VerifyAll()
+        stats = pool.Stats()
+        self.assertEqual( 1, stats[ 'hits' ] )
+        self.assertEqual( 1, stats[ 'misses' ] )
+
+    def testKeyedByPath( self ):
+        '''
+        Testing db.DocumentPool keeps documents seperate by path
+        '''
+        pool = DocumentPool()
+        self.assertEqual( 'one', pool.Get( 'pathOne', lambda: 'one' ) )
+        self.assertEqual( 'two', pool.Get( 'pathTwo', lambda: 'two' ) )
+        self.assertEqual( 'one', pool.Get( 'pathOne', lambda: 'other' ) )
+
+    def testMaxSize( self ):
+        '''
+        Testing db.DocumentPool evicts documents when full
+        '''
+        pool = DocumentPool( maxSize=1 )
+        pool.Get( 'pathOne', lambda: 'one' )
+        pool.Get( 'pathTwo', lambda: 'two' )
+        self.assertEqual( 1, len( pool ) )
+        self.assertEqual( 'new', pool.Get( 'pathOne', lambda: 'new' ) )
+
+    def testDiscard( self ):
+        '''
+        Testing db.DocumentPool.Discard
+        '''
+        pool = DocumentPool()
+        pool.Get( 'path', lambda: 'one' )
+        pool.Discard( 'path' )
+        self.assertEqual( 'two', pool.Get( 'path', lambda: 'two' ) )
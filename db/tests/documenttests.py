@@ -1,9 +1,12 @@
 
 import os
 import pygit2
+from .. import backends
 from .. import doc
 from .. import sectionindex
 from ..constants import SECTION_INDEX_FILENAME
+from ..errors import RefConflict
+from ..layout import ShardedPath
 from .defs import BaseTest
 
 
@@ -16,8 +19,8 @@ class DocumentTests(BaseTest):
         super( DocumentTests, self ).setUp()
         self.mox.StubOutClassWithMocks(doc, 'Section')
         self.mox.StubOutClassWithMocks(doc, 'Stylesheet')
-        self.mox.StubOutClassWithMocks(doc, 'Repository')
-        self.mox.StubOutWithMock(doc, 'init_repository')
+        self.mox.StubOutClassWithMocks(backends, 'Repository')
+        self.mox.StubOutWithMock(backends, 'init_repository')
         self.mox.StubOutWithMock(doc, 'CommitBlob')
         self.origRootPath = doc.DEFAULT_ROOT_PATH
         doc.DEFAULT_ROOT_PATH = 'testPath'
@@ -30,9 +33,7 @@ class DocumentTests(BaseTest):
         '''
         Creates a mock repository for use in tests
         '''
-        return doc.Repository(
-                os.path.join( 'testPath', 'name.git' )
-                )
+        return backends.Repository( ShardedPath( 'testPath', 'name' ) )
 
     def testCreate( self ):
         '''
@@ -43,14 +44,14 @@ class DocumentTests(BaseTest):
         mockRepo = self.mox.CreateMock( pygit2.Repository )
 
         # Set up expectations.  First init repository
-        doc.init_repository(
-                os.path.join( 'testPath', 'name.git' ), True
+        backends.init_repository(
+                ShardedPath( 'testPath', 'name' ), True
                 ).AndReturn( mockRepo )
         # Then original commit & create master reference
         doc.CommitBlob(
-                mockRepo, '', SECTION_INDEX_FILENAME, 'Initial commit'
+                mockRepo, '', SECTION_INDEX_FILENAME, 'Initial commit',
+                [], 'refs/heads/master'
                 ).AndReturn( 'commitId' )
-        mockRepo.create_reference( 'refs/heads/master', 'commitId' )
 
         # Now, run the test
         self.mox.ReplayAll()
@@ -75,9 +76,7 @@ class DocumentTests(BaseTest):
         Testing db.Document constructor with root path parameter
         '''
         testPath = os.path.join( '/', 'something', 'otherPath' )
-        doc.Repository(
-                os.path.join( testPath, 'name.git' )
-                )
+        backends.Repository( ShardedPath( testPath, 'name' ) )
 
         self.mox.ReplayAll()
         doc.Document( 'name', rootPath=testPath )
@@ -87,16 +86,16 @@ class DocumentTests(BaseTest):
         Testing db.Document constructor when repo is missing
         '''
         self.mox.UnsetStubs()
-        self.mox.StubOutWithMock(doc, 'Repository')
+        self.mox.StubOutWithMock(backends, 'Repository')
 
-        doc.Repository(
-                os.path.join( 'testPath', 'name.git' )
+        backends.Repository(
+                ShardedPath( 'testPath', 'name' )
                 ).AndRaise(KeyError)
 
         self.mox.ReplayAll()
 
         self.assertRaises(
-                doc.RepoNotFound,
+                backends.RepoNotFound,
                 lambda: doc.Document( 'name' )
                 )
 
@@ -109,10 +108,12 @@ class DocumentTests(BaseTest):
         self.mox.StubOutClassWithMocks( doc, 'SectionIndex' )
         mockRepo = self._createMockRepo()
 
+        mockSectionIndex = doc.SectionIndex( mockRepo )
         mockSection = doc.Section('sectionName', mockRepo, create=True)
+        mockSectionIndex.HasSection( 'sectionName' ).AndReturn( False )
+        mockSection.Exists().AndReturn( False )
         mockSection.Create(content='content')
 
-        mockSectionIndex = doc.SectionIndex( mockRepo )
         mockSectionIndex.AddSection( 'sectionName' )
         mockSectionIndex.Save( mockRepo )
 
@@ -125,6 +126,95 @@ class DocumentTests(BaseTest):
 
         self.assertEqual( mockSection, s )
 
+    def testAddSections( self ):
+        '''
+        Testing db.Document.AddSections saves the index once
+        '''
+        self.mox.StubOutClassWithMocks( doc, 'SectionIndex' )
+        mockRepo = self._createMockRepo()
+
+        mockSectionIndex = doc.SectionIndex( mockRepo )
+        mockSections = []
+        for name in ( 'one', 'two' ):
+            mockSection = doc.Section( name, mockRepo, create=True )
+            mockSectionIndex.HasSection( name ).AndReturn( False )
+            mockSection.Exists().AndReturn( False )
+            mockSections.append( mockSection )
+        for mockSection, name in zip( mockSections, ( 'one', 'two' ) ):
+            mockSection.Create( content=name + 'Content' )
+
+        mockSectionIndex.AddSection( 'one' )
+        mockSectionIndex.AddSection( 'two' )
+        mockSectionIndex.Save( mockRepo )
+
+        self.mox.ReplayAll()
+        d = doc.Document( 'name' )
+
+        s = d.AddSections( [
+            ( 'one', 'oneContent' ), ( 'two', 'twoContent' )
+            ] )
+
+        self.mox.VerifyAll()
+        self.assertEqual( mockSections, s )
+
+    def testAddSectionsExisting( self ):
+        '''
+        Testing db.Document.AddSections creates nothing if one of the
+        sections already exists
+        '''
+        self.mox.StubOutClassWithMocks( doc, 'SectionIndex' )
+        mockRepo = self._createMockRepo()
+
+        mockSectionIndex = doc.SectionIndex( mockRepo )
+        mockSection = doc.Section( 'one', mockRepo, create=True )
+        mockSectionIndex.HasSection( 'one' ).AndReturn( False )
+        mockSection.Exists().AndReturn( False )
+        doc.Section( 'two', mockRepo, create=True )
+        mockSectionIndex.HasSection( 'two' ).AndReturn( True )
+
+        self.mox.ReplayAll()
+        d = doc.Document( 'name' )
+
+        self.assertRaises(
+                RefConflict,
+                lambda: d.AddSections( [ ( 'one', '' ), ( 'two', '' ) ] )
+                )
+        self.mox.VerifyAll()
+
+    def testAddSectionsDuplicateNames( self ):
+        '''
+        Testing db.Document.AddSections rejects duplicate names
+        '''
+        self._createMockRepo()
+
+        self.mox.ReplayAll()
+        d = doc.Document( 'name' )
+
+        self.assertRaises(
+                ValueError,
+                lambda: d.AddSections( [ ( 'one', '' ), ( 'one', '' ) ] )
+                )
+        self.mox.VerifyAll()
+
+    def testRemoveSections( self ):
+        '''
+        Testing db.Document.RemoveSections saves the index once
+        '''
+        self.mox.StubOutClassWithMocks( doc, 'SectionIndex' )
+        mockRepo = self._createMockRepo()
+
+        mockSectionIndex = doc.SectionIndex( mockRepo )
+        mockSectionIndex.RemoveSection( 'one' )
+        mockSectionIndex.RemoveSection( 'two' )
+        mockSectionIndex.Save( mockRepo )
+
+        self.mox.ReplayAll()
+
+        d = doc.Document( 'name' )
+        d.RemoveSections( [ 'one', 'two' ] )
+
+        self.mox.VerifyAll()
+
     def testRemoveSection( self ):
         '''
         Testing db.Document.RemoveSection
@@ -143,6 +233,41 @@ class DocumentTests(BaseTest):
 
         self.mox.VerifyAll()
 
+    def testReorderSections( self ):
+        '''
+        Testing db.Document.ReorderSections
+        '''
+        self.mox.StubOutClassWithMocks( doc, 'SectionIndex' )
+        mockRepo = self._createMockRepo()
+
+        mockSectionIndex = doc.SectionIndex( mockRepo )
+        mockSectionIndex.Reorder( [ 'two', 'one' ] ).AndReturn( True )
+        mockSectionIndex.Save( mockRepo )
+
+        self.mox.ReplayAll()
+
+        d = doc.Document( 'name' )
+        d.ReorderSections( [ 'two', 'one' ] )
+
+        self.mox.VerifyAll()
+
+    def testReorderSectionsUnchanged( self ):
+        '''
+        Testing db.Document.ReorderSections doesn't save an unchanged order
+        '''
+        self.mox.StubOutClassWithMocks( doc, 'SectionIndex' )
+        mockRepo = self._createMockRepo()
+
+        mockSectionIndex = doc.SectionIndex( mockRepo )
+        mockSectionIndex.Reorder( [ 'one', 'two' ] ).AndReturn( False )
+
+        self.mox.ReplayAll()
+
+        d = doc.Document( 'name' )
+        d.ReorderSections( [ 'one', 'two' ] )
+
+        self.mox.VerifyAll()
+
     def testListSections( self ):
         '''
         Testing db.Document.Sections
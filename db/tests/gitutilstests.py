@@ -1,14 +1,62 @@
 
+import shutil
+import tempfile
 import pygit2
 from .. import gitutils
+from ..errors import RefConflict
 from .defs import BaseTest, TestCommitType
 
 
+class FakeRepo(object):
+    '''
+    A fake repository that just has some refs
+    '''
+    def __init__( self, path ):
+        self.path = path
+        self.refs = {}
+
+    def lookup_reference( self, name ):
+        return FakeRef( self, name )
+
+    def create_reference( self, name, oid, force=False ):
+        self.refs[ name ] = oid
+        return FakeRef( self, name )
+
+
+class FakeRef(object):
+    def __init__( self, repo, name ):
+        self.repo = repo
+        self.name = name
+        self.oid = repo.refs[ name ]
+
+    def delete( self ):
+        del self.repo.refs[ self.name ]
+
+
 class GitUtilsTests(BaseTest):
     '''
     Tests for gitutils.py
     '''
 
+    def setUp( self ):
+        super( GitUtilsTests, self ).setUp()
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        super( GitUtilsTests, self ).tearDown()
+        shutil.rmtree( self.tempDir )
+
+    def testOidHex( self ):
+        '''
+        Tests converting the different forms of oid to hex
+        '''
+        hexOid = '0123456789abcdef0123456789abcdef01234567'
+        self.assertEqual( hexOid, gitutils.OidHex( hexOid ) )
+        self.assertEqual(
+                hexOid, gitutils.OidHex( hexOid.decode( 'hex' ) )
+                )
+        self.assertEqual( hexOid, gitutils.OidHex( pygit2.Oid( hex=hexOid ) ) )
+
     def testCommitBlob_Initial( self ):
         '''
         Tests committing initial blob
@@ -33,6 +81,110 @@ class GitUtilsTests(BaseTest):
         '''
         self.doCommitTest( True, True )
 
+    def testFormatAndParseMetadata( self ):
+        '''
+        Tests metadata can be stored in & read from commit messages
+        '''
+        message = gitutils.FormatMessage(
+                'A summary', { 'Size': 10, 'Preview': 'Some: content' }
+                )
+        self.assertEqual(
+                'A summary\n\nPreview: Some: content\nSize: 10', message
+                )
+        self.assertEqual(
+                { 'Size': '10', 'Preview': 'Some: content' },
+                gitutils.ParseMetadata( message )
+                )
+
+    def testParseMissingMetadata( self ):
+        '''
+        Tests parsing messages without any metadata
+        '''
+        self.assertEqual( {}, gitutils.ParseMetadata( 'Updating content' ) )
+
+    def testUpdateRef( self ):
+        '''
+        Tests UpdateRef only moves a ref that points where we expect
+        '''
+        repo = FakeRepo( self.tempDir )
+        gitutils.UpdateRef( repo, 'ref', 'one', None )
+        gitutils.UpdateRef( repo, 'ref', 'two', 'one' )
+        self.assertEqual( { 'ref': 'two' }, repo.refs )
+        self.assertRaises(
+                RefConflict,
+                lambda: gitutils.UpdateRef( repo, 'ref', 'three', 'one' )
+                )
+        self.assertRaises(
+                RefConflict,
+                lambda: gitutils.UpdateRef( repo, 'ref', 'three', None )
+                )
+        self.assertEqual( { 'ref': 'two' }, repo.refs )
+
+    def testDeleteRef( self ):
+        '''
+        Tests DeleteRef only deletes a ref that points where we expect
+        '''
+        repo = FakeRepo( self.tempDir )
+        repo.refs[ 'ref' ] = 'two'
+        self.assertRaises(
+                RefConflict,
+                lambda: gitutils.DeleteRef( repo, 'ref', 'one' )
+                )
+        gitutils.DeleteRef( repo, 'ref', 'two' )
+        self.assertEqual( {}, repo.refs )
+
+    def testWriteTree( self ):
+        '''
+        Tests WriteTree keeps unchanged files & subtrees from the base tree
+        '''
+        repo = pygit2.init_repository( self.tempDir, True )
+        blob = repo.create_blob
+        base = repo[ gitutils.WriteTree( repo, None, {
+            'file': blob( 'file' ),
+            'same/a': blob( 'a' ),
+            'changed/b': blob( 'b' ),
+            } ) ]
+        tree = repo[ gitutils.WriteTree( repo, base, {
+            'changed/c': blob( 'c' ),
+            'new/d/e': blob( 'e' ),
+            } ) ]
+        self.assertEqual(
+                [ 'changed', 'file', 'new', 'same' ],
+                sorted( entry.name for entry in tree )
+                )
+        self.assertEqual( base[ 'same' ].oid, tree[ 'same' ].oid )
+        changed = repo[ tree[ 'changed' ].oid ]
+        self.assertEqual( [ 'b', 'c' ], [ entry.name for entry in changed ] )
+        self.assertTrue( 'new/d/e' in tree )
+        self.assertRaises(
+                ValueError,
+                lambda: gitutils.WriteTree( repo, None, { 'a/': 'oid' } )
+                )
+
+    def testCommitTree( self ):
+        '''
+        Tests CommitTree writes several files in one commit, on top of the
+        first parents tree
+        '''
+        repo = pygit2.init_repository( self.tempDir, True )
+        first = repo[ gitutils.CommitTree(
+            repo, { 'index': 'one', 'sections/one': 'One' }, 'first'
+            ) ]
+        second = repo[ gitutils.CommitTree(
+            repo,
+            { 'index': 'one\ntwo', 'sections/two': 'Two' },
+            'second',
+            [ first ]
+            ) ]
+        self.assertEqual( [ first.oid ], [ p.oid for p in second.parents ] )
+        self.assertEqual( 'second', second.message )
+        for path, data in (
+                ( 'index', 'one\ntwo' ),
+                ( 'sections/one', 'One' ),
+                ( 'sections/two', 'Two' ),
+                ):
+            self.assertEqual( data, repo[ second.tree[ path ].oid ].data )
+
     def doCommitTest( self, parents, updateRef ):
         '''
         Does a test of commit
@@ -76,15 +228,22 @@ class GitUtilsTests(BaseTest):
         else:
             mockRepo.TreeBuilder().AndReturn( mockBuilder )
 
-        mockBuilder.insert( name, 'blob', 0 )
+        mockBuilder.insert( name, 'blob', pygit2.GIT_FILEMODE_BLOB )
         mockBuilder.write().AndReturn( 'treeOid' )
 
         mockRepo.create_commit(
-                testUpdateRef if updateRef else None,
-                signature, signature, message, 'treeOid',
+                None, signature, signature, message, 'treeOid',
                 [ 'oid0', 'oid1' ] if parents else []
                 ).AndReturn( 'commitId' )
 
+        # The ref should be moved from the first parent to the new commit
+        self.mox.StubOutWithMock( gitutils, 'UpdateRef' )
+        if updateRef:
+            gitutils.UpdateRef(
+                    mockRepo, testUpdateRef, 'commitId',
+                    'oid0' if parents else None
+                    )
+
         # Set up additional arguments for the test
         otherArgs = {}
         if parents:
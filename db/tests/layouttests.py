@@ -0,0 +1,92 @@
+
+import os
+import shutil
+import tempfile
+from .. import layout
+from .. import migrate
+from .defs import BaseTest
+
+
+class LayoutTests(BaseTest):
+    '''
+    Tests the on disk layout functions
+    '''
+
+    def setUp( self ):
+        super( LayoutTests, self ).setUp()
+        self.rootPath = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        super( LayoutTests, self ).tearDown()
+        shutil.rmtree( self.rootPath )
+
+    def _MakeFlat( self, name ):
+        os.mkdir( layout.FlatPath( self.rootPath, name ) )
+
+    def testShardedPath( self ):
+        '''
+        Testing db.layout.ShardedPath
+        '''
+        # sha1( 'name' ) = 6ae999552a0d2dca14d62e2bc8b764d377b1dd6c
+        self.assertEqual(
+                os.path.join( 'root', '6a', 'e9', 'name.git' ),
+                layout.ShardedPath( 'root', 'name' )
+                )
+        self.assertEqual(
+                layout.ShardedPath( 'root', 'name' ),
+                layout.ShardedPath( 'root', u'name' )
+                )
+
+    def testResolveNewDocument( self ):
+        '''
+        Testing db.layout.ResolvePath uses the sharded path for new documents
+        '''
+        self.assertEqual(
+                layout.ShardedPath( self.rootPath, 'name' ),
+                layout.ResolvePath( self.rootPath, 'name' )
+                )
+
+    def testResolveFlatDocument( self ):
+        '''
+        Testing db.layout.ResolvePath finds unmigrated documents
+        '''
+        self._MakeFlat( 'name' )
+        self.assertEqual(
+                layout.FlatPath( self.rootPath, 'name' ),
+                layout.ResolvePath( self.rootPath, 'name' )
+                )
+
+    def testMigration( self ):
+        '''
+        Testing db.migrate moves documents and keeps old paths working until
+        the migration is finished
+        '''
+        for name in ( 'one', 'two' ):
+            self._MakeFlat( name )
+
+        self.assertEqual( 2, migrate.MigrateToShardedLayout( self.rootPath ) )
+        for name in ( 'one', 'two' ):
+            flat = layout.FlatPath( self.rootPath, name )
+            sharded = layout.ShardedPath( self.rootPath, name )
+            self.assertTrue( os.path.isdir( sharded ) )
+            self.assertTrue( os.path.islink( flat ) )
+            self.assertEqual(
+                    os.path.realpath( sharded ), os.path.realpath( flat )
+                    )
+            self.assertEqual( sharded, layout.ResolvePath( self.rootPath, name ) )
+
+        self.assertEqual(
+                {
+                    'one': layout.ShardedPath( self.rootPath, 'one' ),
+                    'two': layout.ShardedPath( self.rootPath, 'two' ),
+                    },
+                layout.ListDocuments( self.rootPath )
+                )
+
+        # Running again should be a no-op
+        self.assertEqual( 0, migrate.MigrateToShardedLayout( self.rootPath ) )
+
+        self.assertEqual( 2, migrate.FinishMigration( self.rootPath ) )
+        for name in ( 'one', 'two' ):
+            flat = layout.FlatPath( self.rootPath, name )
+            self.assertFalse( os.path.lexists( flat ) )
@@ -0,0 +1,126 @@
+
+from .. import lrucache
+from .defs import BaseTest
+
+
+class LRUCacheTests(BaseTest):
+    '''
+    Tests the LRUCache class
+    '''
+
+    def setUp( self ):
+        super( LRUCacheTests, self ).setUp()
+        self.mox.StubOutWithMock( lrucache.time, 'time' )
+
+    def testGetAndPut( self ):
+        '''
+        Testing db.LRUCache Get & Put
+        '''
+        lrucache.time.time().MultipleTimes().AndReturn( 100 )
+        self.mox.ReplayAll()
+
+        cache = lrucache.LRUCache( 10 )
+        self.assertEqual( None, cache.Get( 'key' ) )
+        self.assertEqual( 'default', cache.Get( 'key', 'default' ) )
+        cache.Put( 'key', 'value' )
+        self.assertEqual( 'value', cache.Get( 'key' ) )
+
+        stats = cache.Stats()
+        self.assertEqual( 1, stats[ 'hits' ] )
+        self.assertEqual( 2, stats[ 'misses' ] )
+        self.assertEqual( 1, stats[ 'size' ] )
+
+    def testEviction( self ):
+        '''
+        Testing db.LRUCache evicts the least recently used item
+        '''
+        lrucache.time.time().MultipleTimes().AndReturn( 100 )
+        self.mox.ReplayAll()
+
+        cache = lrucache.LRUCache( 2 )
+        cache.Put( 'one', 1 )
+        cache.Put( 'two', 2 )
+        # Use one, so two is the oldest
+        cache.Get( 'one' )
+        cache.Put( 'three', 3 )
+
+        self.assertTrue( 'one' in cache )
+        self.assertFalse( 'two' in cache )
+        self.assertTrue( 'three' in cache )
+        self.assertEqual( 1, cache.Stats()[ 'evictions' ] )
+
+    def testExpiry( self ):
+        '''
+        Testing db.LRUCache expires items that haven't been used
+        '''
+        lrucache.time.time().AndReturn( 100 )
+        lrucache.time.time().AndReturn( 105 )
+        lrucache.time.time().AndReturn( 116 )
+        self.mox.ReplayAll()
+
+        cache = lrucache.LRUCache( 10, maxAge=10 )
+        cache.Put( 'key', 'value' )
+        self.assertEqual( 'value', cache.Get( 'key' ) )
+        self.assertEqual( None, cache.Get( 'key' ) )
+        self.assertEqual( 0, len( cache ) )
+        self.mox.VerifyAll()
+
+    def testSetDefault( self ):
+        '''
+        Testing db.LRUCache.SetDefault keeps existing items
+        '''
+        lrucache.time.time().MultipleTimes().AndReturn( 100 )
+        self.mox.ReplayAll()
+
+        cache = lrucache.LRUCache( 10 )
+        self.assertEqual( 'first', cache.SetDefault( 'key', 'first' ) )
+        self.assertEqual( 'first', cache.SetDefault( 'key', 'second' ) )
+        self.assertEqual( 0, cache.Stats()[ 'hits' ] )
+        self.assertEqual( 0, cache.Stats()[ 'misses' ] )
+
+    def testClear( self ):
+        '''
+        Testing db.LRUCache.Clear
+        '''
+        lrucache.time.time().MultipleTimes().AndReturn( 100 )
+        self.mox.ReplayAll()
+
+        cache = lrucache.LRUCache( 10 )
+        cache.Put( 'key', 'value' )
+        cache.Get( 'key' )
+        cache.Clear()
+        self.assertEqual( 0, len( cache ) )
+        self.assertEqual( 0, cache.Stats()[ 'hits' ] )
+
+    def testWeightEviction( self ):
+        '''
+        Testing db.LRUCache evicts items to stay under maxWeight
+        '''
+        lrucache.time.time().MultipleTimes().AndReturn( 100 )
+        self.mox.ReplayAll()
+
+        cache = lrucache.LRUCache( None, maxWeight=10, weigh=len )
+        cache.Put( 'one', 'aaaa' )
+        cache.Put( 'two', 'bbbb' )
+        self.assertEqual( 8, cache.weight )
+        cache.Put( 'three', 'cccc' )
+
+        self.assertFalse( 'one' in cache )
+        self.assertTrue( 'two' in cache )
+        self.assertTrue( 'three' in cache )
+        self.assertEqual( 8, cache.Stats()[ 'weight' ] )
+
+    def testOverweightItem( self ):
+        '''
+        Testing db.LRUCache doesn't store items heavier than maxWeight
+        '''
+        lrucache.time.time().MultipleTimes().AndReturn( 100 )
+        self.mox.ReplayAll()
+
+        cache = lrucache.LRUCache( None, maxWeight=10, weigh=len )
+        cache.Put( 'small', 'aaaa' )
+        cache.Put( 'big', 'b' * 11 )
+
+        self.assertTrue( 'small' in cache )
+        self.assertFalse( 'big' in cache )
+        self.assertEqual( 4, cache.weight )
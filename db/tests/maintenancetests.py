@@ -0,0 +1,168 @@
+import pygit2
+from .. import maintenance
+from ..constants import MASTER_REF, SECTION_REF_PREFIX
+from .defs import BaseTest, TestCommitType, TestObjectType
+from ..sectionindex import SectionIndexEntry
+from ..errors import RefConflict
+
+DAY = 24 * 60 * 60
+
+
+class FakeIndex(object):
+    def __init__( self, names ):
+        self.names = names
+
+    def CurrentSections( self ):
+        return [ SectionIndexEntry( name ) for name in self.names ]
+
+
+class MaintenanceTests(BaseTest):
+    '''
+    Tests the repository maintenance functions
+    '''
+
+    def setUp( self ):
+        super( MaintenanceTests, self ).setUp()
+        self.repo = self.mox.CreateMock( pygit2.Repository )
+        self.mox.StubOutWithMock( maintenance, 'SectionIndex' )
+        self.now = 100 * DAY
+
+    def _ExpectMaster( self, indexes ):
+        '''
+        Sets up the master history
+
+        Args:
+            indexes     A list of ( commit time, section names ) tuples for
+                        each master commit, newest first
+        '''
+        commits = []
+        parents = []
+        for commitTime, names in reversed( indexes ):
+            commit = TestCommitType(
+                    None, 'm{0}'.format( len( commits ) ), parents,
+                    None, commitTime
+                    )
+            commits.insert( 0, ( commit, names ) )
+            parents = [ commit ]
+        self.repo.lookup_reference( MASTER_REF ).AndReturn(
+                TestObjectType( 'master' )
+                )
+        self.repo[ 'master' ].AndReturn( commits[ 0 ][ 0 ] )
+        return commits
+
+    def _ExpectIndex( self, commit, names ):
+        maintenance.SectionIndex( self.repo, commit ).AndReturn(
+                FakeIndex( names )
+                )
+
+    def _ExpectSection( self, name, commitTime ):
+        refName = SECTION_REF_PREFIX + name
+        head = TestCommitType(
+                None, name + 'Oid', [], name + 'Hex', commitTime
+                )
+        self.repo.lookup_reference( refName ).AndReturn(
+                TestObjectType( name + 'Oid' )
+                )
+        self.repo[ name + 'Oid' ].AndReturn( head )
+        return head
+
+    def testFindOrphanedSections( self ):
+        '''
+        Testing FindOrphanedSections only returns sections that have been out
+        of the index and unedited for the grace period
+        '''
+        commits = self._ExpectMaster( [
+            # Recently removed
+            ( self.now - 1 * DAY, [ 'live' ] ),
+            # Current at the cutoff
+            ( self.now - 40 * DAY, [ 'live', 'recentlyRemoved' ] ),
+            # Before the cutoff, shouldn't be looked at
+            ( self.now - 50 * DAY, [ 'live', 'old', 'recentlyRemoved' ] ),
+            ] )
+        self._ExpectIndex( *commits[ 0 ] )
+        self._ExpectIndex( *commits[ 1 ] )
+        self.repo.listall_references().AndReturn( [
+            MASTER_REF,
+            SECTION_REF_PREFIX + 'live',
+            SECTION_REF_PREFIX + 'recentlyRemoved',
+            SECTION_REF_PREFIX + 'old',
+            SECTION_REF_PREFIX + 'recentlyEdited',
+            ] )
+        old = self._ExpectSection( 'old', self.now - 60 * DAY )
+        self._ExpectSection( 'recentlyEdited', self.now - 2 * DAY )
+        self.mox.ReplayAll()
+
+        orphans = maintenance.FindOrphanedSections(
+                self.repo, 30 * DAY, now=self.now
+                )
+        self.assertEqual( { 'old': old }, orphans )
+        self.mox.VerifyAll()
+
+    def _StubCollect( self ):
+        '''
+        Stubs out the functions CollectOrphanedSections uses
+        '''
+        self.mox.StubOutWithMock( maintenance, 'FindOrphanedSections' )
+        self.mox.StubOutWithMock( maintenance, 'ArchiveSections' )
+        self.mox.StubOutWithMock( maintenance, 'PackRefs' )
+        self.mox.StubOutWithMock( maintenance.gitutils, 'DeleteRef' )
+        self.oldHead = TestObjectType( 'oldOid' )
+
+    def testCollectDeletes( self ):
+        '''
+        Testing CollectOrphanedSections deletes orphans & packs refs
+        '''
+        self._StubCollect()
+        maintenance.FindOrphanedSections(
+                self.repo, 10, None
+                ).AndReturn( { 'old': self.oldHead } )
+        maintenance.gitutils.DeleteRef(
+                self.repo, SECTION_REF_PREFIX + 'old', 'oldOid'
+                )
+        maintenance.PackRefs( self.repo )
+        self.mox.ReplayAll()
+
+        collected = maintenance.CollectOrphanedSections(
+                self.repo, 10, archive=False
+                )
+        self.assertEqual( [ 'old' ], collected )
+        self.mox.VerifyAll()
+
+    def testCollectArchives( self ):
+        '''
+        Testing CollectOrphanedSections archives orphans before deleting them
+        '''
+        self._StubCollect()
+        maintenance.FindOrphanedSections(
+                self.repo, 10, None
+                ).AndReturn( { 'old': self.oldHead } )
+        maintenance.ArchiveSections( self.repo, { 'old': self.oldHead } )
+        maintenance.gitutils.DeleteRef(
+                self.repo, SECTION_REF_PREFIX + 'old', 'oldOid'
+                )
+        maintenance.PackRefs( self.repo )
+        self.mox.ReplayAll()
+
+        maintenance.CollectOrphanedSections( self.repo, 10 )
+        self.mox.VerifyAll()
+
+    def testCollectSkipsEdited( self ):
+        '''
+        Testing CollectOrphanedSections leaves sections that are edited while
+        it's collecting
+        '''
+        self._StubCollect()
+        maintenance.FindOrphanedSections(
+                self.repo, 10, None
+                ).AndReturn( { 'old': self.oldHead } )
+        maintenance.gitutils.DeleteRef(
+                self.repo, SECTION_REF_PREFIX + 'old', 'oldOid'
+                ).AndRaise( RefConflict() )
+        maintenance.PackRefs( self.repo )
+        self.mox.ReplayAll()
+
+        collected = maintenance.CollectOrphanedSections(
+                self.repo, 10, archive=False
+                )
+        self.assertEqual( [], collected )
+        self.mox.VerifyAll()
@@ -0,0 +1,170 @@
+
+import os
+import shutil
+import tempfile
+import mox
+from collections import namedtuple
+from .. import registry
+from ..backends import GitBackend
+from ..errors import RepoNotFound
+from .defs import BaseTest
+
+FakeDocument = namedtuple( 'FakeDocument', 'repo' )
+
+
+class DocumentRegistryTests(BaseTest):
+    '''
+    Tests the DocumentRegistry class
+    '''
+
+    def setUp( self ):
+        super( DocumentRegistryTests, self ).setUp()
+        self.rootPath = tempfile.mkdtemp()
+        for name in ( 'one.git', 'two.git', 'notADocument' ):
+            os.mkdir( os.path.join( self.rootPath, name ) )
+        self.doc = FakeDocument( 'repo' )
+
+    def _StubEngines( self ):
+        '''
+        Stubs out the document classes & storage engine detection
+        '''
+        self.mox.StubOutWithMock( registry, 'Document' )
+        self.mox.StubOutWithMock( registry, 'TreeDocument' )
+        self.mox.StubOutWithMock( registry, 'IsTreeDocument' )
+        self.mox.stubs.Set( registry, 'ENGINES', {
+            'refs': registry.Document,
+            'tree': registry.TreeDocument,
+            } )
+
+    def tearDown( self ):
+        super( DocumentRegistryTests, self ).tearDown()
+        shutil.rmtree( self.rootPath )
+
+    def testLoad( self ):
+        '''
+        Testing db.DocumentRegistry loads existing documents
+        '''
+        r = registry.DocumentRegistry( self.rootPath )
+        self.assertTrue( r.Exists( 'one' ) )
+        self.assertTrue( r.Exists( 'two' ) )
+        self.assertFalse( r.Exists( 'notADocument' ) )
+
+    def testLoadMissingRoot( self ):
+        '''
+        Testing db.DocumentRegistry handles a missing root path
+        '''
+        r = registry.DocumentRegistry(
+                os.path.join( self.rootPath, 'missing' )
+                )
+        self.assertFalse( r.Exists( 'one' ) )
+
+    def testOpenKnown( self ):
+        '''
+        Testing db.DocumentRegistry.Open with a known document
+        '''
+        self._StubEngines()
+        registry.Document(
+                'one', rootPath=self.rootPath,
+                backend=mox.IsA( GitBackend )
+                ).AndReturn( self.doc )
+        registry.IsTreeDocument( 'repo' ).AndReturn( False )
+
+        self.mox.ReplayAll()
+        r = registry.DocumentRegistry( self.rootPath )
+        self.assertEqual( self.doc, r.Open( 'one' ) )
+        self.mox.VerifyAll()
+
+    def testOpenKnownTree( self ):
+        '''
+        Testing db.DocumentRegistry.Open with a single tree document
+        '''
+        self._StubEngines()
+        registry.Document(
+                'one', rootPath=self.rootPath,
+                backend=mox.IsA( GitBackend )
+                ).AndReturn( self.doc )
+        registry.IsTreeDocument( 'repo' ).AndReturn( True )
+        registry.TreeDocument( 'one', repo='repo' ).AndReturn( 'treeDoc' )
+
+        self.mox.ReplayAll()
+        r = registry.DocumentRegistry( self.rootPath, engine='refs' )
+        self.assertEqual( 'treeDoc', r.Open( 'one' ) )
+        self.mox.VerifyAll()
+
+    def testOpenCreates( self ):
+        '''
+        Testing db.DocumentRegistry.Open creates unknown documents
+        '''
+        self._StubEngines()
+        registry.Document(
+                'new', create=True, rootPath=self.rootPath,
+                backend=mox.IsA( GitBackend )
+                ).AndReturn( 'doc' )
+
+        self.mox.ReplayAll()
+        r = registry.DocumentRegistry( self.rootPath )
+        self.assertEqual( 'doc', r.Open( 'new' ) )
+        self.assertTrue( r.Exists( 'new' ) )
+        self.mox.VerifyAll()
+
+    def testCreateWithEngine( self ):
+        '''
+        Testing db.DocumentRegistry creates documents with its engine
+        '''
+        self._StubEngines()
+        registry.TreeDocument(
+                'new', create=True, rootPath=self.rootPath,
+                backend=mox.IsA( GitBackend )
+                ).AndReturn( 'treeDoc' )
+
+        self.mox.ReplayAll()
+        r = registry.DocumentRegistry( self.rootPath, engine='tree' )
+        self.assertEqual( 'treeDoc', r.Open( 'new' ) )
+        self.mox.VerifyAll()
+
+    def testUnknownEngine( self ):
+        '''
+        Testing db.DocumentRegistry rejects unknown storage engines
+        '''
+        self.assertRaises(
+                ValueError,
+                lambda: registry.DocumentRegistry( self.rootPath, 'nope' )
+                )
+
+    def testOpenCreatedElsewhere( self ):
+        '''
+        Testing db.DocumentRegistry.Open doesn't create documents that were
+        created after the registry was loaded
+        '''
+        self._StubEngines()
+        registry.Document(
+                'three', rootPath=self.rootPath,
+                backend=mox.IsA( GitBackend )
+                ).AndReturn( self.doc )
+        registry.IsTreeDocument( 'repo' ).AndReturn( False )
+
+        self.mox.ReplayAll()
+        r = registry.DocumentRegistry( self.rootPath )
+        os.mkdir( os.path.join( self.rootPath, 'three.git' ) )
+        self.assertEqual( self.doc, r.Open( 'three' ) )
+        self.mox.VerifyAll()
+
+    def testOpenRemoved( self ):
+        '''
+        Testing db.DocumentRegistry.Open recreates removed documents
+        '''
+        self._StubEngines()
+        registry.Document(
+                'one', rootPath=self.rootPath,
+                backend=mox.IsA( GitBackend )
+                ).AndRaise( RepoNotFound )
+        registry.Document(
+                'one', create=True, rootPath=self.rootPath,
+                backend=mox.IsA( GitBackend )
+                ).AndReturn( 'doc' )
+
+        self.mox.ReplayAll()
+        r = registry.DocumentRegistry( self.rootPath )
+        shutil.rmtree( os.path.join( self.rootPath, 'one.git' ) )
+        self.assertEqual( 'doc', r.Open( 'one' ) )
+        self.mox.VerifyAll()
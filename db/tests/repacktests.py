@@ -0,0 +1,105 @@
+from .. import repack
+from .defs import BaseTest
+
+
+class RepackSchedulerTests(BaseTest):
+    '''
+    Tests the RepackScheduler
+    '''
+
+    def setUp( self ):
+        super( RepackSchedulerTests, self ).setUp()
+        self.mox.StubOutWithMock( repack.time, 'time' )
+        self.mox.StubOutWithMock( repack.RepackScheduler, 'Start' )
+        self.mox.StubOutWithMock( repack.RepackScheduler, '_StartRepack' )
+        self.scheduler = repack.RepackScheduler(
+                threshold=6, idleTime=10, maxConcurrent=1
+                )
+
+    def testDueRepos( self ):
+        '''
+        Testing RepackScheduler.DueRepos only returns idle repos that have
+        written enough objects
+        '''
+        repack.time.time().MultipleTimes().AndReturn( 100 )
+        repack.RepackScheduler.Start().MultipleTimes()
+        self.mox.ReplayAll()
+
+        for i in range( 3 ):
+            self.scheduler.NoteWrite( 'busy' )
+        self.scheduler.NoteWrite( 'quiet' )
+
+        self.assertEqual( [], self.scheduler.DueRepos( 105 ) )
+        self.assertEqual( [ 'busy' ], self.scheduler.DueRepos( 110 ) )
+        self.assertEqual(
+                { 'busy': 9, 'quiet': 3 },
+                self.scheduler.Stats()[ 'pending' ]
+                )
+
+    def testRunPendingConcurrency( self ):
+        '''
+        Testing RepackScheduler.RunPending doesn't run more repacks than it
+        has slots for
+        '''
+        repack.time.time().MultipleTimes().AndReturn( 100 )
+        repack.RepackScheduler.Start().MultipleTimes()
+        self.scheduler._StartRepack( 'one' )
+        self.mox.ReplayAll()
+
+        self.scheduler.NoteWrite( 'one', 12 )
+        self.scheduler.NoteWrite( 'two', 6 )
+        self.assertEqual( [ 'one' ], self.scheduler.RunPending( 200 ) )
+        # two has to wait for the slot, and one is already running
+        self.assertEqual( [], self.scheduler.RunPending( 200 ) )
+        self.assertEqual( [ 'one' ], self.scheduler.Stats()[ 'running' ] )
+        self.mox.VerifyAll()
+
+    def testRepackReleasesSlot( self ):
+        '''
+        Testing a finished repack is recorded and frees its slot
+        '''
+        self.mox.StubOutWithMock( repack, 'Repack' )
+        repack.time.time().MultipleTimes().AndReturn( 100 )
+        repack.RepackScheduler.Start().MultipleTimes()
+        self.scheduler._StartRepack( 'one' )
+        repack.Repack( 'one' ).AndReturn( 'result' )
+        self.scheduler._StartRepack( 'two' )
+        self.mox.ReplayAll()
+
+        self.scheduler.NoteWrite( 'one', 12 )
+        self.scheduler.NoteWrite( 'two', 6 )
+        self.scheduler.RunPending( 200 )
+        self.scheduler._DoRepack( 'one' )
+        self.assertEqual( [ 'two' ], self.scheduler.RunPending( 200 ) )
+        self.assertEqual( [ 'result' ], self.scheduler.Stats()[ 'history' ] )
+        self.mox.VerifyAll()
+
+    def testCountObjects( self ):
+        '''
+        Testing CountObjects parses the git count-objects output
+        '''
+        self.mox.StubOutWithMock( repack, 'RunGit' )
+        repack.RunGit( 'path', 'count-objects', '-v' ).AndReturn(
+                'count: 12\nsize: 48\nin-pack: 3\npacks: 1\nsize-pack: 2\n'
+                )
+        self.mox.ReplayAll()
+
+        self.assertEqual( {
+            'count': 12, 'size': 48, 'in-pack': 3, 'packs': 1, 'size-pack': 2
+            }, repack.CountObjects( 'path' ) )
+
+    def testRunGit( self ):
+        '''
+        Testing RunGit runs git under nice, without a preexec_fn
+        '''
+        self.mox.StubOutWithMock( repack.subprocess, 'check_output' )
+        repack.subprocess.check_output( [
+            'nice', '-n', str( repack.REPACK_NICENESS ),
+            'git', '--git-dir', 'path', 'count-objects', '-v'
+            ] ).AndReturn( 'output' )
+        self.mox.ReplayAll()
+
+        self.assertEqual(
+                'output', repack.RunGit( 'path', 'count-objects', '-v' )
+                )
+        self.mox.VerifyAll()
@@ -0,0 +1,104 @@
+import pygit2
+from .. import retention
+from .defs import BaseTest, TestCommitType, TestObjectType
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+def MakeCommit( name, commitTime, parents=[] ):
+    return TestCommitType(
+            TestObjectType( name + 'Tree' ), name, parents, name, commitTime,
+            name + 'Message'
+            )
+
+
+class RetentionTests(BaseTest):
+    '''
+    Tests the history retention policy
+    '''
+
+    def setUp( self ):
+        super( RetentionTests, self ).setUp()
+        self.now = 100 * DAY
+        self.policy = retention.RetentionPolicy.Parse( '1d:all,7d:1h,*:1d' )
+
+    def testParse( self ):
+        '''
+        Testing RetentionPolicy.Parse
+        '''
+        self.assertEqual(
+                [ ( DAY, None ), ( 7 * DAY, HOUR ), ( None, DAY ) ],
+                self.policy.rules
+                )
+        for invalid in ( '1d', '7d:1h,1d:all', '*:1d,1w:1d', '1x:all' ):
+            self.assertRaises(
+                    ValueError,
+                    lambda: retention.RetentionPolicy.Parse( invalid )
+                    )
+
+    def testSelect( self ):
+        '''
+        Testing RetentionPolicy.Select keeps everything recent, then one
+        revision per interval
+        '''
+        # Times relative to the start of the day 3 days ago, newest first
+        base = self.now - 3 * DAY
+        commits = [
+                MakeCommit( 'recent1', self.now - 60 ),
+                MakeCommit( 'recent2', self.now - 120 ),
+                MakeCommit( 'hourA1', base + 50 * 60 ),
+                MakeCommit( 'hourA2', base + 10 * 60 ),
+                MakeCommit( 'hourB', base - 10 * 60 ),
+                MakeCommit( 'oldDay1', self.now - 20 * DAY + 100 ),
+                MakeCommit( 'oldDay2', self.now - 20 * DAY + 50 ),
+                ]
+        kept = self.policy.Select( commits, self.now )
+        self.assertEqual(
+                [ 'recent1', 'recent2', 'hourA1', 'hourB', 'oldDay1' ],
+                [ c.oid for c in kept ]
+                )
+
+    def testSelectKeepsHead( self ):
+        '''
+        Testing RetentionPolicy.Select always keeps the current revision
+        '''
+        policy = retention.RetentionPolicy.Parse( '1d:all' )
+        commits = [
+                MakeCommit( 'head', self.now - 5 * DAY ),
+                MakeCommit( 'older', self.now - 6 * DAY ),
+                ]
+        self.assertEqual(
+                [ commits[ 0 ] ], policy.Select( commits, self.now )
+                )
+
+    def testThinBranch( self ):
+        '''
+        Testing ThinBranch rewrites the branch with the kept revisions
+        '''
+        # Same day as kept, but older so it's dropped
+        dropped = MakeCommit( 'dropped', self.now - 30 * DAY )
+        kept = MakeCommit( 'kept', self.now - 30 * DAY + 60, [ dropped ] )
+        head = MakeCommit( 'head', self.now - 60, [ kept ] )
+
+        self.mox.StubOutWithMock( retention, 'UpdateRef' )
+        repo = self.mox.CreateMock( pygit2.Repository )
+        repo.lookup_reference( 'refs/heads/sections/s' ).AndReturn(
+                TestObjectType( 'head' )
+                )
+        repo[ 'head' ].AndReturn( head )
+        repo.create_commit(
+                None, None, None, 'keptMessage', 'keptTree', []
+                ).AndReturn( 'newKept' )
+        repo.create_commit(
+                None, None, None, 'headMessage', 'headTree', [ 'newKept' ]
+                ).AndReturn( 'newHead' )
+        retention.UpdateRef(
+                repo, 'refs/heads/sections/s', 'newHead', 'head'
+                )
+        self.mox.ReplayAll()
+
+        self.assertEqual( 1, retention.ThinBranch(
+            repo, 'refs/heads/sections/s', self.policy, self.now
+            ) )
+        self.mox.VerifyAll()
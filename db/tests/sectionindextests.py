@@ -4,6 +4,7 @@ from .. import sectionindex
 from ..constants import SECTION_INDEX_FILENAME, MASTER_REF
 from .defs import BaseTest, TestCommitType, TestObjectType, TestBlobType
 from .defs import StubOutConstructor
+from ..errors import RefConflict
 
 
 class SectionIndexTests(BaseTest):
@@ -11,6 +12,14 @@ class SectionIndexTests(BaseTest):
     Tests the Section Index class
     '''
 
+    def setUp( self ):
+        super( SectionIndexTests, self ).setUp()
+        sectionindex._indexCache.Clear()
+
+    def tearDown( self ):
+        super( SectionIndexTests, self ).tearDown()
+        sectionindex._indexCache.Clear()
+
     def testConstruction( self ):
         '''
         Tests the construction of a SectionIndex
@@ -39,6 +48,45 @@ class SectionIndexTests(BaseTest):
 
         self.mox.VerifyAll()
 
+    def testConstructionFromCache( self ):
+        '''
+        Tests that constructing a SectionIndex for a master commit that has
+        already been parsed only looks up the master ref
+        '''
+        testCommit = TestCommitType(
+                { SECTION_INDEX_FILENAME : TestObjectType( 'indexOid' ) },
+                'unused', []
+                )
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        mockRef = TestObjectType( 'mockOid' )
+
+        # First time round we parse the data
+        mockRepo.lookup_reference( MASTER_REF ).AndReturn( mockRef )
+        mockRepo[ 'mockOid' ].AndReturn( testCommit )
+        mockRepo[ 'indexOid' ].AndReturn( TestBlobType( 'header\nfooter' ) )
+
+        # After that we should only look up the ref
+        mockRepo.lookup_reference( MASTER_REF ).AndReturn( mockRef )
+        mockRepo.lookup_reference( MASTER_REF ).AndReturn( mockRef )
+
+        self.mox.ReplayAll()
+
+        first = sectionindex.SectionIndex( mockRepo )
+        first.AddSection( 'extra' )
+        second = sectionindex.SectionIndex( mockRepo )
+        self.assertEqual( 'header\nfooter', second.GetIndexString() )
+        self.assertEqual( 1, second.GetSectionPosition( 'footer' ) )
+
+        # Modifying a cached index shouldn't affect the cache
+        second.SetSectionPosition( 'footer', 0 )
+        second.RemoveSection( 'header' )
+        third = sectionindex.SectionIndex( mockRepo )
+
+        self.mox.VerifyAll()
+        self.assertEqual( 'footer', second.GetIndexString() )
+        self.assertEqual( 'header\nfooter', third.GetIndexString() )
+        self.assertEqual( 0, third.GetSectionPosition( 'header' ) )
+
     def testProcessEmptyData( self ):
         '''
         Tests processing empty data
@@ -220,6 +268,56 @@ class SectionIndexTests(BaseTest):
                 index.CurrentSections()
                 )
 
+        # And that the positions are all correct
+        for position, name in enumerate( [ 1, 0, 3, 2, 4 ] ):
+            self.assertEqual( position, index.GetSectionPosition( str( name ) ) )
+
+    def testPositionsAfterRemoveAndAdd( self ):
+        '''
+        Tests section positions are kept up to date by RemoveSection and
+        AddSection
+        '''
+        StubOutConstructor( self.mox, sectionindex.SectionIndex )
+
+        index = sectionindex.SectionIndex()
+        index.ProcessData( 'header\nmiddle\nfooter' )
+
+        index.RemoveSection( 'header' )
+        self.assertEqual( 0, index.GetSectionPosition( 'middle' ) )
+        self.assertEqual( 1, index.GetSectionPosition( 'footer' ) )
+        self.assertRaises(
+                sectionindex.ContentNotFound,
+                lambda: index.GetSectionPosition( 'header' )
+                )
+
+        index.AddSection( 'header' )
+        self.assertEqual( 2, index.GetSectionPosition( 'header' ) )
+
+    def testReorder( self ):
+        '''
+        Tests Reorder
+        '''
+        StubOutConstructor( self.mox, sectionindex.SectionIndex )
+
+        index = sectionindex.SectionIndex()
+        index.ProcessData( 'header\nmiddle\nfooter' )
+
+        self.assertFalse( index.Reorder( [ 'header', 'middle', 'footer' ] ) )
+        self.assertTrue( index.Reorder( [ 'footer', 'header', 'middle' ] ) )
+        self.assertEqual( 'footer\nheader\nmiddle', index.GetIndexString() )
+        self.assertEqual( 0, index.GetSectionPosition( 'footer' ) )
+        self.assertEqual( 2, index.GetSectionPosition( 'middle' ) )
+
+        # Check invalid orders are rejected
+        for invalid in (
+                [ 'footer', 'header' ],
+                [ 'footer', 'header', 'header' ],
+                [ 'footer', 'header', 'middle', 'other' ],
+                [ 'footer', 'header', 'other' ],
+                ):
+            self.assertRaises( ValueError, lambda: index.Reorder( invalid ) )
+        self.assertEqual( 'footer\nheader\nmiddle', index.GetIndexString() )
+
     def testSave( self ):
         StubOutConstructor( self.mox, sectionindex.SectionIndex )
 
@@ -240,13 +338,84 @@ class SectionIndexTests(BaseTest):
                 'saving section index',
                 [ 'commitObject' ],
                 MASTER_REF
-                )
+                ).AndReturn( 'newOid' )
 
         self.mox.ReplayAll()
 
         index = sectionindex.SectionIndex()
+        index.ProcessData( '' )
+        index.Save( mockRepo )
+
+        self.mox.VerifyAll()
+        self.assertTrue( 'newOid' in sectionindex._indexCache )
+
+    def _ExpectLoad( self, mockRepo, headOid, data ):
+        '''
+        Sets up the calls to load the index from the head of master
+        '''
+        indexOid = TestObjectType( headOid + 'Index' )
+        commit = TestCommitType(
+                { SECTION_INDEX_FILENAME: indexOid }, headOid, []
+                )
+        mockRepo.lookup_reference( MASTER_REF ).AndReturn(
+                TestObjectType( headOid )
+                )
+        mockRepo[ headOid ].AndReturn( commit )
+        mockRepo[ headOid + 'Index' ].AndReturn( TestBlobType( data ) )
+        return commit
+
+    def testSaveRebases( self ):
+        '''
+        Tests that saving after someone else has saved replays our changes
+        onto their index
+        '''
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        self.mox.StubOutWithMock( sectionindex, 'CommitBlob' )
+        base = self._ExpectLoad( mockRepo, 'base', 'one\ntwo' )
+        mockRepo[ 'base' ].AndReturn( base )
+        sectionindex.CommitBlob(
+                mockRepo, 'two\none\nnew', SECTION_INDEX_FILENAME,
+                'saving section index', [ base ], MASTER_REF
+                ).AndRaise( RefConflict() )
+        other = self._ExpectLoad( mockRepo, 'other', 'one\ntwo\nthree' )
+        mockRepo[ 'other' ].AndReturn( other )
+        sectionindex.CommitBlob(
+                mockRepo, 'two\none\nthree\nnew', SECTION_INDEX_FILENAME,
+                'saving section index', [ other ], MASTER_REF
+                ).AndReturn( 'newOid' )
+        self.mox.ReplayAll()
+
+        index = sectionindex.SectionIndex( mockRepo )
+        index.SetSectionPosition( 'two', 0 )
+        index.AddSection( 'new' )
         index.Save( mockRepo )
+        self.mox.VerifyAll()
+        self.assertEqual( 'newOid', index.baseOid )
+
+    def testRebaseConflict( self ):
+        '''
+        Tests that rebasing changes that no longer make sense raises a
+        RefConflict
+        '''
+        mockRepo = self.mox.CreateMock( pygit2.Repository )
+        self._ExpectLoad( mockRepo, 'base', 'one\ntwo' )
+        # Someone else removed the section we moved
+        self._ExpectLoad( mockRepo, 'other', 'one' )
+        # The second index comes from the cache
+        mockRepo.lookup_reference( MASTER_REF ).AndReturn(
+                TestObjectType( 'other' )
+                )
+        self._ExpectLoad( mockRepo, 'another', 'one\nnew' )
+        self.mox.ReplayAll()
+
+        index = sectionindex.SectionIndex( mockRepo )
+        index.SetSectionPosition( 'two', 0 )
+        self.assertRaises( RefConflict, lambda: index.Rebase( mockRepo ) )
 
+        # Or added the section we added
+        index = sectionindex.SectionIndex( mockRepo )
+        index.AddSection( 'new' )
+        self.assertRaises( RefConflict, lambda: index.Rebase( mockRepo ) )
         self.mox.VerifyAll()
 
     def testGetIndexString( self ):
@@ -2,7 +2,7 @@
 import unittest
 import os
 import shutil
-from ..doc import Document
+from ..doc import Document, DocumentPath
 
 
 class SubsystemTests(unittest.TestCase):
@@ -15,9 +15,7 @@ class SubsystemTests(unittest.TestCase):
         pass
 
     def tearDown(self):
-        shutil.rmtree( os.path.join( 'data',
-                self.TestDatabaseName + '.git'
-                ) )
+        shutil.rmtree( DocumentPath( self.TestDatabaseName ) )
         try:
             # If empty, remove the data dir
             os.unlink( 'data' )
@@ -0,0 +1,410 @@
+import mox
+import pygit2
+from .. import treestore
+from .. import convert
+from .. import sectionindex
+from .. import content
+from ..constants import DOCUMENT_REF, SECTION_INDEX_FILENAME
+from ..errors import ContentNotFound, RefConflict
+from .defs import BaseTest, TestCommitType, TestObjectType, TestBlobType
+
+
+class TreeStoreTests(BaseTest):
+    '''
+    Tests the single tree storage engine
+    '''
+
+    def setUp( self ):
+        super( TreeStoreTests, self ).setUp()
+        sectionindex._indexCache.Clear()
+        self.repo = self.mox.CreateMock( pygit2.Repository )
+        self.doc = treestore.TreeDocument( 'name', repo=self.repo )
+
+    def tearDown( self ):
+        super( TreeStoreTests, self ).tearDown()
+        sectionindex._indexCache.Clear()
+
+    def _MakeCommit( self, oid, files, parent=None, message='' ):
+        '''
+        Makes a fake document commit
+
+        Args:
+            oid     The oid of the commit
+            files   A dict mapping path -> blob oid
+            parent  The parent commit
+        '''
+        tree = dict(
+                ( path, TestObjectType( blob ) )
+                for path, blob in files.iteritems()
+                )
+        return TestCommitType(
+                tree, oid, [ parent ] if parent else [], 'hex' + oid,
+                0, message
+                )
+
+    def testCurrentSections( self ):
+        '''
+        Testing TreeDocument.CurrentSections reads everything from one commit
+        '''
+        head = self._MakeCommit( 'head', {
+            SECTION_INDEX_FILENAME: 'indexOid',
+            'sections/one': 'oneOid',
+            'sections/two': 'twoOid',
+            } )
+        self.repo.lookup_reference( DOCUMENT_REF ).AndReturn(
+                TestObjectType( 'head' )
+                )
+        self.repo[ 'head' ].AndReturn( head )
+        self.repo[ 'indexOid' ].AndReturn( TestBlobType( 'two\none' ) )
+        self.repo[ 'twoOid' ].AndReturn( TestBlobType( 'Two' ) )
+        self.repo[ 'oneOid' ].AndReturn( TestBlobType( 'One' ) )
+        self.mox.ReplayAll()
+
+        sections = [
+                ( i, s.name, s.CurrentContent() )
+                for i, s in self.doc.CurrentSections()
+                ]
+        self.assertEqual(
+                [ ( 0, 'two', 'Two' ), ( 1, 'one', 'One' ) ], sections
+                )
+        self.mox.VerifyAll()
+
+    def testMissingSection( self ):
+        '''
+        Testing TreeSection.CurrentContent with a section that doesn't exist
+        '''
+        head = self._MakeCommit(
+                'head', { SECTION_INDEX_FILENAME: 'indexOid' }
+                )
+        self.repo.lookup_reference( DOCUMENT_REF ).AndReturn(
+                TestObjectType( 'head' )
+                )
+        self.repo[ 'head' ].AndReturn( head )
+        self.mox.ReplayAll()
+
+        section = self.doc.FindSection( 'missing' )
+        self.assertRaises( ContentNotFound, section.CurrentContent )
+
+    def testRevisions( self ):
+        '''
+        Testing TreeSection.Revisions only returns commits that changed the
+        section
+        '''
+        created = self._MakeCommit( 'created', { 'sections/one': 'v1' } )
+        indexChange = self._MakeCommit(
+                'indexChange', { 'sections/one': 'v1', 'sectionIndex': 'i' },
+                created
+                )
+        updated = self._MakeCommit(
+                'updated', { 'sections/one': 'v2' }, indexChange
+                )
+        otherChange = self._MakeCommit(
+                'otherChange', { 'sections/one': 'v2', 'sections/two': 't' },
+                updated
+                )
+        self.repo.lookup_reference( DOCUMENT_REF ).AndReturn(
+                TestObjectType( 'otherChange' )
+                )
+        self.repo[ 'otherChange' ].AndReturn( otherChange )
+        self.repo[ 'v2' ].AndReturn( TestBlobType( 'Version 2' ) )
+        self.repo[ 'v1' ].AndReturn( TestBlobType( 'Version 1' ) )
+        self.mox.ReplayAll()
+
+        section = self.doc.FindSection( 'one' )
+        self.assertEqual(
+                [
+                    ( 'hexupdated', 'Version 2' ),
+                    ( 'hexcreated', 'Version 1' )
+                ],
+                list( section.Revisions() )
+                )
+        self.mox.VerifyAll()
+
+    def testSetContent( self ):
+        '''
+        Testing TreeSection.SetContent commits to the document branch
+        '''
+        head = self._MakeCommit( 'head', { 'sections/one': 'oneOid' } )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.doc.Commit(
+                { 'sections/one': 'content' },
+                treestore.Content._CommitMessage(
+                    'Updating content', 'content', { 'Path': 'sections/one' }
+                    ),
+                None,
+                head
+                ).AndReturn( 'newHead' )
+        self.mox.ReplayAll()
+
+        section = self.doc.FindSection( 'one' )
+        section.SetContent( 'content' )
+        self.assertEqual( 'newHead', section._GetHeadCommit() )
+        self.mox.VerifyAll()
+
+    def testSetContentCoalesces( self ):
+        '''
+        Testing TreeSection.SetContent replaces the head commit if it was a
+        recent edit of the same section by the same session
+        '''
+        metadata = { 'Path': 'sections/one', 'Session': 'session' }
+        parent = self._MakeCommit( 'parent', {} )
+        head = TestCommitType(
+                { 'sections/one': TestObjectType( 'oneOid' ) },
+                'head', [ parent ], 'hexhead', 990,
+                treestore.Content._CommitMessage( 'Updating', 'x', metadata )
+                )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.mox.StubOutWithMock( content.time, 'time' )
+        content.time.time().AndReturn( 1000 )
+        self.doc.HeadCommit().AndReturn( head )
+        self.doc.Commit(
+                { 'sections/one': 'content' },
+                treestore.Content._CommitMessage(
+                    'Updating content', 'content', metadata
+                    ),
+                [ parent ],
+                head
+                ).AndReturn( 'newHead' )
+        self.mox.ReplayAll()
+
+        section = self.doc.FindSection( 'one' )
+        section.SetContent( 'content', session='session', coalesceWindow=30 )
+        self.mox.VerifyAll()
+
+    def testAddSections( self ):
+        '''
+        Testing TreeDocument.AddSections adds content & index in one commit
+        '''
+        head = self._MakeCommit(
+                'head', { SECTION_INDEX_FILENAME: 'indexOid' }
+                )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.repo[ 'indexOid' ].AndReturn( TestBlobType( 'existing' ) )
+        self.repo[ 'head' ].AndReturn( head )
+        self.doc.Commit(
+                {
+                    SECTION_INDEX_FILENAME: 'existing\none\ntwo',
+                    'sections/one': 'One',
+                    'sections/two': 'Two',
+                },
+                'Create 2 sections',
+                head=head
+                ).AndReturn( self._MakeCommit( 'newHead', {} ) )
+        self.mox.ReplayAll()
+
+        added = self.doc.AddSections( [ ( 'one', 'One' ), ( 'two', 'Two' ) ] )
+        self.assertEqual( [ 'one', 'two' ], [ s.name for s in added ] )
+        self.mox.VerifyAll()
+
+    def testReorderSections( self ):
+        '''
+        Testing TreeDocument.ReorderSections commits the new index
+        '''
+        head = self._MakeCommit(
+                'head', { SECTION_INDEX_FILENAME: 'indexOid' }
+                )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.repo[ 'indexOid' ].AndReturn( TestBlobType( 'one\ntwo' ) )
+        self.repo[ 'head' ].AndReturn( head )
+        self.doc.Commit(
+                { SECTION_INDEX_FILENAME: 'two\none' },
+                'saving section index',
+                head=head
+                ).AndReturn( self._MakeCommit( 'newHead', {} ) )
+        self.mox.ReplayAll()
+
+        self.doc.ReorderSections( [ 'two', 'one' ] )
+        self.mox.VerifyAll()
+
+    def testSaveIndexRebases( self ):
+        '''
+        Testing TreeDocument.SaveIndex replays the index changes onto a
+        commit made by someone else while we were saving
+        '''
+        head = self._MakeCommit(
+                'head', { SECTION_INDEX_FILENAME: 'indexOid' }
+                )
+        other = self._MakeCommit(
+                'other', { SECTION_INDEX_FILENAME: 'otherIndexOid' }, head
+                )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.repo[ 'indexOid' ].AndReturn( TestBlobType( 'one\ntwo' ) )
+        self.repo[ 'head' ].AndReturn( head )
+        self.doc.Commit(
+                { SECTION_INDEX_FILENAME: 'two\none' },
+                'saving section index',
+                head=head
+                ).AndRaise( RefConflict() )
+        # Someone else added a section
+        self.doc.HeadCommit().AndReturn( other )
+        self.repo[ 'otherIndexOid' ].AndReturn(
+                TestBlobType( 'one\ntwo\nthree' )
+                )
+        self.doc.Commit(
+                { SECTION_INDEX_FILENAME: 'two\none\nthree' },
+                'saving section index',
+                head=other
+                ).AndReturn( self._MakeCommit( 'newHead', {} ) )
+        self.mox.ReplayAll()
+
+        index = sectionindex.SectionIndex( self.repo, self.doc.HeadCommit() )
+        index.SetSectionPosition( 'two', 0 )
+        self.doc.SaveIndex( index )
+        self.mox.VerifyAll()
+
+    def testSetContentMissing( self ):
+        '''
+        Testing TreeSection.SetContent won't create a section
+        '''
+        head = self._MakeCommit( 'head', {} )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.mox.ReplayAll()
+
+        section = self.doc.FindSection( 'one' )
+        self.assertRaises(
+                ContentNotFound, lambda: section.SetContent( 'content' )
+                )
+        self.mox.VerifyAll()
+
+    def testSetContentRebases( self ):
+        '''
+        Testing TreeSection.SetContent goes on top of changes to other
+        content made while it was committing
+        '''
+        head = self._MakeCommit( 'head', { 'sections/one': 'v1' } )
+        other = self._MakeCommit(
+                'other', { 'sections/one': 'v1', 'sections/two': 't' }, head
+                )
+        message = treestore.Content._CommitMessage(
+                'Updating content', 'content', { 'Path': 'sections/one' }
+                )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.doc.Commit(
+                { 'sections/one': 'content' }, message, None, head
+                ).AndRaise( RefConflict() )
+        self.doc.HeadCommit().AndReturn( other )
+        self.doc.Commit(
+                { 'sections/one': 'content' }, message, None, other
+                ).AndReturn( 'newHead' )
+        self.mox.ReplayAll()
+
+        self.doc.FindSection( 'one' ).SetContent( 'content' )
+        self.mox.VerifyAll()
+
+    def testSetContentConflict( self ):
+        '''
+        Testing TreeSection.SetContent fails if someone else changed the same
+        content while it was committing
+        '''
+        head = self._MakeCommit( 'head', { 'sections/one': 'v1' } )
+        other = self._MakeCommit( 'other', { 'sections/one': 'v2' }, head )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.doc.Commit(
+                { 'sections/one': 'content' },
+                treestore.Content._CommitMessage(
+                    'Updating content', 'content', { 'Path': 'sections/one' }
+                    ),
+                None,
+                head
+                ).AndRaise( RefConflict() )
+        self.doc.HeadCommit().AndReturn( other )
+        self.mox.ReplayAll()
+
+        section = self.doc.FindSection( 'one' )
+        self.assertRaises(
+                RefConflict, lambda: section.SetContent( 'content' )
+                )
+        self.mox.VerifyAll()
+
+    def testUnitOfWork( self ):
+        '''
+        Testing a TreeUnitOfWork reads from one head, and writes content &
+        index changes in one commit
+        '''
+        head = self._MakeCommit( 'head', {
+            SECTION_INDEX_FILENAME: 'indexOid',
+            'sections/one': 'oneOid',
+            } )
+        newHead = self._MakeCommit( 'newHead', {} )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'SaveIndex' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.repo[ 'oneOid' ].AndReturn( TestBlobType( 'One' ) )
+        self.repo[ 'indexOid' ].AndReturn( TestBlobType( 'two\none' ) )
+        self.doc.SaveIndex(
+                mox.IsA( sectionindex.SectionIndex ),
+                { 'sections/one': 'New' },
+                treestore.Content._CommitMessage(
+                    'Updating content', 'New', { 'Path': 'sections/one' }
+                    )
+                ).AndReturn( newHead )
+        self.mox.ReplayAll()
+
+        work = self.doc.UnitOfWork()
+        section = work.FindSection( 'one' )
+        self.assertEqual( 'One', section.CurrentContent() )
+        section.SetContent( 'New' )
+        self.assertEqual( 1, section.GetPosition() )
+        section.SetPosition( 0 )
+        work.Commit()
+        self.assertEqual( newHead, section._GetHeadCommit() )
+        self.mox.VerifyAll()
+
+    def testUnitOfWorkContentOnly( self ):
+        '''
+        Testing a TreeUnitOfWork with a lone content change writes it with
+        SetContent, so it can be coalesced
+        '''
+        head = self._MakeCommit( 'head', { 'sections/one': 'oneOid' } )
+        self.mox.StubOutWithMock( self.doc, 'HeadCommit' )
+        self.mox.StubOutWithMock( self.doc, 'Commit' )
+        self.doc.HeadCommit().AndReturn( head )
+        self.doc.HeadCommit().AndReturn( head )
+        self.doc.Commit(
+                { 'sections/one': 'New' },
+                treestore.Content._CommitMessage(
+                    'Updating content', 'New', { 'Path': 'sections/one' }
+                    ),
+                None,
+                head
+                ).AndReturn( 'newHead' )
+        self.mox.ReplayAll()
+
+        work = self.doc.UnitOfWork()
+        work.FindSection( 'one' ).SetContent( 'New' )
+        work.Commit()
+        self.mox.VerifyAll()
+
+    def testMergeHistories( self ):
+        '''
+        Testing db.convert.MergeHistories orders by time, but keeps the order
+        of each history
+        '''
+        def Commit( name, commitTime ):
+            return TestCommitType( None, name, [], name, commitTime )
+
+        histories = {
+                'sectionIndex': [ Commit( 'i1', 1 ), Commit( 'i2', 5 ) ],
+                'sections/a': [ Commit( 'a1', 2 ), Commit( 'a2', 9 ) ],
+                # Clock went backwards, but b1 is still before b2
+                'sections/b': [ Commit( 'b1', 7 ), Commit( 'b2', 3 ) ],
+                }
+        merged = [
+                commit.oid
+                for path, commit in convert.MergeHistories( histories )
+                ]
+        self.assertEqual( [ 'i1', 'a1', 'i2', 'b1', 'b2', 'a2' ], merged )
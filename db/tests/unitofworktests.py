@@ -0,0 +1,149 @@
+import pygit2
+from .. import unitofwork
+from ..doc import Document
+from ..constants import SECTION_REF_PREFIX
+from ..errors import RefConflict
+from ..section import Section
+from ..sectionindex import SectionIndex
+from .defs import BaseTest
+
+
+class UnitOfWorkTests(BaseTest):
+    '''
+    Tests the UnitOfWork for documents stored one branch per section
+    '''
+
+    def setUp( self ):
+        super( UnitOfWorkTests, self ).setUp()
+        self.repo = self.mox.CreateMock( pygit2.Repository )
+        self.doc = self.mox.CreateMock( Document )
+        self.doc.repo = self.repo
+        self.index = self.mox.CreateMock( SectionIndex )
+        self.mox.StubOutWithMock( unitofwork, 'SectionIndex' )
+        self.mox.StubOutWithMock( Section, '_WriteContent' )
+        self.mox.StubOutWithMock( Section, 'Create' )
+
+    def testUpdateSection( self ):
+        '''
+        Testing the index & section are only loaded once, and the changes
+        are only written on commit
+        '''
+        unitofwork.SectionIndex( self.repo ).AndReturn( self.index )
+        self.doc.FindSection( 'one' ).AndReturn( Section( 'one', self.repo ) )
+        self.index.GetSectionPosition( 'one' ).AndReturn( 1 )
+        self.index.SetSectionPosition( 'one', 0 )
+        self.index.GetSectionPosition( 'one' ).AndReturn( 0 )
+        self.mox.ReplayAll()
+
+        work = unitofwork.UnitOfWork( self.doc )
+        section = work.FindSection( 'one' )
+        self.assertTrue( section is work.FindSection( 'one' ) )
+        self.assertEqual( 1, section.GetPosition() )
+        section.SetPosition( 0 )
+        self.assertEqual( 0, section.GetPosition() )
+        section.SetContent( 'content', session='s', coalesceWindow=30 )
+        self.assertEqual( 'content', section.CurrentContent() )
+        # Nothing should have been written yet
+        self.mox.VerifyAll()
+
+        self.mox.ResetAll()
+        Section._WriteContent( 'content', 's', 30 )
+        self.index.Save( self.repo )
+        self.mox.ReplayAll()
+
+        work.Commit()
+        self.mox.VerifyAll()
+
+    def testAddSections( self ):
+        '''
+        Testing added sections are created before the index is saved
+        '''
+        unitofwork.SectionIndex( self.repo ).AndReturn( self.index )
+        for name in ( 'one', 'two' ):
+            self.index.HasSection( name ).AndReturn( False )
+            self.doc.FindSection( name ).AndReturn(
+                    Section( name, self.repo )
+                    )
+            self.repo.lookup_reference(
+                    SECTION_REF_PREFIX + name
+                    ).AndRaise( KeyError )
+        for name in ( 'one', 'two' ):
+            self.index.AddSection( name )
+        self.index.GetSectionPosition( 'two' ).AndReturn( 5 )
+        for name in ( 'one', 'two' ):
+            self.repo.lookup_reference(
+                    SECTION_REF_PREFIX + name
+                    ).AndRaise( KeyError )
+        Section.Create( 'One' )
+        Section.Create( 'Two' )
+        self.index.Save( self.repo )
+        self.mox.ReplayAll()
+
+        work = unitofwork.UnitOfWork( self.doc )
+        added = work.AddSections( [ ( 'one', 'One' ), ( 'two', 'Two' ) ] )
+        self.assertEqual( 5, added[ 1 ].GetPosition() )
+        work.Commit()
+        self.mox.VerifyAll()
+
+    def testAddExistingSection( self ):
+        '''
+        Testing a section that already exists can't be added
+        '''
+        unitofwork.SectionIndex( self.repo ).AndReturn( self.index )
+        self.index.HasSection( 'one' ).AndReturn( False )
+        self.doc.FindSection( 'one' ).AndReturn( Section( 'one', self.repo ) )
+        self.repo.lookup_reference( SECTION_REF_PREFIX + 'one' ).AndReturn(
+                'ref'
+                )
+        self.mox.ReplayAll()
+
+        work = unitofwork.UnitOfWork( self.doc )
+        self.assertRaises(
+                RefConflict, lambda: work.AddSection( 'one', 'One' )
+                )
+        work.Commit()
+        self.mox.VerifyAll()
+
+    def testCommitCreatesNothingOnConflict( self ):
+        '''
+        Testing no sections are created if someone else created one of them
+        first
+        '''
+        unitofwork.SectionIndex( self.repo ).AndReturn( self.index )
+        for name in ( 'one', 'two' ):
+            self.index.HasSection( name ).AndReturn( False )
+            self.doc.FindSection( name ).AndReturn(
+                    Section( name, self.repo )
+                    )
+            self.repo.lookup_reference(
+                    SECTION_REF_PREFIX + name
+                    ).AndRaise( KeyError )
+        for name in ( 'one', 'two' ):
+            self.index.AddSection( name )
+        self.repo.lookup_reference( SECTION_REF_PREFIX + 'one' ).AndRaise(
+                KeyError
+                )
+        self.repo.lookup_reference( SECTION_REF_PREFIX + 'two' ).AndReturn(
+                'ref'
+                )
+        self.mox.ReplayAll()
+
+        work = unitofwork.UnitOfWork( self.doc )
+        work.AddSections( [ ( 'one', 'One' ), ( 'two', 'Two' ) ] )
+        self.assertRaises( RefConflict, work.Commit )
+        self.mox.VerifyAll()
+
+    def testCommitNothing( self ):
+        '''
+        Testing committing a unit of work without changes writes nothing
+        '''
+        unitofwork.SectionIndex( self.repo ).AndReturn( self.index )
+        self.index.GetSectionPosition( 'one' ).AndReturn( 1 )
+        self.doc.FindSection( 'one' ).AndReturn( Section( 'one', self.repo ) )
+        self.mox.ReplayAll()
+
+        work = unitofwork.UnitOfWork( self.doc )
+        self.assertEqual( 1, work.Index().GetSectionPosition( 'one' ) )
+        work.FindSection( 'one' )
+        work.Commit()
+        self.mox.VerifyAll()
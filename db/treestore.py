@@ -0,0 +1,683 @@
+'''
+An alternative storage engine, that keeps a whole document in a single tree
+on one branch:
+
+    sectionIndex        The section index
+    stylesheet          The stylesheet
+    sections/<name>     One file per section
+
+Every change is a single commit on the document branch, so reading the whole
+document is one ref lookup, one commit and a walk of its tree.  The history
+of a piece of content is the commits on the branch that changed its file.
+
+Documents stored one branch per section can be converted with db.convert
+'''
+
+from . import gitutils
+from .content import Content
+from .unitofwork import UnitOfWork
+from .sectionindex import SectionIndex, SAVE_ATTEMPTS
+from .blobcache import ReadBlob
+from .constants import DOCUMENT_REF, SECTION_INDEX_FILENAME
+from .constants import SECTIONS_DIRNAME, STYLESHEET_FILENAME
+from .errors import ContentNotFound, MasterNotFound
+from .errors import RefConflict
+from .backends import GitBackend
+from .doc import DocumentPath
+
+
+def IsTreeDocument( repo ):
+    '''
+    Checks if a repository holds a single tree document
+
+    Args:
+        repo    The repository to check
+    '''
+    try:
+        repo.lookup_reference( DOCUMENT_REF )
+    except KeyError:
+        return False
+    return True
+
+
+def PathOid( commit, path ):
+    '''
+    Gets the oid of a file in a document commit
+
+    Args:
+        commit  The commit
+        path    The path of the file
+    Returns:
+        The oid, or None if the file isn't there
+    '''
+    if path not in commit.tree:
+        return None
+    return commit.tree[ path ].oid
+
+
+def SectionPath( name ):
+    '''
+    Gets the path of a section file in a document tree
+
+    Args:
+        name    The name of the section
+    '''
+    return SECTIONS_DIRNAME + '/' + name
+
+
+class TreeContent(Content):
+    '''
+    Content stored as a file in a single tree document.
+
+    The revisions of the content are the commits on the document branch that
+    changed its file, so they're still identified by commit oid.
+    '''
+    ContentRefPrefix = ''
+
+    def __init__( self, name, doc, path, headCommit=None ):
+        '''
+        Constructor
+
+        Args:
+            name        The name of the content
+            doc         The TreeDocument the content is in
+            path        The path of the contents file in the document tree
+            headCommit  Optional document commit to read the content from.
+                        Defaults to the head of the document branch
+        '''
+        super( TreeContent, self ).__init__( name, doc.repo )
+        self.doc = doc
+        self.path = path
+        self._headCommit = headCommit
+        # All content shares the document branch
+        self._refName = DOCUMENT_REF
+
+    def _GetHeadCommit( self ):
+        '''
+        Returns the head commit of the document
+        '''
+        if not self._headCommit:
+            self._headCommit = self.doc.HeadCommit()
+        return self._headCommit
+
+    def Exists( self ):
+        '''
+        Checks if the contents file is in the document
+        '''
+        return self.path in self._GetHeadCommit().tree
+
+    def _BlobOid( self, commit ):
+        try:
+            return commit.tree[ self.path ].oid
+        except KeyError:
+            raise ContentNotFound()
+
+    def _WalkHistory( self, start=None ):
+        '''
+        Generator function that returns the commits that changed the content,
+        newest first.
+
+        Args:
+            start   The commit to start from.  Defaults to the head commit
+        '''
+        current = start or self._GetHeadCommit()
+        while self.path in current.tree:
+            oid = current.tree[ self.path ].oid
+            parent = current.parents[ 0 ] if current.parents else None
+            if parent is None or self.path not in parent.tree or \
+                    parent.tree[ self.path ].oid != oid:
+                yield current
+            if parent is None:
+                break
+            current = parent
+
+    def _LookupRevision( self, oid ):
+        '''
+        Looks up a commit in the history of this content.  Every commit of
+        the document has the contents file, so only those that changed it
+        count as its revisions
+
+        Args:
+            oid     The hex oid of the commit
+        Returns:
+            The commit object
+        Throws:
+            ContentNotFound if the commit isn't a revision of this content
+        '''
+        commit = super( TreeContent, self )._LookupRevision( oid )
+        if commit.parents and PathOid( commit.parents[ 0 ], self.path ) == \
+                PathOid( commit, self.path ):
+            raise ContentNotFound()
+        return commit
+
+    def RestoreRevision( self, oid ):
+        '''
+        Makes a previous revision the current content, by adding a new
+        revision with the same content.
+
+        Args:
+            oid     The hex oid of the revision to restore
+        Throws:
+            ContentNotFound if the revision isn't in this contents history
+        '''
+        head = self._GetHeadCommit()
+        commit = self._LookupRevision( oid )
+        blobOid = self._BlobOid( commit )
+        if blobOid == self._BlobOid( head ):
+            # Already the current content
+            return
+        if not self.repo.descendant_of( head.oid, commit.oid ):
+            raise ContentNotFound()
+        self.SetContent( ReadBlob( self.repo, blobOid ) )
+
+    def _CanCoalesce( self, head, session, window ):
+        '''
+        Checks if a new revision can replace the head commit, as with
+        Content._CanCoalesce.  The head must also be recorded as a change
+        to this content: commits replayed by db.convert have no Path, and
+        could belong to any content
+        '''
+        if not super( TreeContent, self )._CanCoalesce(
+                head, session, window
+                ):
+            return False
+        metadata = gitutils.ParseMetadata( head.message )
+        return metadata.get( 'Path' ) == self.path
+
+    def _WriteContent( self, newContent, session, coalesceWindow ):
+        '''
+        Writes a new version of the content.  Rapid edits from the same
+        session are coalesced as with Content.SetContent, as long as the
+        head commit of the document only changed this content.
+
+        If other content in the document has changed since this content was
+        read, the new revision goes on top of those changes.
+
+        Args:
+            newContent      The new content of the content
+            session         Optional id of the session making the change
+            coalesceWindow  The coalescing window in seconds
+        Throws:
+            ContentNotFound if the content doesn't exist.  Sections are only
+            created by AddSections
+            RefConflict if this content was changed by someone else since it
+            was read
+        '''
+        head = self.doc.HeadCommit()
+        # The commit the content was read from
+        base = self._headCommit or head
+        # The path is recorded so we know what a commit changed when
+        # coalescing
+        metadata = { 'Path': self.path }
+        if session:
+            metadata[ 'Session' ] = session
+        message = self._CommitMessage(
+                'Updating content', newContent, metadata
+                )
+        for attempt in range( SAVE_ATTEMPTS ):
+            if PathOid( head, self.path ) is None:
+                self._headCommit = None
+                raise ContentNotFound()
+            if PathOid( head, self.path ) != PathOid( base, self.path ):
+                # Someone else changed this content
+                self._headCommit = None
+                raise RefConflict( DOCUMENT_REF )
+            parents = None
+            if self._CanCoalesce( head, session, coalesceWindow ):
+                parents = head.parents
+            try:
+                self._headCommit = self.doc.Commit(
+                        { self.path: newContent }, message, parents, head
+                        )
+                return
+            except RefConflict:
+                head = self.doc.HeadCommit()
+        self._headCommit = None
+        raise RefConflict( DOCUMENT_REF )
+
+
+class TreeSection(TreeContent):
+    '''
+    A section in a single tree document
+    '''
+
+    def __init__( self, name, doc, headCommit=None ):
+        super( TreeSection, self ).__init__(
+                name, doc, SectionPath( name ), headCommit
+                )
+
+    def GetPosition( self ):
+        '''
+        Finds the current position of the section
+
+        Returns:
+            The position of this section
+        Throws:
+            ContentNotFound error if section not found in index
+        '''
+        if self.unit is not None:
+            index = self.unit.Index()
+        else:
+            index = SectionIndex( self.repo, self._GetHeadCommit() )
+        return index.GetSectionPosition( self.name )
+
+    def SetPosition( self, newPosition ):
+        '''
+        Sets the position of the section
+
+        Args:
+            newPosition     The new position of the section
+        Throws:
+            ContentNotFound error if the section isn't found in the index
+        '''
+        if self.unit is not None:
+            self.unit.Index().SetSectionPosition( self.name, newPosition )
+            self.unit.IndexChanged()
+            return
+        index = SectionIndex( self.repo, self.doc.HeadCommit() )
+        index.SetSectionPosition( self.name, newPosition )
+        self._headCommit = self.doc.SaveIndex( index )
+
+
+class TreeUnitOfWork(UnitOfWork):
+    '''
+    A unit of work on a single tree document.
+
+    Everything is read from the head commit at the start of the unit, and
+    all the changes are written in a single commit.
+    '''
+
+    def __init__( self, doc ):
+        super( TreeUnitOfWork, self ).__init__( doc )
+        self._head = None
+
+    def _Head( self ):
+        '''
+        Gets the head commit of the document, looking it up if needed
+        '''
+        if self._head is None:
+            self._head = self.doc.HeadCommit()
+        return self._head
+
+    def _LoadIndex( self ):
+        return SectionIndex( self.repo, self._Head() )
+
+    def _NewSection( self, name ):
+        return TreeSection( name, self.doc, self._Head() )
+
+    def _NewStylesheet( self ):
+        return TreeContent(
+                'stylesheet', self.doc, STYLESHEET_FILENAME, self._Head()
+                )
+
+    def Commit( self ):
+        '''
+        Writes all the changes made through this unit of work, in a single
+        commit.  A lone content change is written with
+        TreeContent.SetContent, so it can still be coalesced.
+
+        Throws:
+            RefConflict if someone else changed the same content
+        '''
+        if not self._changes and not self._indexChanged:
+            return
+        if len( self._changes ) == 1 and not self._created and \
+                not self._indexChanged:
+            content, change = self._changes.items()[ 0 ]
+            content._WriteContent( *change )
+            head = content._headCommit
+        else:
+            files = dict(
+                    ( content.path, newContent )
+                    for content, ( newContent, session, window )
+                    in self._changes.iteritems()
+                    )
+            message = self._CommitMessage()
+            if self._indexChanged:
+                head = self.doc.SaveIndex( self.Index(), files, message )
+            else:
+                head = self._CommitFiles( files, message )
+        self._changes.clear()
+        self._created.clear()
+        self._indexChanged = False
+        self._head = head
+        for content in self._contents.itervalues():
+            content._headCommit = head
+
+    def _CommitFiles( self, files, message ):
+        '''
+        Commits changes to several files.  As with TreeContent.SetContent,
+        if other files have changed since the unit started, the commit goes
+        on top of those changes
+
+        Args:
+            files       A dict mapping path -> new content
+            message     The commit message
+        Returns:
+            The new head commit
+        Throws:
+            ContentNotFound if one of the files doesn't exist
+            RefConflict if someone else changed one of the files
+        '''
+        base = head = self._Head()
+        for attempt in range( SAVE_ATTEMPTS ):
+            for path in files:
+                if PathOid( head, path ) is None:
+                    raise ContentNotFound()
+                if PathOid( head, path ) != PathOid( base, path ):
+                    raise RefConflict( DOCUMENT_REF )
+            try:
+                return self.doc.Commit( files, message, head=head )
+            except RefConflict:
+                head = self.doc.HeadCommit()
+        raise RefConflict( DOCUMENT_REF )
+
+    def _CommitMessage( self ):
+        '''
+        Builds the message for committing the changes
+        '''
+        if len( self._changes ) == 1:
+            content, change = self._changes.items()[ 0 ]
+            if content in self._created:
+                summary = 'Create content "{0}"'.format( content.name )
+            else:
+                summary = 'Updating content'
+            return Content._CommitMessage(
+                    summary, change[ 0 ], { 'Path': content.path }
+                    )
+        if self._changes:
+            return 'Updating {0} files'.format( len( self._changes ) )
+        return 'saving section index'
+
+
+class TreeDocument(object):
+    '''
+    A document stored as a single tree on one branch.
+    Has the same interface as Document
+    '''
+
+    def __init__(
+            self, name, create=False, rootPath=None, repo=None, backend=None
+            ):
+        '''
+        Constructor
+
+        Args:
+            name        The name of the document
+            create      If true, will create a document
+            rootPath    The rootPath to use (if not supplied, uses default)
+            repo        An already open repository to use
+            backend     The storage backend the document is kept in (if not
+                        supplied, uses a GitBackend)
+        Exceptions:
+            RepoNotFound if repository isn't found
+        '''
+        if repo is not None:
+            self.repo = repo
+            return
+        backend = backend or GitBackend()
+        targetDir = DocumentPath( name, rootPath )
+        if create:
+            self.repo = backend.Create( targetDir )
+            self._CreateDocumentBranch()
+        else:
+            self.repo = backend.Open( targetDir )
+
+    def _CreateDocumentBranch( self ):
+        '''
+        Creates the document branch, with an empty index & stylesheet
+        '''
+        self.Commit( {
+            SECTION_INDEX_FILENAME: '',
+            STYLESHEET_FILENAME: Content.DefaultContent,
+            }, 'Initial commit', parents=[] )
+
+    def HeadCommit( self ):
+        '''
+        Gets the head commit of the document branch
+
+        Throws:
+            MasterNotFound if the branch doesn't exist
+        '''
+        try:
+            return self.repo[ self.repo.lookup_reference( DOCUMENT_REF ).oid ]
+        except KeyError:
+            raise MasterNotFound()
+
+    def Commit( self, files, message, parents=None, head=None ):
+        '''
+        Commits changes to some files to the document branch.
+        The branch is only moved if it still points at head
+
+        Args:
+            files       A dict mapping path -> new content
+            message     The commit message
+            parents     The parent commits.  Defaults to [ head ]
+            head        The commit the changes are based on.  Defaults to
+                        the current head, or None if parents are passed, for
+                        creating the branch
+        Returns:
+            The new head commit
+        Throws:
+            RefConflict if the branch has been moved by someone else
+        '''
+        if parents is None:
+            if head is None:
+                head = self.HeadCommit()
+            parents = [ head ]
+        commitId = gitutils.CommitTree( self.repo, files, message, parents )
+        gitutils.UpdateRef(
+                self.repo,
+                DOCUMENT_REF,
+                commitId,
+                head.oid if head is not None else None
+                )
+        return self.repo[ commitId ]
+
+    def SaveIndex( self, index, files=None, message='saving section index' ):
+        '''
+        Commits a new revision of the section index, optionally along with
+        other files.
+
+        The commit goes on top of the one the index was loaded from.  If
+        someone else has committed since then, the index changes are
+        replayed onto their commit and we try again, as long as they didn't
+        change any of the other files.
+
+        Args:
+            index       The SectionIndex to save
+            files       An optional dict of other files to commit
+            message     The commit message
+        Returns:
+            The new head commit
+        Throws:
+            RefConflict if the index couldn't be saved, or someone else
+            changed one of the files
+        '''
+        files = files or {}
+        base = head = self.repo[ index.baseOid ]
+        for attempt in range( SAVE_ATTEMPTS ):
+            allFiles = dict( files )
+            allFiles[ SECTION_INDEX_FILENAME ] = index.GetIndexString()
+            try:
+                newHead = self.Commit( allFiles, message, head=head )
+            except RefConflict:
+                head = self.HeadCommit()
+                for path in files:
+                    if PathOid( head, path ) != PathOid( base, path ):
+                        raise RefConflict( DOCUMENT_REF )
+                index.Rebase( self.repo, head )
+                continue
+            index.MarkSaved( newHead.oid )
+            return newHead
+        raise RefConflict( DOCUMENT_REF )
+
+    def Sections( self ):
+        '''
+        Gets an iterator over all the sections
+        '''
+        head = self.HeadCommit()
+        if SECTIONS_DIRNAME not in head.tree:
+            return iter( [] )
+        sectionsTree = self.repo[ head.tree[ SECTIONS_DIRNAME ].oid ]
+        return (
+                TreeSection( entry.name, self, head )
+                for entry in sectionsTree
+                )
+
+    def CurrentSections( self ):
+        '''
+        Gets the current sections with their positions.
+        All the sections are read from a single commit
+
+        Returns:
+            A list of tuples ( position, section )
+        '''
+        head = self.HeadCommit()
+        index = SectionIndex( self.repo, head )
+        return enumerate(
+                TreeSection( s.name, self, head )
+                for s in index.CurrentSections()
+                )
+
+    def FindSection( self, name ):
+        '''
+        Finds a section by name
+
+        Args:
+            name    The name of the section to find
+        Returns:
+            The section if found
+        '''
+        return TreeSection( name, self )
+
+    def AddSection( self, name, content='' ):
+        '''
+        Creates a new section
+
+        Args:
+            name        The name of the section
+            content     The optional initial content of the
+                        section
+
+        Returns:
+            The new Section object
+        '''
+        return self.AddSections( [ ( name, content ) ] )[ 0 ]
+
+    def AddSections( self, sections ):
+        '''
+        Creates several new sections, with a single commit.
+        The sections are added to the end of the document in order
+
+        Args:
+            sections    A list of ( name, content ) tuples
+
+        Returns:
+            A list of the new Section objects
+        Throws:
+            ValueError if a name is repeated
+            RefConflict if a section with one of the names already exists
+        '''
+        names = [ name for name, content in sections ]
+        if len( set( names ) ) != len( names ):
+            raise ValueError( 'Section names must be unique' )
+        head = self.HeadCommit()
+        index = SectionIndex( self.repo, head )
+        for name in names:
+            # Removed sections keep their file, so their names can't be
+            # reused either
+            if index.HasSection( name ) or SectionPath( name ) in head.tree:
+                raise RefConflict( SectionPath( name ) )
+        for name in names:
+            index.AddSection( name )
+        if len( sections ) == 1:
+            name, content = sections[ 0 ]
+            message = Content._CommitMessage(
+                    'Create content "{0}"'.format( name ), content
+                    )
+        else:
+            message = 'Create {0} sections'.format( len( sections ) )
+        head = self.SaveIndex(
+                index,
+                dict(
+                    ( SectionPath( name ), content )
+                    for name, content in sections
+                    ),
+                message
+                )
+        return [ TreeSection( name, self, head ) for name in names ]
+
+    def RemoveSection( self, name ):
+        '''
+        Removes a section.
+        This function does not actually delete the data associated
+        with a section, it just removes it from the index.
+
+        Args:
+            name    The name of the section to remove
+        '''
+        self.RemoveSections( [ name ] )
+
+    def RemoveSections( self, names ):
+        '''
+        Removes several sections, with a single commit.
+        As with RemoveSection, the section data is not deleted.
+
+        Args:
+            names   The names of the sections to remove
+        '''
+        index = SectionIndex( self.repo, self.HeadCommit() )
+        for name in names:
+            index.RemoveSection( name )
+        self.SaveIndex( index )
+
+    def ReorderSections( self, namesInOrder ):
+        '''
+        Puts all the sections into a new order, with a single commit
+
+        Args:
+            namesInOrder    The names of all the current sections, in their
+                            new order
+        Throws:
+            ValueError if namesInOrder isn't a reordering of the current
+            sections
+        '''
+        index = SectionIndex( self.repo, self.HeadCommit() )
+        if index.Reorder( namesInOrder ):
+            self.SaveIndex( index )
+
+    def GetStylesheet(self):
+        '''
+        Gets the stylesheet object for this document
+
+        Returns:
+            A stylesheet object
+        '''
+        return TreeContent( 'stylesheet', self, STYLESHEET_FILENAME )
+
+    def UnitOfWork( self ):
+        '''
+        Starts a unit of work on the document, which reads the document once
+        and writes all its changes in a single commit
+
+        Returns:
+            A TreeUnitOfWork
+        '''
+        return TreeUnitOfWork( self )
+
+    def Fingerprint( self ):
+        '''
+        Gets a fingerprint of the current state of the document.  Every
+        change moves the document branch, so this is just its head
+
+        Returns:
+            The fingerprint, as a hex string
+        Throws:
+            MasterNotFound if the branch doesn't exist
+        '''
+        try:
+            ref = self.repo.lookup_reference( DOCUMENT_REF )
+        except KeyError:
+            raise MasterNotFound()
+        return gitutils.OidHex( ref.oid )
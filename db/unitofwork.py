@@ -0,0 +1,236 @@
+'''
+Request scoped units of work.
+
+A single request often reads & writes a document several times: updating a
+section reads its content & position, then sets them, and every position
+read or write loads the section index again.  A UnitOfWork loads the index
+and the heads it needs once, collects the changes made through it, and
+writes them all in Commit at the end of the request.
+
+    work = doc.UnitOfWork()
+    section = work.FindSection( 'name' )
+    section.SetContent( 'content' )
+    section.SetPosition( 0 )
+    work.Commit()
+
+Changes made through a unit of work aren't visible to anyone else until
+it's committed, and are thrown away if it never is.
+'''
+
+from collections import OrderedDict
+from .sectionindex import SectionIndex
+from .errors import RefConflict
+
+
+class UnitOfWork(object):
+    '''
+    A unit of work on a document stored one branch per section.
+
+    Sections & the stylesheet are loaded once per unit, so each branch head
+    is looked up at most once.
+    '''
+
+    def __init__( self, doc ):
+        '''
+        Constructor
+
+        Args:
+            doc     The document to work on
+        '''
+        self.doc = doc
+        self.repo = doc.repo
+        self._index = None
+        self._indexChanged = False
+        # Maps name -> content object, with None for the stylesheet
+        self._contents = {}
+        # Maps content object -> ( newContent, session, coalesceWindow )
+        self._changes = OrderedDict()
+        # The content objects for sections that have been added
+        self._created = set()
+
+    def _LoadIndex( self ):
+        '''
+        Loads the section index
+        '''
+        return SectionIndex( self.repo )
+
+    def _NewSection( self, name ):
+        '''
+        Makes a section object
+        '''
+        return self.doc.FindSection( name )
+
+    def _NewStylesheet( self ):
+        '''
+        Makes the stylesheet object
+        '''
+        return self.doc.GetStylesheet()
+
+    def _Track( self, key, make ):
+        '''
+        Gets a content object, making it & attaching it to this unit if it
+        hasn't been used yet
+        '''
+        content = self._contents.get( key )
+        if content is None:
+            content = make()
+            content.unit = self
+            self._contents[ key ] = content
+        return content
+
+    def Index( self ):
+        '''
+        Gets the section index, loading it if needed.
+        Changes to the index must be reported with IndexChanged
+        '''
+        if self._index is None:
+            self._index = self._LoadIndex()
+        return self._index
+
+    def IndexChanged( self ):
+        '''
+        Records that the section index has been changed
+        '''
+        self._indexChanged = True
+
+    def HasChange( self, content ):
+        '''
+        Checks if there's an uncommitted change to some content
+        '''
+        return content in self._changes
+
+    def PendingContent( self, content ):
+        '''
+        Gets the uncommitted new content of some content
+        '''
+        return self._changes[ content ][ 0 ]
+
+    def SetContent( self, content, newContent, session, coalesceWindow ):
+        '''
+        Records a change to some content, to be written on commit.
+        Called by Content.SetContent
+        '''
+        self._changes[ content ] = ( newContent, session, coalesceWindow )
+
+    def FindSection( self, name ):
+        '''
+        Finds a section by name
+
+        Args:
+            name    The name of the section to find
+        Returns:
+            The section
+        '''
+        return self._Track( name, lambda: self._NewSection( name ) )
+
+    def GetStylesheet( self ):
+        '''
+        Gets the stylesheet
+        '''
+        return self._Track( None, self._NewStylesheet )
+
+    def CurrentSections( self ):
+        '''
+        Gets the current sections with their positions
+
+        Returns:
+            A list of tuples ( position, section )
+        '''
+        return enumerate(
+                self.FindSection( s.name )
+                for s in self.Index().CurrentSections()
+                )
+
+    def AddSection( self, name, content='' ):
+        '''
+        Adds a new section to the end of the document
+
+        Args:
+            name        The name of the section
+            content     The optional initial content of the section
+        Returns:
+            The new section
+        '''
+        return self.AddSections( [ ( name, content ) ] )[ 0 ]
+
+    def AddSections( self, sections ):
+        '''
+        Adds several new sections to the end of the document, in order
+
+        Args:
+            sections    A list of ( name, content ) tuples
+        Returns:
+            A list of the new sections
+        Throws:
+            ValueError if a name is repeated
+            RefConflict if a section with one of the names already exists
+        '''
+        names = [ name for name, content in sections ]
+        if len( set( names ) ) != len( names ):
+            raise ValueError( 'Section names must be unique' )
+        index = self.Index()
+        for name in names:
+            if index.HasSection( name ) or self.FindSection( name ).Exists():
+                raise RefConflict( name )
+        added = []
+        for name, content in sections:
+            section = self.FindSection( name )
+            self._changes[ section ] = ( content, None, 0 )
+            self._created.add( section )
+            index.AddSection( name )
+            added.append( section )
+        self.IndexChanged()
+        return added
+
+    def RemoveSections( self, names ):
+        '''
+        Removes several sections from the index
+
+        Args:
+            names   The names of the sections to remove
+        '''
+        index = self.Index()
+        for name in names:
+            index.RemoveSection( name )
+        self.IndexChanged()
+
+    def ReorderSections( self, namesInOrder ):
+        '''
+        Puts all the sections into a new order
+
+        Args:
+            namesInOrder    The names of all the current sections, in their
+                            new order
+        Throws:
+            ValueError if namesInOrder isn't a reordering of the current
+            sections
+        '''
+        if self.Index().Reorder( namesInOrder ):
+            self.IndexChanged()
+
+    def Commit( self ):
+        '''
+        Writes all the changes made through this unit of work.
+        New sections are created first, so the index never refers to a
+        section that doesn't exist yet
+
+        Throws:
+            RefConflict if someone else changed the same content, or created
+            one of the new sections
+        '''
+        # Check before creating anything, so a conflict doesn't leave some
+        # of the new sections created but not in the index
+        for content in self._changes:
+            if content in self._created and content.Exists():
+                raise RefConflict( content.name )
+        for content, change in self._changes.items():
+            newContent, session, coalesceWindow = change
+            if content in self._created:
+                content.Create( newContent )
+            else:
+                content._WriteContent( newContent, session, coalesceWindow )
+            del self._changes[ content ]
+        self._created.clear()
+        if self._indexChanged:
+            self._index.Save( self.repo )
+            self._indexChanged = False
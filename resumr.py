@@ -1,14 +1,23 @@
-import shutil
 import sys
-from flask import Flask, render_template
+from flask import Flask, render_template, request, g
 from flask import redirect, url_for
 from services import GetAuthService, SERVICES_AVALIABLE
 from views.api import SectionApi, StylesheetApi
 from views import AuthViews, SystemTestViews, RenderViews
-from utils.viewutils import IsLoggedIn
+from views.render import WarmPage
+from db import DocumentPool, DocumentRegistry, RepackScheduler, RefConflict
+from db import MakeBackend
+from db.lrucache import LRUCache
+from utils.viewutils import IsLoggedIn, ConflictResponse
+from utils.rendercache import RenderCache
+from utils.renderwarmer import RenderWarmer
+from utils.parallelrender import ParallelRenderer
 
 SYSTEMTEST_PORT = 43001
 
+# The request methods that can write to a document
+WRITE_METHODS = frozenset(['POST', 'PUT', 'DELETE'])
+
 
 class DefaultConfig(object):
     SERVER_NAME = ''
@@ -24,6 +33,42 @@ class DefaultConfig(object):
     DATA_PATH = None
     SYSTEM_TEST = False
     MAX_STYLESHEET_SIZE = 1024 * 512
+    DOC_POOL_SIZE = 64
+    DOC_POOL_IDLE_TIMEOUT = 300
+    # The storage engine new documents are created with: refs or tree
+    DOC_STORAGE_ENGINE = 'refs'
+    # Where documents are kept: git (on disk) or memory (lost on exit, for
+    # tests & benchmarks)
+    STORAGE_BACKEND = 'git'
+    # Repack documents in the background once they've written
+    # REPACK_THRESHOLD loose objects and been idle for REPACK_IDLE_TIME
+    REPACK_ENABLED = True
+    REPACK_THRESHOLD = 1000
+    REPACK_IDLE_TIME = 60
+    REPACK_MAX_CONCURRENT = 1
+    # Edits from the same session within this many seconds of the last
+    # revision replace it, rather than adding a new revision.  0 disables
+    COALESCE_WINDOW = 30
+    # The number of bytes of rendered section HTML to cache in memory, and
+    # an optional directory to persist rendered HTML in between restarts
+    RENDER_CACHE_BYTES = 8 * 1024 * 1024
+    RENDER_CACHE_PATH = None
+    # The number of bytes of whole rendered pages to cache in memory
+    PAGE_CACHE_BYTES = 4 * 1024 * 1024
+    # Re-render documents in the background after they're changed, so the
+    # next view is a cache hit
+    RENDER_WARMING_ENABLED = True
+    RENDER_WARMING_WORKERS = 2
+    # Convert the sections of big documents across this many processes.
+    # Documents with less than RENDER_PARALLEL_THRESHOLD characters of
+    # markdown to convert are converted serially.  The default threshold is
+    # a placeholder, not a measured crossover: measure it on the server with
+    # utils.renderbench before enabling the pool.  If the pool takes more
+    # than RENDER_PARALLEL_TIMEOUT seconds it's abandoned for serial
+    # rendering.  Below 2 processes disables the pool
+    RENDER_PROCESSES = 0
+    RENDER_PARALLEL_THRESHOLD = 16 * 1024
+    RENDER_PARALLEL_TIMEOUT = 10
 
 
 class SystemTestConfig(DefaultConfig):
@@ -38,10 +83,66 @@ class ResumrApp(Flask):
         super( ResumrApp, self ).__init__(__name__)
 
         self.config.from_object(config_object)
+        if not config_object.SYSTEM_TEST:
+            self.config.from_envvar('RESUMR_CONFIG', silent=True)
+
+        # Converts markdown, in parallel for big documents.  The process
+        # pool is started first, as forking once other threads are running
+        # isn't safe
+        self.markdownRenderer = ParallelRenderer(
+                self.config['RENDER_PROCESSES'],
+                self.config['RENDER_PARALLEL_THRESHOLD'],
+                self.config['RENDER_PARALLEL_TIMEOUT']
+                )
+        self.markdownRenderer.Start()
+
+        # Pool of open documents, shared between requests
+        self.documentPool = DocumentPool(
+                self.config['DOC_POOL_SIZE'],
+                self.config['DOC_POOL_IDLE_TIMEOUT']
+                )
+        self.storageBackend = MakeBackend(self.config['STORAGE_BACKEND'])
+        # The documents that exist in DATA_PATH
+        self.documentRegistry = DocumentRegistry(
+                self.config['DATA_PATH'],
+                self.config['DOC_STORAGE_ENGINE'],
+                self.storageBackend
+                )
+
+        # Rendered section HTML, shared between requests
+        self.renderCache = RenderCache(
+                self.config['RENDER_CACHE_BYTES'],
+                self.config['RENDER_CACHE_PATH']
+                )
+        # Whole rendered pages, keyed by ETag
+        self.pageCache = LRUCache(
+                None,
+                maxWeight=self.config['PAGE_CACHE_BYTES'],
+                weigh=len
+                )
+
+        # Renders changed documents in the background
+        self.renderWarmer = None
+        if self.config['RENDER_WARMING_ENABLED']:
+            self.renderWarmer = RenderWarmer(
+                    self.config['RENDER_WARMING_WORKERS']
+                    )
+            self.after_request(self.WarmChangedDocument)
+
+        # Repacks documents that have had lots of writes.
+        # Only git repositories on disk need repacking
+        self.repackScheduler = None
+        if self.config['REPACK_ENABLED'] and \
+                self.config['STORAGE_BACKEND'] == 'git':
+            self.repackScheduler = RepackScheduler(
+                    self.config['REPACK_THRESHOLD'],
+                    self.config['REPACK_IDLE_TIME'],
+                    self.config['REPACK_MAX_CONCURRENT']
+                    )
+            self.after_request(self.NoteDocumentWrites)
+
         if config_object.SYSTEM_TEST:
             self.SystemTestReset()
-        else:
-            self.config.from_envvar('RESUMR_CONFIG', silent=True)
 
         # Set up the services
         oAuthUrl = 'http://' + self.config['SERVER_NAME'] + '/login/auth/{0}'
@@ -51,8 +152,35 @@ class ResumrApp(Flask):
                     oAuthUrl.format( name )
                     )
 
+    def NoteDocumentWrites(self, response):
+        '''
+        after_request handler that tells the repack scheduler about
+        successful requests that might have written to a document
+        '''
+        docPath = getattr(g, 'docPath', None)
+        if docPath and request.method in WRITE_METHODS and \
+                response.status_code < 400:
+            self.repackScheduler.NoteWrite(docPath)
+        return response
+
+    def WarmChangedDocument(self, response):
+        '''
+        after_request handler that schedules a background render of the
+        document after successful requests that might have changed it
+        '''
+        docPath = getattr(g, 'docPath', None)
+        doc = getattr(g, 'doc', None)
+        if doc is not None and request.method in WRITE_METHODS and \
+                response.status_code < 400:
+            self.renderWarmer.Schedule(
+                    docPath, lambda: WarmPage(self, doc, docPath)
+                    )
+        return response
+
     def SystemTestReset(self):
-        shutil.rmtree(self.config[ 'DATA_PATH' ], ignore_errors=True)
+        self.storageBackend.Destroy(self.config[ 'DATA_PATH' ])
+        self.documentPool.Clear()
+        self.documentRegistry.Load()
         self.config[ 'BYPASS_LOGIN' ] = True
 
 
@@ -62,6 +190,8 @@ def MakeApp(systemtest=False):
     app.register_blueprint(SectionApi, url_prefix='/api/sections')
     app.register_blueprint(StylesheetApi, url_prefix='/api/stylesheet')
     app.register_blueprint(RenderViews)
+    # Writes that lose a race with another worker are rejected
+    app.register_error_handler(RefConflict, ConflictResponse)
 
     if systemtest:
         app.register_blueprint(SystemTestViews, url_prefix='/systemtest')
@@ -47,6 +47,16 @@ class ResumrTests(TestCase):
         self.mox.VerifyAll()
         self.assertRedirects( rv, '/login' )
 
+    def testNoteDocumentWrites(self):
+        self.mox.StubOutWithMock(self.app.repackScheduler, 'NoteWrite')
+        self.app.repackScheduler.NoteWrite('docPath')
+        self.mox.ReplayAll()
+        for method in ['GET', 'POST']:
+            with self.app.test_request_context('/', method=method):
+                resumr.g.docPath = 'docPath'
+                self.app.NoteDocumentWrites(self.app.response_class())
+        self.mox.VerifyAll()
+
 
 if __name__ == "__main__":
     unittest.main()
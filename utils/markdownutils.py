@@ -1,6 +1,8 @@
 import re
+import markdown
 
 all = [
+    'RenderMarkdown',
     'CleanMarkdownOutput',
     'ValidateMarkdown',
     'MarkdownValidationError',
@@ -35,6 +37,42 @@ IMG_WHITELIST = re.compile(
 
 WHITELISTS = (TAG_WHITELIST, LINK_WHITELIST, IMG_WHITELIST)
 
+# Matches any tag that isn't whitelisted, like HTML_TAG_REGEXP does.
+# This is WHITELISTS turned into a single negative lookahead, factored so the
+# leading < is only matched once; it must be kept in step with them.
+# Every whitelist ends at the first >, just like HTML_TAG_REGEXP, so the
+# lookahead rejects a tag exactly when its HTML_TAG_REGEXP match would be
+# whitelisted.  Whitelisted tags don't contain a <, so skipping over them
+# can't start a match part way through one.
+STRIP_REGEXP = re.compile(
+        r'<(?!'
+        # TAG_WHITELIST
+        r'\/?(?:b|blockquote|code|del|dd|dl|dt|em|h1|h2|h3|h4|h5|h6|i|kbd|'
+        r'li|ol|p|pre|s|sup|sub|strong|strike|ul)>|(?:br|hr)\s?\/?>|'
+        # LINK_WHITELIST
+        r'a\shref="(?:(?:https?|ftp):\/\/|\/)'
+        r'[-A-Za-z0-9+&@#\/%?=~_|!:,.;\(\)]'
+        r'+"(?:\stitle="[^"<>]+")?\s?>|\/a>|'
+        # IMG_WHITELIST
+        r'img\ssrc="(?:https?:\/\/|\/)'
+        r'[-A-Za-z0-9+&@#\/%?=~_|!:,.;\(\)]+'
+        r'"(?:\swidth="\d{1,3}")?(?:\sheight="\d{1,3}")?'
+        r'(?:\salt="[^"<>]*")?(?:\stitle="[^"<>]*")?\s?\/?>'
+        r')[^>]*>?',
+        re.IGNORECASE
+        )
+
+# Whitelisted tags that don't need closing
+VOID_TAGS = frozenset(['br', 'hr', 'img'])
+
+# Matches a whitelisted tag that needs balancing, capturing whether it
+# closes and its name.  Once STRIP_REGEXP has been applied, every < starts a
+# whitelisted tag
+BALANCED_TAG_REGEXP = re.compile(
+        r'<(/?)(?!(?:' + '|'.join(VOID_TAGS) + r')\b)([a-z0-9]+)[^>]*>',
+        re.IGNORECASE
+        )
+
 
 class MarkdownValidationError(Exception):
     '''
@@ -43,13 +81,11 @@ class MarkdownValidationError(Exception):
     pass
 
 
-def CleanMarkdownOutput(html):
+def ReferenceCleanMarkdownOutput(html):
     '''
-    Cleans out all non-valid HTML tags from some already processed markdown
-    output
-
-    Generally, this shouldn't be a big deal as MD with invalid characters
-    should have been ditched already.  Better safe than sorry though.
+    The original implementation of CleanMarkdownOutput, which tries each
+    whitelist against each tag and doesn't balance tags.
+    Kept to test & benchmark CleanMarkdownOutput against
 
     Params:
         html - The html to clean
@@ -63,10 +99,135 @@ def CleanMarkdownOutput(html):
             if wl.match(tag):
                 return tag
         return ""
-    # TODO: Could balance tags as well, but let's leave that for now
     return HTML_TAG_REGEXP.sub(SubFunction, html)
 
 
+def CleanMarkdownOutput(html, balance=True):
+    '''
+    Cleans out all non-valid HTML tags from some already processed markdown
+    output, and balances the tags that are left
+
+    Generally, this shouldn't be a big deal as MD with invalid characters
+    should have been ditched already.  Better safe than sorry though.
+
+    Invalid tags are removed in a single pass of one regular expression,
+    without calling back into python for each tag.  The remaining tags are
+    then balanced: closing tags that weren't opened are removed, tags left
+    open inside another tag are closed along with it, and anything still
+    open is closed at the end.
+
+    Params:
+        html - The html to clean
+        balance - If false, tags aren't balanced.  The output is then the
+                  same as ReferenceCleanMarkdownOutput
+    Returns:
+        Some html with all invalid tags removed
+    '''
+    html = STRIP_REGEXP.sub('', html)
+    if balance:
+        html = _BalanceTags(html)
+    return html
+
+
+def _UnclosedTags(html):
+    '''
+    Quickly checks if the tags in some html are properly nested, with the
+    same case.  This is the usual case for markdown output, so it's kept as
+    cheap as possible
+
+    Returns:
+        The names of the tags left open at the end, innermost last, or None
+        if the tags aren't properly nested
+    '''
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    for closing, name in BALANCED_TAG_REGEXP.findall(html):
+        if not closing:
+            push(name)
+        elif not stack or pop() != name:
+            return None
+    return stack
+
+
+def _CloseTags(names):
+    '''
+    Makes the closing tags for some open tags, innermost first
+
+    Params:
+        names - The names of the open tags, innermost last
+    '''
+    return ''.join('</{0}>'.format(name.lower()) for name in reversed(names))
+
+
+def _BalanceTags(html):
+    '''
+    Balances the tags in some html that only has whitelisted tags.
+    Already balanced html (as markdown produces) is returned as it is
+
+    Params:
+        html - The html to balance
+    Returns:
+        The balanced html
+    '''
+    unclosed = _UnclosedTags(html)
+    if unclosed is not None:
+        return html + _CloseTags(unclosed)
+    # The names of the open tags, innermost last
+    stack = []
+    # Maps tag name -> number of times it's in stack
+    openCounts = {}
+    # A list of ( start, end, replacement ) for the changes to make
+    edits = []
+    for match in BALANCED_TAG_REGEXP.finditer(html):
+        closing, name = match.groups()
+        name = name.lower()
+        if not closing:
+            stack.append(name)
+            openCounts[name] = openCounts.get(name, 0) + 1
+        elif stack and stack[-1] == name:
+            # The usual case, closing the innermost tag
+            stack.pop()
+            openCounts[name] -= 1
+        elif not openCounts.get(name):
+            # Never opened
+            edits.append((match.start(), match.end(), ''))
+        else:
+            # Close anything left open inside this tag
+            closes = []
+            while True:
+                innerName = stack.pop()
+                openCounts[innerName] -= 1
+                if innerName == name:
+                    break
+                closes.append('</{0}>'.format(innerName))
+            if closes:
+                edits.append((match.start(), match.start(), ''.join(closes)))
+    if stack:
+        edits.append((len(html), len(html), _CloseTags(stack)))
+    output = []
+    position = 0
+    for start, end, replacement in edits:
+        output.append(html[position:start])
+        output.append(replacement)
+        position = end
+    output.append(html[position:])
+    return ''.join(output)
+
+
+def RenderMarkdown(md):
+    '''
+    Renders some markdown to clean HTML.
+    This is a module level function so it can be sent to other processes
+
+    Params:
+        md - The markdown to render
+    Returns:
+        The cleaned html
+    '''
+    return CleanMarkdownOutput(markdown.markdown(md))
+
+
 def ValidateMarkdown(md):
     '''
     Validates some markdown that's arrived from a user.
@@ -0,0 +1,128 @@
+'''
+Rendering markdown across a pool of processes.
+
+Markdown conversion is pure python, so threads don't help: it runs under the
+GIL.  For long documents (and batch exports) the sections can be converted
+in parallel in separate processes instead.  Sending the markdown to another
+process & the HTML back isn't free though, so small documents are still
+converted serially.  Run utils.renderbench to find where the crossover is on
+a given machine.
+
+The pool is made by forking, which isn't safe once other threads are running:
+the children can inherit locks held by those threads and hang.  Servers
+should call Start before starting any other threads.  In case a child hangs
+anyway, conversions that take longer than a timeout are done serially
+instead, and the pool isn't used again.
+'''
+
+import threading
+import multiprocessing
+
+# The default total size (in characters) of markdown below which it's
+# converted serially.  This is a placeholder, not a measured crossover
+DEFAULT_THRESHOLD = 16 * 1024
+
+# The default number of seconds to wait for the pool to convert a document
+DEFAULT_TIMEOUT = 10
+
+
+class ParallelRenderer(object):
+    '''
+    Converts lists of markdown, across a pool of processes if they're big
+    enough.  The pool is started by Start, or the first time it's needed
+    '''
+
+    def __init__(
+            self, processes=0, threshold=DEFAULT_THRESHOLD,
+            timeout=DEFAULT_TIMEOUT
+            ):
+        '''
+        Constructor
+
+        Args:
+            processes   The number of processes to use.  Below 2, everything
+                        is converted serially in this process
+            threshold   The total size of markdown below which it's
+                        converted serially
+            timeout     The number of seconds to wait for the pool before
+                        giving up on it & converting serially
+        '''
+        self.processes = processes
+        self.threshold = threshold
+        self.timeout = timeout
+        self._pool = None
+        self._lock = threading.Lock()
+        # Set if the pool timed out, after which it's not used again
+        self._failed = False
+
+    def Start( self ):
+        '''
+        Starts the process pool, if there is one.  Must be called before
+        any other threads are started, so it's safe to fork
+        '''
+        if self.processes > 1:
+            self._Pool()
+
+    def _Pool( self ):
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool( self.processes )
+            return self._pool
+
+    def IsParallel( self, contents ):
+        '''
+        Checks if some contents would be converted in parallel
+        '''
+        return (
+                self.processes > 1 and not self._failed and
+                len( contents ) > 1 and
+                sum( len( c ) for c in contents ) >= self.threshold
+                )
+
+    def Render( self, convert, contents ):
+        '''
+        Converts a list of markdown
+
+        Args:
+            convert     The conversion function.  Must be a module level
+                        function, so it can be sent to the pool
+            contents    A list of markdown strings
+        Returns:
+            A list of the converted contents, in the same order
+        '''
+        if not self.IsParallel( contents ):
+            return [ convert( content ) for content in contents ]
+        # Hand out a few sections at a time, so one huge section doesn't
+        # hold up the rest
+        chunkSize = max( 1, len( contents ) // ( self.processes * 4 ) )
+        result = self._Pool().map_async( convert, contents, chunkSize )
+        try:
+            return result.get( self.timeout )
+        except multiprocessing.TimeoutError:
+            self._Fail()
+            return [ convert( content ) for content in contents ]
+
+    def _Fail( self ):
+        '''
+        Stops using the pool after it timed out.  It's not restarted, as
+        forking again now would be unsafe
+        '''
+        with self._lock:
+            self._failed = True
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            # Terminating waits for the children, which might be hung, so
+            # it's done in the background
+            thread = threading.Thread( target=pool.terminate )
+            thread.daemon = True
+            thread.start()
+
+    def Close( self ):
+        '''
+        Shuts down the process pool, if it was started
+        '''
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._pool.join()
+                self._pool = None
@@ -0,0 +1,134 @@
+'''
+Benchmarks serial against process pool markdown rendering, to find the
+document size at which the pool starts to pay off on this machine.  Use the
+result to set RENDER_PARALLEL_THRESHOLD.
+
+    python -m utils.renderbench --processes 4
+'''
+
+import time
+import argparse
+import multiprocessing
+from .markdownutils import RenderMarkdown
+from .parallelrender import ParallelRenderer
+
+# A section of resume-like markdown, repeated to make sections of any size
+SAMPLE_SECTION = u'''
+### Senior Developer, Somewhere Ltd
+
+*2010 - 2013*
+
+Worked on **all sorts** of things, including:
+
+* A web application in [Python](http://python.org/)
+* Some `infrastructure` code
+* > A quote from a happy customer
+
+1. First thing
+2. Second thing
+
+'''
+
+
+def MakeDocument( sections, sectionSize ):
+    '''
+    Makes the sections of a document to render
+
+    Args:
+        sections        The number of sections
+        sectionSize     The approximate size of each section, in characters
+    Returns:
+        A list of markdown strings
+    '''
+    repeats = max( 1, sectionSize // len( SAMPLE_SECTION ) )
+    return [
+            u'## Section {0}\n'.format( i ) + SAMPLE_SECTION * repeats
+            for i in range( sections )
+            ]
+
+
+def TimeRender( renderer, contents, repeat ):
+    '''
+    Times rendering some contents
+
+    Returns:
+        The best time taken, in seconds
+    '''
+    best = None
+    for _ in range( repeat ):
+        start = time.time()
+        renderer.Render( RenderMarkdown, contents )
+        taken = time.time() - start
+        if best is None or taken < best:
+            best = taken
+    return best
+
+
+def Main( args=None ):
+    parser = argparse.ArgumentParser(
+            description='Finds where parallel markdown rendering pays off'
+            )
+    parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='The number of processes in the pool'
+            )
+    parser.add_argument(
+            '--sections', type=int, nargs='+', default=[ 2, 8, 16, 32, 64 ],
+            help='The numbers of sections to try'
+            )
+    parser.add_argument(
+            '--section-size', type=int, nargs='+',
+            default=[ 500, 2000, 8000 ],
+            help='The section sizes to try, in characters'
+            )
+    parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='The number of times to time each render'
+            )
+    parser.add_argument(
+            '--min-speedup', type=float, default=1.1,
+            help='The speedup that counts as the pool beating serial, so '
+                 'noise is ignored'
+            )
+    options = parser.parse_args( args )
+
+    serial = ParallelRenderer( 0 )
+    # No timeout, so big documents are never quietly rendered serially
+    parallel = ParallelRenderer(
+            options.processes, threshold=0, timeout=None
+            )
+    # Start the pool up front, so it's not counted
+    parallel.Render( RenderMarkdown, MakeDocument( options.processes, 1 ) )
+
+    print '{0} processes, {1} cpus'.format(
+            options.processes, multiprocessing.cpu_count()
+            )
+    print '{0:>8} {1:>8} {2:>10} {3:>10} {4:>8}'.format(
+            'sections', 'KiB', 'serial ms', 'pool ms', 'speedup'
+            )
+    crossover = None
+    for sectionSize in options.section_size:
+        for sections in options.sections:
+            contents = MakeDocument( sections, sectionSize )
+            size = sum( len( c ) for c in contents )
+            serialTime = TimeRender( serial, contents, options.repeat )
+            poolTime = TimeRender( parallel, contents, options.repeat )
+            print '{0:>8} {1:>8.0f} {2:>10.1f} {3:>10.1f} {4:>7.2f}x'.format(
+                    sections, size / 1024.0, serialTime * 1000,
+                    poolTime * 1000, serialTime / poolTime
+                    )
+            faster = serialTime / poolTime >= options.min_speedup
+            if faster and ( crossover is None or size < crossover ):
+                crossover = size
+    parallel.Close()
+
+    if crossover is None:
+        print 'The pool never beat serial rendering'
+    else:
+        print 'The pool first beat serial rendering at {0} characters'.format(
+                crossover
+                )
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,183 @@
+'''
+Cache of rendered section HTML.
+
+Rendering a section means running markdown and then cleaning the output,
+which is by far the slowest part of a render.  Sections are stored in
+blobs, so the blob id is a key that changes exactly when the content does.
+Rendered HTML is cached by blob id & RENDERER_VERSION, so a render only
+converts the sections that have been edited since they were last rendered.
+
+The cache is held in memory (bounded by bytes of HTML) and can optionally be
+persisted on disk, one directory per document, so it survives restarts and
+is shared between workers.
+
+Whole rendered pages are identified by PageETag, which is built from the
+documents fingerprint (see Document.Fingerprint), so they can be cached &
+revalidated without reading any content.
+'''
+
+import os
+import errno
+import hashlib
+import tempfile
+import markdown
+from db.lrucache import LRUCache
+
+# Bump this whenever the HTML produced for some markdown might change (e.g.
+# a change to the markdown extensions, the sanitizer or render.html), so
+# stale renders aren't served.  The markdown version is included so
+# upgrading it invalidates the cache too
+RENDERER_VERSION = '2-' + markdown.version
+
+# The suffix of cache files on disk
+CACHE_FILE_SUFFIX = '.html'
+
+
+def PageETag( docPath, fingerprint, version=RENDERER_VERSION ):
+    '''
+    Gets the ETag for a rendered page of a document
+
+    Args:
+        docPath         The path of the document
+        fingerprint     The fingerprint of the document
+        version         The renderer version
+    Returns:
+        The ETag, without quotes
+    '''
+    if isinstance( docPath, unicode ):
+        docPath = docPath.encode( 'utf-8' )
+    return hashlib.sha1( '\0'.join(
+        [ version, str( docPath ), fingerprint ]
+        ) ).hexdigest()
+
+
+class RenderCache(object):
+    '''
+    A cache of rendered HTML, keyed by blob id & RENDERER_VERSION
+    '''
+
+    def __init__( self, maxBytes, diskPath=None, version=RENDERER_VERSION ):
+        '''
+        Constructor
+
+        Args:
+            maxBytes    The maximum number of bytes of HTML to keep in memory
+            diskPath    Optional directory to persist rendered HTML in
+            version     The renderer version
+        '''
+        self.diskPath = diskPath
+        self.version = version
+        self._cache = LRUCache( None, maxWeight=maxBytes, weigh=len )
+
+    def _Key( self, blobId ):
+        return '{0}-{1}'.format( self.version, blobId )
+
+    def _FilePath( self, docPath, blobId ):
+        '''
+        Gets the path of the file a render is persisted in, or None if
+        renders aren't persisted for the document
+        '''
+        if self.diskPath is None or docPath is None:
+            return None
+        if isinstance( docPath, unicode ):
+            docPath = docPath.encode( 'utf-8' )
+        docDir = hashlib.sha1( docPath ).hexdigest()
+        return os.path.join(
+                self.diskPath, docDir[ :2 ], docDir,
+                self._Key( blobId ) + CACHE_FILE_SUFFIX
+                )
+
+    def _ReadFile( self, path ):
+        try:
+            with open( path, 'rb' ) as f:
+                return f.read().decode( 'utf-8' )
+        except IOError:
+            return None
+
+    def _WriteFile( self, path, html ):
+        '''
+        Writes a render to disk.  The file is written to a temporary file
+        first then renamed, so other workers never see half a file.
+        Failures are ignored, the render will just be redone next time
+        '''
+        directory = os.path.dirname( path )
+        try:
+            try:
+                os.makedirs( directory )
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            fd, tempPath = tempfile.mkstemp( dir=directory )
+            with os.fdopen( fd, 'wb' ) as f:
+                f.write( html.encode( 'utf-8' ) )
+            os.rename( tempPath, path )
+        except ( IOError, OSError ):
+            pass
+
+    def Get( self, blobId, docPath=None ):
+        '''
+        Gets a cached render
+
+        Args:
+            blobId      The hex id of the blob that was rendered
+            docPath     The path of the document the blob is in.  Used to
+                        find renders persisted on disk
+        Returns:
+            The rendered HTML, or None if it's not cached
+        '''
+        key = self._Key( blobId )
+        html = self._cache.Get( key )
+        if html is None:
+            path = self._FilePath( docPath, blobId )
+            if path is not None:
+                html = self._ReadFile( path )
+                if html is not None:
+                    self._cache.Put( key, html )
+        return html
+
+    def Put( self, blobId, html, docPath=None ):
+        '''
+        Caches a render
+
+        Args:
+            blobId      The hex id of the blob that was rendered
+            html        The rendered HTML
+            docPath     The path of the document the blob is in.  Renders
+                        are only persisted on disk if this is given
+        '''
+        self._cache.Put( self._Key( blobId ), html )
+        path = self._FilePath( docPath, blobId )
+        if path is not None:
+            self._WriteFile( path, html )
+
+    def Render( self, blobId, render, docPath=None ):
+        '''
+        Gets a render from the cache, rendering & caching it if needed
+
+        Args:
+            blobId      The hex id of the blob to render
+            render      Function that renders the blob, returning the HTML
+            docPath     The path of the document the blob is in
+        Returns:
+            The rendered HTML
+        '''
+        html = self.Get( blobId, docPath )
+        if html is None:
+            html = render()
+            self.Put( blobId, html, docPath )
+        return html
+
+    def Stats( self ):
+        '''
+        Gets statistics for the in memory cache, including the hit ratio
+
+        Returns:
+            A dict of statistics
+        '''
+        return self._cache.Stats()
+
+    def Clear( self ):
+        '''
+        Empties the in memory cache.  Renders on disk are left alone
+        '''
+        self._cache.Clear()
@@ -0,0 +1,130 @@
+'''
+Background warming of the render caches.
+
+Even with the render caches, the first view of a document after an edit
+has to convert the changed sections.  The RenderWarmer runs that render on
+a small pool of worker threads straight after the edit, so the next view is
+a cache hit.
+
+Warms are keyed (by document path), and a key that's already waiting to be
+warmed isn't queued again, so a burst of edits to one document only renders
+it once or twice.  If too many warms are waiting, new ones are dropped;
+the page will just be rendered when it's next viewed.
+'''
+
+import Queue
+import threading
+
+# The default number of worker threads
+DEFAULT_WORKERS = 2
+
+# The default maximum number of warms waiting to run
+DEFAULT_MAX_PENDING = 100
+
+
+class RenderWarmer(object):
+    '''
+    Runs render warming jobs on a pool of worker threads.
+
+    Jobs are scheduled with Schedule.  The worker threads are started on
+    the first job.
+    '''
+
+    def __init__(
+            self, workers=DEFAULT_WORKERS, maxPending=DEFAULT_MAX_PENDING
+            ):
+        '''
+        Constructor
+
+        Args:
+            workers     The number of worker threads
+            maxPending  The maximum number of jobs waiting to run
+        '''
+        self.workers = workers
+        self._queue = Queue.Queue( maxPending )
+        # The keys of the jobs waiting to run
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._threads = []
+        self.warmed = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def Schedule( self, key, job ):
+        '''
+        Schedules a job, unless one with the same key is already waiting
+
+        Args:
+            key     The key of the job, e.g. the document path
+            job     Function that does the warming
+        Returns:
+            True if the job was scheduled
+        '''
+        with self._lock:
+            if key in self._pending:
+                return False
+            try:
+                self._queue.put_nowait( ( key, job ) )
+            except Queue.Full:
+                self.dropped += 1
+                return False
+            self._pending.add( key )
+        if not self._threads:
+            self.Start()
+        return True
+
+    def Start( self ):
+        '''
+        Starts the worker threads
+        '''
+        with self._lock:
+            if self._threads:
+                return
+            for _ in range( self.workers ):
+                thread = threading.Thread( target=self._Run )
+                thread.daemon = True
+                thread.start()
+                self._threads.append( thread )
+
+    def _Run( self ):
+        while True:
+            key, job = self._queue.get()
+            with self._lock:
+                # Changes made while the job runs need another warm
+                self._pending.discard( key )
+            succeeded = False
+            try:
+                job()
+                succeeded = True
+            except Exception:
+                # A failed warm just means the next view renders the page
+                pass
+            finally:
+                with self._lock:
+                    if succeeded:
+                        self.warmed += 1
+                    else:
+                        self.failures += 1
+                self._queue.task_done()
+
+    def Join( self ):
+        '''
+        Waits for all the scheduled jobs to finish
+        '''
+        self._queue.join()
+
+    def Stats( self ):
+        '''
+        Gets statistics about the warming
+
+        Returns:
+            A dict of statistics
+        '''
+        with self._lock:
+            pending = len( self._pending )
+        return {
+                'pending': pending,
+                'warmed': self.warmed,
+                'failures': self.failures,
+                'dropped': self.dropped,
+                }
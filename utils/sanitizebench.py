@@ -0,0 +1,87 @@
+'''
+Micro-benchmark of CleanMarkdownOutput against the original per tag
+implementation, over large generated html.
+
+    python -m utils.sanitizebench --sizes 10 100 1000
+'''
+
+import time
+import argparse
+import markdown
+from .markdownutils import CleanMarkdownOutput, ReferenceCleanMarkdownOutput
+from .renderbench import SAMPLE_SECTION
+
+
+def MakeHtml( size, dirty ):
+    '''
+    Makes some rendered markdown
+
+    Args:
+        size    The approximate size of the html, in KiB
+        dirty   If true, each section also has tags that need removing and
+                a tag that needs closing
+    Returns:
+        The html
+    '''
+    section = markdown.markdown( SAMPLE_SECTION )
+    if dirty:
+        section += u'<script>x</script><p class="x"><b>unclosed\n'
+    return section * max( 1, size * 1024 // len( section ) )
+
+
+def TimeClean( clean, html, repeat ):
+    '''
+    Times cleaning some html
+
+    Returns:
+        The best time taken, in seconds
+    '''
+    best = None
+    for _ in range( repeat ):
+        start = time.time()
+        clean( html )
+        taken = time.time() - start
+        if best is None or taken < best:
+            best = taken
+    return best
+
+
+def Main( args=None ):
+    parser = argparse.ArgumentParser(
+            description='Benchmarks the html sanitizer'
+            )
+    parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[ 10, 100, 1000 ],
+            help='The sizes of html to clean, in KiB'
+            )
+    parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='The number of times to time each clean'
+            )
+    options = parser.parse_args( args )
+
+    print '{0:>6} {1:>8} {2:>8} {3:>13} {4:>10} {5:>14} {6:>8}'.format(
+            'input', 'KiB', 'tags', 'reference ms', 'single ms',
+            'unbalanced ms', 'speedup'
+            )
+    for dirty in ( False, True ):
+        for size in options.sizes:
+            html = MakeHtml( size, dirty )
+            reference = TimeClean(
+                    ReferenceCleanMarkdownOutput, html, options.repeat
+                    )
+            single = TimeClean( CleanMarkdownOutput, html, options.repeat )
+            unbalanced = TimeClean(
+                    lambda h: CleanMarkdownOutput( h, balance=False ),
+                    html, options.repeat
+                    )
+            print ( '{0:>6} {1:>8} {2:>8} {3:>13.1f} {4:>10.1f} {5:>14.1f} '
+                    '{6:>7.2f}x' ).format(
+                    'dirty' if dirty else 'clean', size, html.count( '<' ),
+                    reference * 1000, single * 1000, unbalanced * 1000,
+                    reference / single
+                    )
+
+
+if __name__ == '__main__':
+    Main()
@@ -1,3 +1,6 @@
 
 from .markdownutils import *
 from .viewutilstests import *
+from .rendercachetests import *
+from .renderwarmertests import *
+from .parallelrendertests import *
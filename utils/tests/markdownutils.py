@@ -1,7 +1,10 @@
+import re
+from random import Random
 from unittest import TestCase
 from ddt import ddt, data
 from ..markdownutils import ValidateMarkdown, MarkdownValidationError
-from ..markdownutils import CleanMarkdownOutput
+from ..markdownutils import CleanMarkdownOutput, RenderMarkdown
+from ..markdownutils import ReferenceCleanMarkdownOutput, HTML_TAG_REGEXP
 import markdown
 
 
@@ -103,6 +106,16 @@ class TestCleanMarkdownOutput(TestCase):
         processed = markdown.markdown(data)
         self.assertEqual(processed, CleanMarkdownOutput(processed))
 
+    @data(*MarkdownData)
+    def testRenderMarkdown(self, data):
+        '''
+        Testing RenderMarkdown converts & cleans markdown
+        '''
+        self.assertEqual(
+                CleanMarkdownOutput(markdown.markdown(data)),
+                RenderMarkdown(data)
+                )
+
     #TODO: Test image tags
 
     CleanupTest = [
@@ -118,3 +131,91 @@ class TestCleanMarkdownOutput(TestCase):
         '''
         toProcess, expectedResult = data
         self.assertEqual(expectedResult, CleanMarkdownOutput(toProcess))
+
+
+# Fragments that generated html is made of: whitelisted tags, near misses &
+# malformed tags
+FuzzFragments = [
+        'text ', '<', '>', '"', '\n', '<b>', '</b>', '<B>', '</B>', '<p>',
+        '</p>', '<li>', '</li>', '<ul>', '</ul>', '<br>', '<br />',
+        '<hr/>', '<h1>', '</h1>', '<em>', '</em>', '<script>',
+        '</script>', '<b', '<b <b>', '<p class="x">', '<a href="/x">',
+        '<a href="http://example.com/a?b=c" title="t">', '</a>',
+        '<a href="javascript:alert(1)">', '<a href="/x" onclick="y">',
+        '<img src="/i.png">', '<img src="http://e.com/i.png" width="10" '
+        'height="20" alt="a" title="t" />', '<img src="data:x">',
+        '<!-- comment -->', '<b\n>', '</b\n>', '<br\n>',
+        ]
+
+
+def GenerateHtml(random, length):
+    '''
+    Generates some random html from FuzzFragments
+    '''
+    return ''.join(random.choice(FuzzFragments) for _ in range(length))
+
+
+class TestSanitizer(TestCase):
+
+    def testDifferential(self):
+        '''
+        Testing that without balancing, CleanMarkdownOutput does exactly
+        what the original implementation did
+        '''
+        random = Random(1234)
+        for _ in range(2000):
+            html = GenerateHtml(random, random.randint(0, 40))
+            self.assertEqual(
+                    ReferenceCleanMarkdownOutput(html),
+                    CleanMarkdownOutput(html, balance=False),
+                    repr(html)
+                    )
+
+    def testBalancedUnchanged(self):
+        '''
+        Testing that balancing leaves markdown output alone
+        '''
+        md = '\n\n'.join(
+                TestCleanMarkdownOutput.MarkdownData +
+                ['* one\n* two\n\n> quote **b** *i*', '1. a\n2. b',
+                 '[link](http://example.com/ "title") ![i](/i.png)']
+                )
+        processed = markdown.markdown(md)
+        self.assertEqual(
+                ReferenceCleanMarkdownOutput(processed),
+                CleanMarkdownOutput(processed)
+                )
+
+    BalanceTests = [
+            ('</b>text', 'text'),
+            ('<b>text', '<b>text</b>'),
+            ('<p><b>text</p>', '<p><b>text</b></p>'),
+            ('<b><script>x</b>', '<b>x</b>'),
+            ('<B>text</b>', '<B>text</b>'),
+            ('<ul><li>one<li>two</ul>', '<ul><li>one<li>two</li></li></ul>'),
+            ('a<br>b<hr/>', 'a<br>b<hr/>'),
+            ('<a href="/x">link', '<a href="/x">link</a>'),
+            ]
+
+    def testBalancing(self):
+        '''
+        Testing that tags are balanced
+        '''
+        for html, expected in self.BalanceTests:
+            self.assertEqual(expected, CleanMarkdownOutput(html), html)
+
+    def testBalancedOutput(self):
+        '''
+        Testing that the output of random html is always balanced
+        '''
+        random = Random(5678)
+        for _ in range(500):
+            html = CleanMarkdownOutput(GenerateHtml(random, 30))
+            depth = 0
+            for tag in HTML_TAG_REGEXP.findall(html):
+                if tag.startswith('</'):
+                    depth -= 1
+                elif not re.match(r'<(br|hr|img)\b', tag, re.I):
+                    depth += 1
+                self.assertTrue(depth >= 0, html)
+            self.assertEqual(0, depth, html)
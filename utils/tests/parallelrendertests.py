@@ -0,0 +1,72 @@
+import time
+import multiprocessing
+from unittest import TestCase
+from ..markdownutils import RenderMarkdown
+from ..parallelrender import ParallelRenderer
+
+
+def _HangInPool(content):
+    ''' Converts content, hanging if it's run in a pool process '''
+    if multiprocessing.current_process().name != 'MainProcess':
+        time.sleep(60)
+    return content.upper()
+
+
+class TestParallelRenderer(TestCase):
+
+    def setUp(self):
+        self.contents = [u'# Heading {0}\n\n*text*'.format(i)
+                         for i in range(10)]
+
+    def testSerialBelowThreshold(self):
+        ''' Testing ParallelRenderer converts small documents serially '''
+        renderer = ParallelRenderer(2, threshold=10000)
+        self.assertFalse(renderer.IsParallel(self.contents))
+        # A lambda can't be sent to another process, so this only works if
+        # it's run serially
+        self.assertEqual(
+                [c.upper() for c in self.contents],
+                renderer.Render(lambda c: c.upper(), self.contents)
+                )
+        self.assertEqual(None, renderer._pool)
+
+    def testSerialWithoutProcesses(self):
+        ''' Testing ParallelRenderer without a pool is always serial '''
+        renderer = ParallelRenderer(0, threshold=0)
+        self.assertFalse(renderer.IsParallel(self.contents))
+
+    def testParallelKeepsOrder(self):
+        ''' Testing ParallelRenderer converts in parallel, in order '''
+        renderer = ParallelRenderer(2, threshold=0)
+        try:
+            self.assertTrue(renderer.IsParallel(self.contents))
+            self.assertEqual(
+                    [RenderMarkdown(c) for c in self.contents],
+                    renderer.Render(RenderMarkdown, self.contents)
+                    )
+            self.assertNotEqual(None, renderer._pool)
+        finally:
+            renderer.Close()
+
+    def testStart(self):
+        ''' Testing ParallelRenderer.Start only starts a pool if needed '''
+        renderer = ParallelRenderer(0)
+        renderer.Start()
+        self.assertEqual(None, renderer._pool)
+        renderer = ParallelRenderer(2)
+        try:
+            renderer.Start()
+            self.assertNotEqual(None, renderer._pool)
+        finally:
+            renderer.Close()
+
+    def testTimeoutFallsBackToSerial(self):
+        ''' Testing ParallelRenderer gives up on a pool that hangs '''
+        renderer = ParallelRenderer(2, threshold=0, timeout=0.5)
+        contents = self.contents[:2]
+        self.assertEqual(
+                [c.upper() for c in contents],
+                renderer.Render(_HangInPool, contents)
+                )
+        self.assertEqual(None, renderer._pool)
+        self.assertFalse(renderer.IsParallel(contents))
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from ..rendercache import RenderCache
+
+
+class TestRenderCache(TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.renders = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def _Render(self, html):
+        def Render():
+            self.renders.append(html)
+            return html
+        return Render
+
+    def testRendersOnce(self):
+        ''' Testing RenderCache only renders each blob once '''
+        cache = RenderCache(1024)
+        self.assertEqual(u'one', cache.Render('a', self._Render(u'one')))
+        self.assertEqual(u'one', cache.Render('a', self._Render(u'two')))
+        self.assertEqual(u'two', cache.Render('b', self._Render(u'two')))
+        self.assertEqual([u'one', u'two'], self.renders)
+
+    def testVersion(self):
+        ''' Testing RenderCache ignores renders from other versions '''
+        path = os.path.join(self.tempDir, 'cache')
+        RenderCache(1024, path, version='1').Put('a', u'old', 'doc')
+        cache = RenderCache(1024, path, version='2')
+        self.assertEqual(None, cache.Get('a', 'doc'))
+
+    def testBounded(self):
+        ''' Testing RenderCache keeps its memory use bounded '''
+        cache = RenderCache(10)
+        cache.Put('a', u'123456')
+        cache.Put('b', u'123456')
+        self.assertEqual(None, cache.Get('a'))
+        self.assertEqual(u'123456', cache.Get('b'))
+
+    def testPersisted(self):
+        ''' Testing RenderCache persists renders on disk per document '''
+        path = os.path.join(self.tempDir, 'cache')
+        RenderCache(1024, path).Put('a', u'caf\xe9', 'doc')
+        self.assertEqual(None, RenderCache(1024, path).Get('a', 'other'))
+        self.assertEqual(None, RenderCache(1024, path).Get('a'))
+        self.assertEqual(u'caf\xe9', RenderCache(1024, path).Get('a', 'doc'))
+
+    def testDiskFailure(self):
+        ''' Testing RenderCache still works if the disk cache can't '''
+        path = os.path.join(self.tempDir, 'file')
+        open(path, 'w').close()
+        cache = RenderCache(1024, path)
+        self.assertEqual(u'one', cache.Render('a', self._Render(u'one'), 'd'))
+        self.assertEqual(u'one', cache.Get('a', 'd'))
@@ -0,0 +1,56 @@
+import threading
+from unittest import TestCase
+from ..renderwarmer import RenderWarmer
+
+
+class TestRenderWarmer(TestCase):
+
+    def testRunsJobs(self):
+        ''' Testing RenderWarmer runs scheduled jobs in the background '''
+        warmer = RenderWarmer(workers=2)
+        done = []
+        self.assertTrue(warmer.Schedule('a', lambda: done.append('a')))
+        self.assertTrue(warmer.Schedule('b', lambda: done.append('b')))
+        warmer.Join()
+        self.assertEqual(['a', 'b'], sorted(done))
+        self.assertEqual(2, warmer.Stats()['warmed'])
+
+    def testSkipsPendingKeys(self):
+        ''' Testing RenderWarmer only queues each key once '''
+        warmer = RenderWarmer(workers=1)
+        release = threading.Event()
+        warmer.Schedule('blocker', release.wait)
+        self.assertTrue(warmer.Schedule('a', lambda: None))
+        self.assertFalse(warmer.Schedule('a', lambda: None))
+        release.set()
+        warmer.Join()
+        self.assertEqual(2, warmer.Stats()['warmed'])
+        self.assertTrue(warmer.Schedule('a', lambda: None))
+        warmer.Join()
+
+    def testDropsWhenFull(self):
+        ''' Testing RenderWarmer drops jobs when too many are waiting '''
+        warmer = RenderWarmer(workers=1, maxPending=1)
+        release = threading.Event()
+        started = threading.Event()
+
+        def Blocker():
+            started.set()
+            release.wait()
+        warmer.Schedule('blocker', Blocker)
+        started.wait()
+        self.assertTrue(warmer.Schedule('a', lambda: None))
+        self.assertFalse(warmer.Schedule('b', lambda: None))
+        release.set()
+        warmer.Join()
+        self.assertEqual(1, warmer.Stats()['dropped'])
+
+    def testCountsFailures(self):
+        ''' Testing RenderWarmer survives failing jobs '''
+        warmer = RenderWarmer(workers=1)
+        warmer.Schedule('a', lambda: 1 / 0)
+        warmer.Schedule('b', lambda: None)
+        warmer.Join()
+        stats = warmer.Stats()
+        self.assertEqual(1, stats['failures'])
+        self.assertEqual(1, stats['warmed'])
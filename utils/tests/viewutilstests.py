@@ -4,7 +4,6 @@ from flask import session
 from flask.ext.testing import TestCase
 from utils import viewutils
 from utils.viewutils import IsLoggedIn, GetDoc
-from db import RepoNotFound
 
 
 class TestIsLoggedIn(TestCase, mox.MoxTestBase):
@@ -55,8 +54,9 @@ class TestGetDoc(TestCase, mox.MoxTestBase):
         self.mox.UnsetStubs()
 
     def should_return_document_when_logged_in(self):
-        self.mox.StubOutClassWithMocks(viewutils, 'Document')
-        d = viewutils.Document( 'facebook - something', rootPath=None )
+        registry = self.app.documentRegistry
+        self.mox.StubOutWithMock(registry, 'Open')
+        registry.Open( 'facebook - something' ).AndReturn( 'document' )
 
         self.mox.ReplayAll()
         with self.app.test_request_context('/'):
@@ -64,25 +64,26 @@ class TestGetDoc(TestCase, mox.MoxTestBase):
             session.new = False
             session[ 'email' ] = 'something'
             session[ 'regType' ] = 'facebook'
-            self.assertIs( GetDoc(), d )
+            self.assertEqual( GetDoc(), 'document' )
         self.mox.VerifyAll()
 
-    def should_use_data_path_config(self):
-        self.mox.StubOutClassWithMocks(viewutils, 'Document')
-        d = viewutils.Document( 'facebook - something', rootPath='somewhere' )
+    def should_pool_by_document_path(self):
+        registry = self.app.documentRegistry
+        self.mox.StubOutWithMock(registry, 'Open')
+        registry.Open( 'facebook - something' ).AndReturn( 'document' )
 
         self.mox.ReplayAll()
-        try:
-            self.app.config[ 'DATA_PATH' ] = 'somewhere'
-            with self.app.test_request_context('/'):
-                self.app.preprocess_request()
-                session.new = False
-                session[ 'email' ] = 'something'
-                session[ 'regType' ] = 'facebook'
-                self.assertIs( GetDoc(), d )
-            self.mox.VerifyAll()
-        finally:
-            self.app.config[ 'DATA_PATH' ] = None
+        with self.app.test_request_context('/'):
+            self.app.preprocess_request()
+            session.new = False
+            session[ 'email' ] = 'something'
+            session[ 'regType' ] = 'facebook'
+            GetDoc()
+        self.mox.VerifyAll()
+        self.assertIn(
+                registry.Path( 'facebook - something' ),
+                self.app.documentPool._cache
+                )
 
     def should_abort_if_not_logged_in(self):
         self.mox.StubOutWithMock(viewutils, 'IsLoggedIn')
@@ -108,14 +109,10 @@ class TestGetDoc(TestCase, mox.MoxTestBase):
                 GetDoc()
         self.mox.VerifyAll()
 
-    def should_create_document_if_needed(self):
-        self.mox.StubOutWithMock(viewutils, 'Document' )
-        viewutils.Document(
-                'facebook - something', rootPath=None
-                ).AndRaise( RepoNotFound )
-        viewutils.Document(
-                'facebook - something', create=True, rootPath=None
-                ).AndReturn( 'document')
+    def should_reuse_pooled_document(self):
+        registry = self.app.documentRegistry
+        self.mox.StubOutWithMock(registry, 'Open')
+        registry.Open( 'facebook - something' ).AndReturn( 'document' )
 
         self.mox.ReplayAll()
         with self.app.test_request_context('/'):
@@ -124,4 +121,6 @@ class TestGetDoc(TestCase, mox.MoxTestBase):
             session[ 'email' ] = 'something'
             session[ 'regType' ] = 'facebook'
             self.assertEqual( GetDoc(), 'document' )
+            self.assertEqual( GetDoc(), 'document' )
         self.mox.VerifyAll()
+        self.assertEqual( 1, self.app.documentPool.Stats()[ 'hits' ] )
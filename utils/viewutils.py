@@ -1,6 +1,14 @@
 
-from flask import abort, session, current_app
-from db import Document, RepoNotFound
+import json
+import uuid
+from flask import abort, session, current_app, request, url_for, g
+from db import ContentNotFound
+
+# The number of history entries returned per page by default
+DEFAULT_HISTORY_PAGE_SIZE = 20
+
+# The maximum number of history entries that can be requested per page
+MAX_HISTORY_PAGE_SIZE = 100
 
 
 def IsLoggedIn():
@@ -18,6 +26,13 @@ def IsLoggedIn():
 
 
 def GetDoc():
+    '''
+    Gets the document for the current user, creating it if required.
+    Documents are shared between requests via the apps document pool
+
+    Returns:
+        The document
+    '''
     if not IsLoggedIn():
         abort( 401 )
     if current_app.config[ 'BYPASS_LOGIN' ]:
@@ -30,9 +45,106 @@ def GetDoc():
         except KeyError:
             # Seems like we're not logged in after all :(
             abort( 401 )
+    registry = current_app.documentRegistry
+    path = registry.Path(docName)
+    # Remembered so writes can be reported to the repack scheduler & the
+    # render warmer
+    g.docPath = path
+    g.doc = current_app.documentPool.Get(
+            path,
+            lambda: registry.Open(docName)
+            )
+    return g.doc
+
+
+def SessionId():
+    '''
+    Gets an id for the current session, creating one if required
+
+    Returns:
+        The session id
+    '''
+    if 'id' not in session:
+        session[ 'id' ] = uuid.uuid4().hex
+    return session[ 'id' ]
+
+
+def SaveContent( content, newContent ):
+    '''
+    Saves new content for a section or stylesheet.  Rapid edits from the
+    same session within COALESCE_WINDOW seconds are coalesced into a single
+    revision
+
+    Args:
+        content     The section or stylesheet
+        newContent  The new content
+    '''
+    content.SetContent(
+            newContent,
+            session=SessionId(),
+            coalesceWindow=current_app.config[ 'COALESCE_WINDOW' ]
+            )
+
+
+def ConflictResponse(error):
+    '''
+    Error handler for RefConflicts.  These happen when someone else changed
+    the same content while a request was writing to it, so the client should
+    reload and try again
+
+    Returns:
+        A 409 response
+    '''
+    return 'Conflict', 409
+
+
+def IsPagedRequest():
+    '''
+    Checks if the current request is asking for a page of results
+
+    Returns:
+        True if the request has limit, cursor or summary arguments
+    '''
+    return any(arg in request.args for arg in ('limit', 'cursor', 'summary'))
+
+
+def HistoryPageResponse(content):
+    '''
+    Builds a response containing a page of the history of some content.
+
+    The page is selected by the limit & cursor request arguments.  If there
+    are more entries, a Link header is included with the url of the next page.
+
+    If the summary argument is passed, only a summary of each entry is
+    returned, with a preview of the content if the preview argument is passed.
+
+    Params:
+        content - The Content object to get the history of
+    Returns:
+        A response tuple, suitable for returning from a view
+    '''
+    limit = request.args.get(
+            'limit', DEFAULT_HISTORY_PAGE_SIZE, type=int
+            )
+    if limit < 1:
+        abort( 400 )
+    limit = min(limit, MAX_HISTORY_PAGE_SIZE)
+    cursor = request.args.get('cursor')
     try:
-        return Document(docName, rootPath=current_app.config['DATA_PATH'])
-    except RepoNotFound:
-        return Document(
-                docName, create=True, rootPath=current_app.config['DATA_PATH']
-                )
+        if 'summary' in request.args:
+            data, nextCursor = content.HistorySummary(
+                    limit, cursor, request.args.get('preview', type=int)
+                    )
+        else:
+            entries, nextCursor = content.HistoryPage(limit, cursor)
+            data = [{'id': oid, 'content': c} for oid, c in entries]
+    except ContentNotFound:
+        abort( 404 )
+    headers = {}
+    if nextCursor:
+        urlArgs = dict(request.args.items())
+        urlArgs.update(request.view_args)
+        urlArgs.update(limit=limit, cursor=nextCursor)
+        nextUrl = url_for(request.endpoint, **urlArgs)
+        headers['Link'] = '<{0}>; rel="next"'.format(nextUrl)
+    return json.dumps(data), 200, headers
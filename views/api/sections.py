@@ -3,7 +3,8 @@ import json
 import re
 from flask import Blueprint, abort, request
 from db import ContentNotFound
-from utils.viewutils import GetDoc
+from utils.viewutils import GetDoc, IsPagedRequest, HistoryPageResponse
+from utils.viewutils import SaveContent
 from utils.markdownutils import ValidateMarkdown
 
 app = Blueprint('section_api', __name__)
@@ -45,13 +46,16 @@ def GetSection(name):
         })
 
 
-@app.route('', methods=['POST'])
-def AddSection():
+def _ParseNewSection(data):
     '''
-    Adds a section.
+    Gets the name & content of a new section from request data,
+    validating them both
+
+    Args:
+        data    The section data from the request
+    Returns:
+        A tuple of ( name, content )
     '''
-    d = GetDoc()
-    data = request.json
     try:
         name = data[ 'newName' ]
     except KeyError:
@@ -64,12 +68,75 @@ def AddSection():
         raise InvalidSectionName(name)
     content = data['content']
     ValidateMarkdown(content)
-    s = d.AddSection(name, content)
-    return json.dumps({
+    return name, content
+
+
+@app.route('', methods=['POST'])
+def AddSection():
+    '''
+    Adds a section.
+    If a list of sections is posted, they are all added at once
+    '''
+    work = GetDoc().UnitOfWork()
+    data = request.json
+    if isinstance(data, list):
+        return _AddSections(work, data)
+    name, content = _ParseNewSection(data)
+    s = work.AddSection(name, content)
+    result = json.dumps({
         'name': s.name,
         'content': content,
         'pos': s.GetPosition()
         })
+    work.Commit()
+    return result
+
+
+def _AddSections(work, data):
+    '''
+    Adds a list of sections, with a single index update
+
+    Args:
+        work    The unit of work on the document to add to
+        data    The list of section data from the request
+    '''
+    newSections = [ _ParseNewSection(item) for item in data ]
+    try:
+        added = work.AddSections(newSections)
+    except ValueError:
+        abort( 400 )
+    result = json.dumps([ {
+        'name': s.name,
+        'content': content,
+        'pos': s.GetPosition()
+        } for s, ( name, content ) in zip( added, newSections ) ])
+    work.Commit()
+    return result
+
+
+@app.route('', methods=['DELETE'])
+def RemoveSections():
+    '''
+    Removes several sections at once.
+    Expects a list of section names in 'names'
+    '''
+    d = GetDoc()
+    d.RemoveSections( request.json[ 'names' ] )
+    return "OK"
+
+
+@app.route('', methods=['PUT'])
+def ReorderSections():
+    '''
+    Puts all the sections into a new order.
+    Expects a list of all the section names in their new order in 'order'
+    '''
+    d = GetDoc()
+    try:
+        d.ReorderSections( request.json[ 'order' ] )
+    except ValueError:
+        abort( 400 )
+    return "OK"
 
 
 @app.route('/<name>', methods=['PUT'])
@@ -80,15 +147,17 @@ def UpdateSection(name):
     Args:
         name    The name of the section to update
     '''
-    d = GetDoc()
+    # The content & position changes are read and written together
+    work = GetDoc().UnitOfWork()
     try:
-        section = d.FindSection( name )
+        section = work.FindSection( name )
         content = request.json[ 'content' ]
         if section.CurrentContent() != content:
             ValidateMarkdown(content)
-            section.SetContent(content)
+            SaveContent(section, content)
         if section.GetPosition() != request.json[ 'pos' ]:
             section.SetPosition( request.json[ 'pos' ] )
+        work.Commit()
     except ContentNotFound:
         abort(404)
     return "OK"
@@ -115,28 +184,30 @@ def SectionHistory(name):
     Args:
         name    The name of the section
 
+    Query Args:
+        limit   The maximum number of entries to return
+        cursor  The id of the last entry on the previous page
+
     Notes:
-        Currently this just returns the entire history,
-        but it might be more efficient to just return a few at a time,
-        and include a "next" link.  That way we can do some lazy loading,
-        which should save downloading potentially hundreds of entries when
-        we just need a few
+        If neither limit or cursor is passed this returns the entire
+        history.  Otherwise a page of history is returned, with a "next" Link
+        header if there are more entries.
     '''
     d = GetDoc()
     try:
         s = d.FindSection( name )
     except ContentNotFound:
         abort( 404 )
-    data = []
-    for i, d in enumerate( s.ContentHistory() ):
-        # This isn't ideal, since the id's will change after another revision
-        # is added, but it should do for an initial version
-        data.append( { 'id': i, 'content': d } )
+    if IsPagedRequest():
+        return HistoryPageResponse( s )
+    # History entries are identified by their commit oid, so ids stay
+    # the same when new revisions are added
+    data = [ { 'id': oid, 'content': c } for oid, c in s.Revisions() ]
     return json.dumps( data )
 
 
 @app.route(
-    '/<name>/history/select/<int:historyId>',
+    '/<name>/history/select/<historyId>',
     methods=['POST']
     )
 def SelectSectionHistory( name, historyId ):
@@ -145,17 +216,13 @@ def SelectSectionHistory( name, historyId ):
 
     Args:
         name        The name of the section
-        historyId   The id of the history entry to use
+        historyId   The id (commit oid) of the history entry to use
     '''
     d = GetDoc()
     try:
         s = d.FindSection( name )
+        s.RestoreRevision( historyId )
     except ContentNotFound:
         abort( 404 )
-    for i, d in enumerate( s.ContentHistory() ):
-        if i == historyId:
-            s.SetContent( d )
-            return "OK"
-    # If we get here, then there's been no history entry found
-    abort( 404 )
+    return "OK"
 
@@ -1,7 +1,8 @@
 
 import json
 from flask import Blueprint, abort, request, current_app
-from utils.viewutils import GetDoc
+from utils.viewutils import GetDoc, IsPagedRequest, HistoryPageResponse
+from utils.viewutils import SaveContent
 
 app = Blueprint('stylesheet_api', __name__)
 
@@ -19,11 +20,14 @@ def GetStylesheet():
 @app.route('/history', methods=['GET'])
 def GetStylesheetHistory():
     '''
-    Gets the history of the stylesheet
+    Gets the history of the stylesheet.
+    If limit or cursor query args are passed, returns a page of history
     '''
     d = GetDoc()
     stylesheet = d.GetStylesheet()
-    data = [{'content': c} for c in stylesheet.ContentHistory()]
+    if IsPagedRequest():
+        return HistoryPageResponse( stylesheet )
+    data = [{'id': oid, 'content': c} for oid, c in stylesheet.Revisions()]
     return json.dumps(data)
 
 
@@ -39,5 +43,5 @@ def SetStylesheetContent():
     if len(content) > current_app.config['MAX_STYLESHEET_SIZE']:
         abort( 400 )
     if stylesheet.CurrentContent() != content:
-        stylesheet.SetContent( content )
+        SaveContent( stylesheet, content )
     return "OK"
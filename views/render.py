@@ -1,7 +1,7 @@
-
-import markdown
 from flask import Blueprint, redirect, url_for, render_template
-from utils.markdownutils import CleanMarkdownOutput
+from flask import current_app, g, request, make_response
+from utils.markdownutils import RenderMarkdown
+from utils.rendercache import PageETag
 from utils.viewutils import IsLoggedIn, GetDoc
 
 app = Blueprint('render', __name__)
@@ -12,11 +12,72 @@ def Render():
     if not IsLoggedIn():
         return redirect( url_for( 'auth.Login' ) )
     d = GetDoc()
-    Convert = lambda x: CleanMarkdownOutput(markdown.markdown(x))
-    sections = [(s.name, s.CurrentContent()) for i, s in d.CurrentSections()]
+    docPath = getattr(g, 'docPath', None)
+    etag = PageETag(docPath, d.Fingerprint())
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(_CachedPage(d, docPath, etag))
+    response.set_etag(etag)
+    # Browsers should always check the page is still current
+    response.cache_control.no_cache = True
+    return response
+
+
+def WarmPage(app, d, docPath):
+    '''
+    Renders the page for a document into the render caches, if it's not
+    already there.  Run by the render warmer after a document is changed,
+    outside of any request
+
+    Args:
+        app         The app
+        d           The document
+        docPath     The path of the document
+    '''
+    with app.app_context():
+        _CachedPage(d, docPath, PageETag(docPath, d.Fingerprint()))
+
+
+def _CachedPage(d, docPath, etag):
+    '''
+    Gets the page for a document from the page cache, rendering it if
+    needed
+    '''
+    pageCache = current_app.pageCache
+    page = pageCache.Get(etag)
+    if page is None:
+        page = _RenderPage(d, docPath)
+        pageCache.Put(etag, page)
+    return page
+
+
+def _RenderPage(d, docPath):
+    '''
+    Renders the whole page for a document
+    '''
+    # Only sections that have changed since they were last rendered need
+    # converting, the rest come from the render cache
+    cache = current_app.renderCache
+    sections = [(s.name, s.CurrentBlobId(), s) for i, s in d.CurrentSections()]
+    html = {}
+    missing = []
+    for name, blobId, s in sections:
+        if blobId not in html:
+            html[blobId] = cache.Get(blobId, docPath)
+            if html[blobId] is None:
+                missing.append((blobId, s))
+    # The changed sections are converted together, so big documents can be
+    # converted in parallel
+    converted = current_app.markdownRenderer.Render(
+            RenderMarkdown, [s.CurrentContent() for blobId, s in missing]
+            )
+    for (blobId, s), content in zip(missing, converted):
+        cache.Put(blobId, content, docPath)
+        html[blobId] = content
     output = [
-            dict(name=name, content=Convert(content))
-            for name, content in sections
+            dict(name=name, content=html[blobId])
+            for name, blobId, s in sections
             ]
 
     return render_template(
@@ -1,3 +1,5 @@
+import mox
+from flask import g
 from .base import BaseTest
 import flask.ext.should_dsl
 from should_dsl import should
@@ -6,22 +8,22 @@ from views import render
 
 # Let's keep pyflakes happy
 flask.ext.should_dsl
-contain = have_content = be_200 = None
+contain = have_content = be_200 = equal_to = None
 
 
 class TestRenderView(BaseTest):
 
     def setUp(self):
         super( TestRenderView, self ).setUp()
-        self.mox.StubOutWithMock(render, 'CleanMarkdownOutput')
+        self.mox.StubOutWithMock(render, 'RenderMarkdown')
         self.mox.StubOutWithMock(render, 'GetDoc' )
         self.mox.StubOutWithMock(render, 'IsLoggedIn')
-        self.mox.StubOutWithMock(render.markdown, 'markdown')
 
     def should_render(self):
         render.IsLoggedIn().AndReturn( True )
         doc = self.mox.CreateMock(Document)
         render.GetDoc().AndReturn(doc)
+        doc.Fingerprint().AndReturn('fingerprint')
 
         sections = [
                 (i, self.mox.CreateMock(Section)) for i in range(100)
@@ -33,18 +35,13 @@ class TestRenderView(BaseTest):
         for i, s in sections:
             s.name = '%i' % i
             contentStr = 'content' + str(i)
+            s.CurrentBlobId().AndReturn('blob' + str(i))
             s.CurrentContent().AndReturn(contentStr)
 
         for i, s in sections:
             contentStr = 'content' + str(i)
-            markdownStr = 'markdown' + str(i)
             cleanStr = 'clean' + str(i)
-            render.markdown.markdown(
-                    contentStr
-                    ).AndReturn( markdownStr )
-            render.CleanMarkdownOutput(
-                    markdownStr
-                    ).AndReturn(cleanStr)
+            render.RenderMarkdown(contentStr).AndReturn(cleanStr)
             expected.append(dict(name='%i' % i, content=cleanStr))
 
         mockStylesheet = self.mox.CreateMock( Stylesheet )
@@ -63,6 +60,111 @@ class TestRenderView(BaseTest):
             response.data |should| contain(text['content'])
         response.data |should| contain('h3 {}')
 
+    def should_render_unchanged_sections_from_cache(self):
+        self.app.renderCache.Put('cachedBlob', 'cached')
+        render.IsLoggedIn().AndReturn( True )
+        doc = self.mox.CreateMock(Document)
+        render.GetDoc().AndReturn(doc)
+        doc.Fingerprint().AndReturn('fingerprint')
+        cached, changed = [
+                self.mox.CreateMock(Section) for i in range(2)
+                ]
+        doc.CurrentSections().AndReturn([(0, cached), (1, changed)])
+        cached.name = 'cached'
+        cached.CurrentBlobId().AndReturn('cachedBlob')
+        changed.name = 'changed'
+        changed.CurrentBlobId().AndReturn('changedBlob')
+        changed.CurrentContent().AndReturn('content')
+        render.RenderMarkdown('content').AndReturn('clean')
+        mockStylesheet = self.mox.CreateMock( Stylesheet )
+        doc.GetStylesheet().AndReturn( mockStylesheet )
+        mockStylesheet.CurrentContent().AndReturn('h3 {}')
+
+        self.mox.ReplayAll()
+        response = self.client.get( '/render' )
+        response |should| be_200
+        self.assertContext( 'sections', [
+            dict(name='cached', content='cached'),
+            dict(name='changed', content='clean'),
+            ] )
+        self.app.renderCache.Get('changedBlob') |should| equal_to('clean')
+
+    def _ExpectFingerprint(self):
+        render.IsLoggedIn().AndReturn( True )
+        doc = self.mox.CreateMock(Document)
+        render.GetDoc().AndReturn(doc)
+        doc.Fingerprint().AndReturn('fingerprint')
+        return doc
+
+    def should_send_etag(self):
+        etag = render.PageETag(None, 'fingerprint')
+        self.app.pageCache.Put(etag, 'page')
+        self._ExpectFingerprint()
+
+        self.mox.ReplayAll()
+        response = self.client.get( '/render' )
+        response |should| be_200
+        response.data |should| equal_to('page')
+        response.headers['ETag'] |should| equal_to('"{0}"'.format(etag))
+        response.headers['Cache-Control'] |should| equal_to('no-cache')
+
+    def should_return_304_if_unchanged(self):
+        etag = render.PageETag(None, 'fingerprint')
+        self._ExpectFingerprint()
+
+        self.mox.ReplayAll()
+        response = self.client.get(
+                '/render',
+                headers={'If-None-Match': '"{0}"'.format(etag)}
+                )
+        self.assertStatus( response, 304 )
+        response.data |should| equal_to('')
+        response.headers['ETag'] |should| equal_to('"{0}"'.format(etag))
+
+    def should_render_if_changed(self):
+        doc = self._ExpectFingerprint()
+        doc.CurrentSections().AndReturn([])
+        mockStylesheet = self.mox.CreateMock( Stylesheet )
+        doc.GetStylesheet().AndReturn( mockStylesheet )
+        mockStylesheet.CurrentContent().AndReturn('h3 {}')
+
+        self.mox.ReplayAll()
+        response = self.client.get(
+                '/render', headers={'If-None-Match': '"stale"'}
+                )
+        response |should| be_200
+        self.app.pageCache.Get(
+                render.PageETag(None, 'fingerprint')
+                ) |should| equal_to(response.data.decode('utf-8'))
+
+    def should_warm_page_cache(self):
+        doc = self.mox.CreateMock(Document)
+        doc.Fingerprint().AndReturn('fingerprint')
+        doc.CurrentSections().AndReturn([])
+        mockStylesheet = self.mox.CreateMock( Stylesheet )
+        doc.GetStylesheet().AndReturn( mockStylesheet )
+        mockStylesheet.CurrentContent().AndReturn('h3 {}')
+
+        self.mox.ReplayAll()
+        render.WarmPage(self.app, doc, 'path')
+        self.mox.VerifyAll()
+        page = self.app.pageCache.Get(render.PageETag('path', 'fingerprint'))
+        page |should| contain('h3 {}')
+
+    def should_schedule_warm_after_writes(self):
+        self.mox.StubOutWithMock(self.app.renderWarmer, 'Schedule')
+        self.app.renderWarmer.Schedule('path', mox.Func(callable))
+
+        self.mox.ReplayAll()
+        for method, status in (('PUT', 200), ('GET', 200), ('PUT', 409)):
+            with self.app.test_request_context('/', method=method):
+                g.doc = 'doc'
+                g.docPath = 'path'
+                self.app.WarmChangedDocument(
+                        self.app.response_class(status=status)
+                        )
+        self.mox.VerifyAll()
+
     def should_redirect_to_login_if_not_logged_in(self):
         render.IsLoggedIn().AndReturn( False )
 
@@ -1,9 +1,13 @@
 
 import json
+import mox
 import flask.ext.should_dsl
 from should_dsl import should
 from db import Section, Document
-from db.errors import ContentNotFound
+from db.unitofwork import UnitOfWork
+from db.backends import MemoryBackend
+from db.treestore import TreeDocument
+from db.errors import ContentNotFound, RefConflict
 from views.api import sections
 from views.api.sections import InvalidSectionName
 from utils import MarkdownValidationError
@@ -92,17 +96,18 @@ class TestAddSection(SectionApiTestBase):
 
     def setUp(self):
         super( TestAddSection, self ).setUp()
-        # Pop the request context created by flask-testing
-        # since it just messes with the exception throw->catch stuff
+        self.work = self.mox.CreateMock( UnitOfWork )
+        self.doc.UnitOfWork().AndReturn( self.work )
 
     def should_add_a_section(self):
         inputStruct = { 'newName': 'alfred', 'content': 'woot' }
 
         s = self.mox.CreateMock( Section )
         sections.ValidateMarkdown( 'woot' )
-        self.doc.AddSection( 'alfred', 'woot' ).AndReturn( s )
+        self.work.AddSection( 'alfred', 'woot' ).AndReturn( s )
         s.name = 'jones'
         s.GetPosition().AndReturn( 100 )
+        self.work.Commit()
 
         self.mox.ReplayAll()
 
@@ -117,6 +122,64 @@ class TestAddSection(SectionApiTestBase):
         response |should| be_200
         response |should| have_json(expected)
 
+    def should_add_a_list_of_sections(self):
+        inputStruct = [
+                { 'newName': 'alfred', 'content': 'woot' },
+                { 'newName': 'jones', 'content': 'toot' },
+                ]
+
+        sections.ValidateMarkdown( 'woot' )
+        sections.ValidateMarkdown( 'toot' )
+        added = []
+        for name in ( 'alfred', 'jones' ):
+            s = self.mox.CreateMock( Section )
+            s.name = name
+            added.append( s )
+        self.work.AddSections(
+                [ ( 'alfred', 'woot' ), ( 'jones', 'toot' ) ]
+                ).AndReturn( added )
+        added[ 0 ].GetPosition().AndReturn( 5 )
+        added[ 1 ].GetPosition().AndReturn( 6 )
+        self.work.Commit()
+
+        self.mox.ReplayAll()
+
+        expected = [
+                { 'name': 'alfred', 'content': 'woot', 'pos': 5 },
+                { 'name': 'jones', 'content': 'toot', 'pos': 6 },
+                ]
+
+        response = self.client.post(
+                '/api/sections',
+                data=json.dumps(inputStruct),
+                content_type='application/json',
+                )
+        self.mox.VerifyAll()
+        response |should| be_200
+        self.assertEqual( expected, response.json )
+
+    def should_400_on_duplicate_names_in_list(self):
+        inputStruct = [
+                { 'newName': 'alfred', 'content': 'woot' },
+                { 'newName': 'alfred', 'content': 'toot' },
+                ]
+
+        sections.ValidateMarkdown( 'woot' )
+        sections.ValidateMarkdown( 'toot' )
+        self.work.AddSections(
+                [ ( 'alfred', 'woot' ), ( 'alfred', 'toot' ) ]
+                ).AndRaise( ValueError )
+
+        self.mox.ReplayAll()
+
+        response = self.client.post(
+                '/api/sections',
+                data=json.dumps(inputStruct),
+                content_type='application/json',
+                )
+        self.mox.VerifyAll()
+        self.assert400( response )
+
     def doAddSectionFailTest(
             self, exception, markdownFail=False, **inputStruct
             ):
@@ -166,17 +229,22 @@ class TestAddSection(SectionApiTestBase):
 class TestUpdateSection(SectionApiTestBase):
     def setUp(self):
         super(TestUpdateSection, self).setUp()
+        self.work = self.mox.CreateMock( UnitOfWork )
+        self.doc.UnitOfWork().AndReturn( self.work )
 
     def should_update_section(self):
         inputStruct = { 'pos': 500, 'content': 'woot' }
 
         s = self.mox.CreateMock( Section )
-        self.doc.FindSection( 'alfred' ).AndReturn( s )
+        self.work.FindSection( 'alfred' ).AndReturn( s )
         s.CurrentContent().AndReturn( 'notthesame' )
         sections.ValidateMarkdown('woot' )
-        s.SetContent( 'woot' )
+        s.SetContent(
+                'woot', session=mox.IsA( str ), coalesceWindow=30
+                )
         s.GetPosition().AndReturn( 100 )
         s.SetPosition( 500 )
+        self.work.Commit()
 
         self.mox.ReplayAll()
         rv = self.client.put(
@@ -188,10 +256,32 @@ class TestUpdateSection(SectionApiTestBase):
         self.assert200( rv )
         # TODO: Might want to verify the content returned as well
 
+    def should_409_on_conflict(self):
+        inputStruct = { 'pos': 500, 'content': 'woot' }
+
+        s = self.mox.CreateMock( Section )
+        self.work.FindSection( 'alfred' ).AndReturn( s )
+        s.CurrentContent().AndReturn( 'notthesame' )
+        sections.ValidateMarkdown('woot' )
+        s.SetContent(
+                'woot', session=mox.IsA( str ), coalesceWindow=30
+                )
+        s.GetPosition().AndReturn( 500 )
+        self.work.Commit().AndRaise( RefConflict() )
+
+        self.mox.ReplayAll()
+        rv = self.client.put(
+                '/api/sections/alfred',
+                data=json.dumps(inputStruct),
+                content_type='application/json',
+                )
+        self.mox.VerifyAll()
+        self.assertStatus( rv, 409 )
+
     def should_404_on_missing(self):
         inputStruct = { 'pos': 500, 'content': 'woot' }
 
-        self.doc.FindSection( 'jenga' ).AndRaise( ContentNotFound )
+        self.work.FindSection( 'jenga' ).AndRaise( ContentNotFound )
 
         self.mox.ReplayAll()
         rv = self.client.put(
@@ -206,10 +296,11 @@ class TestUpdateSection(SectionApiTestBase):
         inputStruct = { 'pos': 500, 'content': 'woot' }
 
         s = self.mox.CreateMock( Section )
-        self.doc.FindSection( 'alfred' ).AndReturn( s )
+        self.work.FindSection( 'alfred' ).AndReturn( s )
         s.CurrentContent().AndReturn( 'woot' )
         s.GetPosition().AndReturn( 100 )
         s.SetPosition( 500 )
+        self.work.Commit()
 
         self.mox.ReplayAll()
         rv = self.client.put(
@@ -224,11 +315,14 @@ class TestUpdateSection(SectionApiTestBase):
         inputStruct = { 'pos': 500, 'content': 'woot' }
 
         s = self.mox.CreateMock( Section )
-        self.doc.FindSection( 'alfred' ).AndReturn( s )
+        self.work.FindSection( 'alfred' ).AndReturn( s )
         s.CurrentContent().AndReturn( 'notthesame' )
         sections.ValidateMarkdown( 'woot' )
-        s.SetContent( 'woot' )
+        s.SetContent(
+                'woot', session=mox.IsA( str ), coalesceWindow=30
+                )
         s.GetPosition().AndReturn( 500 )
+        self.work.Commit()
 
         self.mox.ReplayAll()
         rv = self.client.put(
@@ -243,7 +337,7 @@ class TestUpdateSection(SectionApiTestBase):
         inputStruct = { 'pos': 500, 'content': 'woot' }
 
         s = self.mox.CreateMock( Section )
-        self.doc.FindSection( 'alfred' ).AndReturn( s )
+        self.work.FindSection( 'alfred' ).AndReturn( s )
         s.CurrentContent().AndReturn( 'notthesame' )
         sections.ValidateMarkdown(
                 'woot'
@@ -260,6 +354,44 @@ class TestUpdateSection(SectionApiTestBase):
         self.mox.VerifyAll()
 
 
+class TestReorderSections(SectionApiTestBase):
+    def should_reorder_sections(self):
+        self.doc.ReorderSections( [ 'b', 'a', 'c' ] )
+
+        self.mox.ReplayAll()
+        rv = self.client.put(
+                '/api/sections',
+                data=json.dumps({ 'order': [ 'b', 'a', 'c' ] }),
+                content_type='application/json',
+                )
+        self.mox.VerifyAll()
+        self.assert200( rv )
+
+    def should_400_on_invalid_order(self):
+        self.doc.ReorderSections( [ 'b', 'b' ] ).AndRaise( ValueError )
+
+        self.mox.ReplayAll()
+        rv = self.client.put(
+                '/api/sections',
+                data=json.dumps({ 'order': [ 'b', 'b' ] }),
+                content_type='application/json',
+                )
+        self.mox.VerifyAll()
+        self.assert400( rv )
+
+    def should_409_if_index_cant_be_saved(self):
+        self.doc.ReorderSections( [ 'b', 'a' ] ).AndRaise( RefConflict )
+
+        self.mox.ReplayAll()
+        rv = self.client.put(
+                '/api/sections',
+                data=json.dumps({ 'order': [ 'b', 'a' ] }),
+                content_type='application/json',
+                )
+        self.mox.VerifyAll()
+        self.assertStatus( rv, 409 )
+
+
 class TestRemoveSection(SectionApiTestBase):
     def should_remove_section(self):
         self.doc.RemoveSection( 'jenkins' )
@@ -270,6 +402,20 @@ class TestRemoveSection(SectionApiTestBase):
         self.assert200( rv )
 
 
+class TestRemoveSections(SectionApiTestBase):
+    def should_remove_sections(self):
+        self.doc.RemoveSections( [ 'jenkins', 'jones' ] )
+        self.mox.ReplayAll()
+
+        rv = self.client.delete(
+                '/api/sections',
+                data=json.dumps({ 'names': [ 'jenkins', 'jones' ] }),
+                content_type='application/json',
+                )
+        self.mox.VerifyAll()
+        self.assert200( rv )
+
+
 class TestSectionHistoryList(SectionApiTestBase):
     def should_list_history(self):
         s = self.mox.CreateMock( Section )
@@ -279,10 +425,11 @@ class TestSectionHistoryList(SectionApiTestBase):
         history = []
         expected = []
         for i in range( 100 ):
+            oid = 'oid' + str(i)
             content = 'history' + str(i)
-            history.append( content )
-            expected.append({ 'id': i, 'content': content })
-        s.ContentHistory().AndReturn( history )
+            history.append( ( oid, content ) )
+            expected.append({ 'id': oid, 'content': content })
+        s.Revisions().AndReturn( history )
 
         self.mox.ReplayAll()
         rv = self.client.get( '/api/sections/charlie/history' )
@@ -298,23 +445,89 @@ class TestSectionHistoryList(SectionApiTestBase):
         self.mox.VerifyAll()
         self.assert404( rv )
 
+    def should_return_a_page_of_history(self):
+        s = self.mox.CreateMock( Section )
+        self.doc.FindSection( 'charlie' ).AndReturn( s )
+        s.HistoryPage( 2, None ).AndReturn(
+                ( [ ( 'oid1', 'one' ), ( 'oid2', 'two' ) ], 'oid2' )
+                )
+
+        self.mox.ReplayAll()
+        rv = self.client.get( '/api/sections/charlie/history?limit=2' )
+        self.mox.VerifyAll()
+        self.assert200( rv )
+        self.assertEqual(
+                [
+                    { 'id': 'oid1', 'content': 'one' },
+                    { 'id': 'oid2', 'content': 'two' }
+                    ],
+                rv.json
+                )
+        self.assertEqual(
+                '</api/sections/charlie/history'
+                '?cursor=oid2&limit=2>; rel="next"',
+                rv.headers[ 'Link' ]
+                )
+
+    def should_pass_cursor_and_omit_link_on_last_page(self):
+        s = self.mox.CreateMock( Section )
+        self.doc.FindSection( 'charlie' ).AndReturn( s )
+        s.HistoryPage( 20, 'oid2' ).AndReturn(
+                ( [ ( 'oid3', 'three' ) ], None )
+                )
+
+        self.mox.ReplayAll()
+        rv = self.client.get( '/api/sections/charlie/history?cursor=oid2' )
+        self.mox.VerifyAll()
+        self.assert200( rv )
+        self.assertEqual( [ { 'id': 'oid3', 'content': 'three' } ], rv.json )
+        self.assertFalse( 'Link' in rv.headers )
+
+    def should_return_history_summaries(self):
+        s = self.mox.CreateMock( Section )
+        self.doc.FindSection( 'charlie' ).AndReturn( s )
+        summaries = [ { 'id': 'oid1', 'time': 10, 'size': 5 } ]
+        s.HistorySummary( 1, None, 30 ).AndReturn( ( summaries, 'oid1' ) )
+
+        self.mox.ReplayAll()
+        rv = self.client.get(
+                '/api/sections/charlie/history?summary=1&preview=30&limit=1'
+                )
+        self.mox.VerifyAll()
+        self.assert200( rv )
+        self.assertEqual( summaries, rv.json )
+        link = rv.headers[ 'Link' ]
+        for arg in ( 'summary=1', 'preview=30', 'limit=1', 'cursor=oid1' ):
+            self.assertIn( arg, link )
+
+    def should_404_on_invalid_cursor(self):
+        s = self.mox.CreateMock( Section )
+        self.doc.FindSection( 'charlie' ).AndReturn( s )
+        s.HistoryPage( 20, 'bad' ).AndRaise( ContentNotFound )
+
+        self.mox.ReplayAll()
+        rv = self.client.get( '/api/sections/charlie/history?cursor=bad' )
+        self.mox.VerifyAll()
+        self.assert404( rv )
+
+    def should_400_on_invalid_limit(self):
+        s = self.mox.CreateMock( Section )
+        self.doc.FindSection( 'charlie' ).AndReturn( s )
+
+        self.mox.ReplayAll()
+        rv = self.client.get( '/api/sections/charlie/history?limit=0' )
+        self.mox.VerifyAll()
+        self.assert400( rv )
+
 
 class TestSelectSectionHistory(SectionApiTestBase):
     def should_select_section_history(self):
         s = self.mox.CreateMock( Section )
         self.doc.FindSection( 'zordon' ).AndReturn( s )
-
-        # Build a list of fake history
-        history = []
-        for i in range( 100 ):
-            content = 'history' + str(i)
-            history.append( content )
-
-        s.ContentHistory().AndReturn( history )
-        s.SetContent( 'history35' )
+        s.RestoreRevision( 'abcdef' )
 
         self.mox.ReplayAll()
-        rv = self.client.post( '/api/sections/zordon/history/select/35' )
+        rv = self.client.post( '/api/sections/zordon/history/select/abcdef' )
         self.mox.VerifyAll()
         self.assert200( rv )
 
@@ -322,23 +535,42 @@ class TestSelectSectionHistory(SectionApiTestBase):
         self.doc.FindSection( 'zordon' ).AndRaise( ContentNotFound )
 
         self.mox.ReplayAll()
-        rv = self.client.post( '/api/sections/zordon/history/select/35' )
+        rv = self.client.post( '/api/sections/zordon/history/select/abcdef' )
         self.mox.VerifyAll()
         self.assert404( rv )
 
     def should_404_on_missing_history(self):
         s = self.mox.CreateMock( Section )
         self.doc.FindSection( 'zordon' ).AndReturn( s )
+        s.RestoreRevision( 'abcdef' ).AndRaise( ContentNotFound )
 
-        # Build a list of fake history
-        history = []
-        for i in range( 100 ):
-            content = 'history' + str(i)
-            history.append( content )
+        self.mox.ReplayAll()
+        rv = self.client.post( '/api/sections/zordon/history/select/abcdef' )
+        self.mox.VerifyAll()
+        self.assert404( rv )
 
-        s.ContentHistory().AndReturn( history )
+
+class TestSelectTreeSectionHistory(BaseTest):
+    def setUp(self):
+        super( TestSelectTreeSectionHistory, self ).setUp()
+        self.mox.StubOutWithMock(sections, 'GetDoc' )
+        self.doc = TreeDocument(
+                'name', create=True, rootPath='memory',
+                backend=MemoryBackend()
+                )
+        self.doc.AddSections( [ ( 'a', 'A0' ), ( 'b', 'B0' ) ] )
+        self.doc.FindSection( 'a' ).SetContent( 'A1' )
+        sections.GetDoc().AndReturn(self.doc)
+
+    def should_404_on_another_sections_revision(self):
+        revision, content = next( self.doc.FindSection( 'a' ).Revisions() )
 
         self.mox.ReplayAll()
-        rv = self.client.post( '/api/sections/zordon/history/select/101' )
+        rv = self.client.post(
+                '/api/sections/b/history/select/' + revision
+                )
         self.mox.VerifyAll()
         self.assert404( rv )
+        self.assertEqual(
+                [ 'B0' ], list( self.doc.FindSection( 'b' ).ContentHistory() )
+                )
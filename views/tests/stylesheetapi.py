@@ -1,5 +1,6 @@
 
 import json
+import mox
 import flask.ext.should_dsl
 from should_dsl import should
 from .base import BaseTest
@@ -43,13 +44,37 @@ class TestGetStylesheetHistory(BaseStylesheetTest):
         style = self.mox.CreateMock( Stylesheet )
         self.doc.GetStylesheet().AndReturn( style )
 
-        contentHistory = [ 'one', 'two', 'three' ]
-        style.ContentHistory().AndReturn( contentHistory )
+        contentHistory = [ ( 'oid1', 'one' ), ( 'oid2', 'two' ) ]
+        style.Revisions().AndReturn( contentHistory )
 
         self.mox.ReplayAll()
         response = self.client.get( '/api/stylesheet/history' )
         response |should| be_200
-        response |should| have_json([{ 'content': c } for c in contentHistory])
+        response |should| have_json(
+                [{ 'id': oid, 'content': c } for oid, c in contentHistory]
+                )
+        self.mox.VerifyAll()
+
+
+    def should_get_a_page_of_stylesheet_history(self):
+        style = self.mox.CreateMock( Stylesheet )
+        self.doc.GetStylesheet().AndReturn( style )
+
+        style.HistoryPage( 1, 'oid1' ).AndReturn(
+                ( [ ( 'oid2', 'two' ) ], 'oid2' )
+                )
+
+        self.mox.ReplayAll()
+        response = self.client.get(
+                '/api/stylesheet/history?limit=1&cursor=oid1'
+                )
+        response |should| be_200
+        response |should| have_json([{ 'id': 'oid2', 'content': 'two' }])
+        self.assertEqual(
+                '</api/stylesheet/history'
+                '?cursor=oid2&limit=1>; rel="next"',
+                response.headers[ 'Link' ]
+                )
         self.mox.VerifyAll()
 
 
@@ -59,7 +84,9 @@ class TestSetStylesheetContent(BaseStylesheetTest):
         self.doc.GetStylesheet().AndReturn( style )
 
         style.CurrentContent().AndReturn( '' )
-        style.SetContent( 'xyzz' )
+        style.SetContent(
+                'xyzz', session=mox.IsA( str ), coalesceWindow=30
+                )
 
         inputStruct = { 'content': 'xyzz' }
 